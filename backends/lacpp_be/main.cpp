@@ -14,6 +14,10 @@ int main(int argc, char *const argv[]) {
     if (options.process(argc, argv) == nullptr) {
         return EXIT_FAILURE;
     }
+    // batch mode: programs come from the batch list, not the command line
+    if (!options.getBatchFile().empty()) {
+        return runBatch(options);
+    }
     options.setInputFile();
 
     // parse with frontend
@@ -22,13 +26,13 @@ int main(int argc, char *const argv[]) {
         if (::P4::errorCount() > 0) {
             ::P4::error("Failed to parse P4 file.");
         }
-        return {};
+        return EXIT_FAILURE;
     }
     const auto &[program, _] = *parseResult;
 
 
     dumpAfterFrontend(options, program);
     // TODO: add options for either get feature or annotate
-    getFeatures(options, program);
+    return getFeatures(options, program);
 
 }
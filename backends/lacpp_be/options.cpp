@@ -1,5 +1,7 @@
 #include "options.h"
 
+#include <cstdlib>
+
 namespace P4::P4LACPP {
 
 P4LACPPOptions::P4LACPPOptions() {
@@ -17,9 +19,33 @@ P4LACPPOptions::P4LACPPOptions() {
             return true;
         },
         "Get the source code after midend and write it to the specified file then end the program");
+    registerOption(
+        "--batch", "file",
+        [this](const char *arg) {
+            batchFile = arg;
+            return true;
+        },
+        "Extract the features of every P4 program listed in file (one path per line, - for stdin)\n"
+        "and write one JSON line per program to the feature file (stdout by default)");
+    registerOption(
+        "--feature-fd", "fd",
+        [this](const char *arg) {
+            char *end = nullptr;
+            long fd = strtol(arg, &end, 10);
+            if (end == arg || *end != '\0' || fd < 0) {
+                ::P4::error(ErrorType::ERR_INVALID, "%1%: invalid file descriptor", arg);
+                return false;
+            }
+            featureFd = static_cast<int>(fd);
+            return true;
+        },
+        "Write the features as compact JSON (one line) to the inherited file descriptor fd,\n"
+        "e.g. the write end of a pipe, instead of the feature file");
 }
 
 const std::filesystem::path &P4LACPPOptions::getFeatureOutFile() const { return featureOutFile; }
 const std::filesystem::path &P4LACPPOptions::getDumpOptimizedFile() const { return dumpOptimizedFile; }
+const std::filesystem::path &P4LACPPOptions::getBatchFile() const { return batchFile; }
+int P4LACPPOptions::getFeatureFd() const { return featureFd; }
 
 }  // namespace P4::P4Fmt
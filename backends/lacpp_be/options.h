@@ -17,10 +17,15 @@ class P4LACPPOptions : public CompilerOptions {
 
     const std::filesystem::path &getFeatureOutFile() const;
     const std::filesystem::path &getDumpOptimizedFile() const;
+    const std::filesystem::path &getBatchFile() const;
+    int getFeatureFd() const;
 
  private:
     std::filesystem::path featureOutFile;
     std::filesystem::path dumpOptimizedFile;
+    std::filesystem::path batchFile;
+    /// inherited file descriptor to write the features to, -1 if none
+    int featureFd = -1;
 };
 
 using P4LACPPContext = P4CContextWithOptions<P4LACPPOptions>;
@@ -267,9 +267,9 @@ void to_json(json& j, const GressInfo& g) {
     };
 }
 
-std::string FE::toJSON(){
+std::string FE::toJSON(int indent){
     json j = json::object();
     for(auto& [k,v]: gresses) j[to_string(k)] = v;
-    return j.dump(2);
+    return j.dump(indent);
 }
 }
\ No newline at end of file
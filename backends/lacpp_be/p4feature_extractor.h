@@ -154,7 +154,8 @@ public:
 
 // bool preorder(const IR::Operation *op) override;
  // Assuming cstring is std::string-compatible (if not, adapt accordingly)
-std::string toJSON();
+// indent -1 gives a single line (batch mode)
+std::string toJSON(int indent = 2);
 
 private:
     std::unordered_map<GressTypes, GressInfo> gresses; 
@@ -9,6 +9,12 @@
 
 #include "backends/lacpp_be/p4lacpp.h"
 #include "backends/lacpp_be/p4feature_extractor.h"
+#include "thrid_party/json.hpp"
+
+#include <unistd.h>
+
+#include <cerrno>
+#include <fstream>
 
 
 namespace P4::P4LACPP{
@@ -59,15 +65,40 @@ std::optional<std::pair<const IR::P4Program *, const Util::InputSources *>> pars
 }
 
 
+// --feature-fd: writes all of data to fd, retrying short and interrupted writes
+static bool writeFd(int fd, const std::string &data) {
+    const char *buf = data.data();
+    size_t left = data.size();
+    while (left > 0) {
+        ssize_t written = ::write(fd, buf, left);
+        if (written < 0) {
+            if (errno == EINTR) continue;
+            return false;
+        }
+        buf += written;
+        left -= written;
+    }
+    return true;
+}
+
 int getFeatures(P4LACPPOptions& options, const IR::P4Program *program){
     auto extractor = P4FeatureExtractor();
     program->apply(extractor);
 
-    std::string featuresInJson = extractor.toJSON();
+    // a single compact line for a reader on a pipe
+    std::string featuresInJson = extractor.toJSON(options.getFeatureFd() >= 0 ? -1 : 2);
     if (featuresInJson.empty()) {
         return EXIT_FAILURE;
     };
 
+    if (options.getFeatureFd() >= 0) {
+        if (!writeFd(options.getFeatureFd(), featuresInJson + "\n")) {
+            ::P4::error(ErrorType::ERR_IO, "Failed to write to file descriptor %1%.", options.getFeatureFd());
+            return EXIT_FAILURE;
+        }
+        return EXIT_SUCCESS;
+    }
+
     std::ostream *out = nullptr;
     // Write to stdout in absence of an output file.
     if (options.getFeatureOutFile().empty()) {
@@ -92,6 +123,70 @@ int getFeatures(P4LACPPOptions& options, const IR::P4Program *program){
     return EXIT_SUCCESS;
 }
 
+// One batch line: {"file": ..., "features": {...}} or {"file": ..., "error": ...}
+static std::string batchFeatures(const std::string &file) {
+    // fresh context per program: the error count of a broken program must not leak
+    // into the next one
+    AutoCompileContext programContext(new P4LACPPContext(P4LACPPContext::get()));
+    auto &programOptions = P4LACPPContext::get().options();
+    programOptions.file = file;
+    std::string fileJson = nlohmann::json(file).dump();
+    try {
+        auto parseResult = parseProgram(programOptions);
+        if (!parseResult) {
+            return "{\"file\": " + fileJson + ", \"error\": \"parse failed\"}";
+        }
+        auto extractor = P4FeatureExtractor();
+        parseResult->first->apply(extractor);
+        return "{\"file\": " + fileJson + ", \"features\": " + extractor.toJSON(-1) + "}";
+    } catch (const std::exception &e) {
+        return "{\"file\": " + fileJson + ", \"error\": " + nlohmann::json(e.what()).dump() + "}";
+    }
+}
+
+int runBatch(P4LACPPOptions& options){
+    std::ifstream listFile;
+    std::istream *in = &std::cin;
+    if (options.getBatchFile() != "-") {
+        listFile.open(options.getBatchFile());
+        if (!listFile) {
+            ::P4::error(ErrorType::ERR_NOT_FOUND, "%1%: No such file or directory.",
+                        options.getBatchFile().string());
+            return EXIT_FAILURE;
+        }
+        in = &listFile;
+    }
+
+    std::ostream *out = &std::cout;
+    if (!options.getFeatureOutFile().empty()) {
+        out = openFile(options.getFeatureOutFile(), false);
+        if ((out == nullptr) || !(*out)) {
+            ::P4::error(ErrorType::ERR_NOT_FOUND, "%1%: No such file or directory.",
+                        options.getFeatureOutFile().string());
+            return EXIT_FAILURE;
+        }
+    }
+
+    // a reader on a pipe gets every program's line as soon as it is extracted
+    std::string file;
+    while (std::getline(*in, file)) {
+        if (file.empty()) continue;
+        if (options.getFeatureFd() >= 0) {
+            if (!writeFd(options.getFeatureFd(), batchFeatures(file) + "\n")) {
+                ::P4::error(ErrorType::ERR_IO, "Failed to write to file descriptor %1%.", options.getFeatureFd());
+                return EXIT_FAILURE;
+            }
+            continue;
+        }
+        (*out) << batchFeatures(file) << std::endl;
+        if (!(*out)) {
+            ::P4::error(ErrorType::ERR_IO, "Failed to write to output file.");
+            return EXIT_FAILURE;
+        }
+    }
+    return EXIT_SUCCESS;
+}
+
 int dumpAfterFrontend(P4LACPPOptions& options, const IR::P4Program *program){
     if (!options.getDumpOptimizedFile().empty()) {
         DumpOptimized dumpOptimized(options);
@@ -11,6 +11,8 @@ std::optional<std::pair<const IR::P4Program *, const Util::InputSources *>> pars
     
 int getFeatures(P4LACPPOptions& options, const IR::P4Program *program);
 int dumpAfterFrontend(P4LACPPOptions& options, const IR::P4Program *program);
+/// --batch: features of every listed program, one JSON line each
+int runBatch(P4LACPPOptions& options);
 } // namespace P4::P4LACPP
 
 
@@ -0,0 +1,128 @@
+import math
+import os
+import resource
+
+# footprint assumed for a program before any compilation of its size was observed
+DEFAULT_FOOTPRINT = 2 << 30
+# share of MemAvailable (at start) that compilations may reserve when no budget is given
+DEFAULT_BUDGET_SHARE = 0.9
+
+
+def parse_cpu_list(spec):
+    """Parses a CPU list like '0-7,16,18' into a list of CPU ids."""
+    cpus = []
+    for part in spec.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part.strip() != "":
+            cpus.append(int(part))
+    return cpus
+
+
+def mem_available():
+    """Returns MemAvailable from /proc/meminfo in bytes, or None if it cannot be read."""
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def apply_limits(memory=None, cpu=None):
+    """
+    Sets RLIMIT_AS (bytes) and RLIMIT_CPU (seconds) of the calling process. Used as the
+    preexec_fn of compiler processes, so a runaway compilation fails on its own instead
+    of waking up the OOM killer.
+    """
+    if memory:
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    if cpu:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+
+
+def pin_worker(cpu_queue):
+    """
+    ProcessPoolExecutor initializer: pins the worker, and so the compilers it starts, to
+    the next CPU of cpu_queue (a multiprocessing queue filled round-robin by the caller).
+    """
+    cpu = cpu_queue.get()
+    os.sched_setaffinity(0, {cpu})
+
+
+class FootprintModel:
+    """
+    Predicts the peak memory of a compilation from the size of its P4 file.
+
+    Observed peaks are grouped by power-of-two size bucket; the prediction is the 90th
+    percentile of the bucket, or of the closest observed bucket scaled by the size ratio,
+    with a safety margin. Sizes of smith.p4 files track the complexity of the generated
+    program closely enough for admission control.
+    """
+
+    MARGIN = 1.2
+    QUANTILE = 0.9
+
+    def __init__(self, default=DEFAULT_FOOTPRINT):
+        self.default = default
+        self.buckets = {}
+
+    @staticmethod
+    def _bucket(p4_size):
+        return int(math.log2(max(p4_size, 1)))
+
+    def observe(self, p4_size, max_rss):
+        if p4_size is None or not max_rss:
+            return
+        self.buckets.setdefault(self._bucket(p4_size), []).append(max_rss)
+
+    def predict(self, p4_size):
+        if not self.buckets or p4_size is None:
+            return self.default
+        bucket = self._bucket(p4_size)
+        nearest = min(self.buckets, key=lambda b: (abs(b - bucket), -b))
+        peaks = sorted(self.buckets[nearest])
+        peak = peaks[min(len(peaks) - 1, int(self.QUANTILE * len(peaks)))]
+        # scale to the bucket of the program, only ever upwards
+        if bucket > nearest:
+            peak *= 2 ** (bucket - nearest)
+        return int(peak * self.MARGIN)
+
+
+class MemoryAdmission:
+    """
+    Admits a compilation when its predicted footprint fits in the memory budget next to
+    the footprints reserved by the compilations in flight, and the machine still has that
+    much memory available (other processes may use it too). A compilation is always
+    admitted when nothing is in flight, so a huge program cannot stall the run.
+    """
+
+    def __init__(self, model, budget=None):
+        self.model = model
+        if budget is None:
+            available = mem_available()
+            budget = int(available * DEFAULT_BUDGET_SHARE) if available else None
+        self.budget = budget
+        self.reserved = 0
+        self.in_flight = 0
+
+    def admit(self, p4_size):
+        """Returns the reserved footprint if the compilation is admitted, None otherwise."""
+        predicted = self.model.predict(p4_size)
+        if self.in_flight > 0 and self.budget is not None:
+            available = mem_available()
+            if self.reserved + predicted > self.budget or \
+               (available is not None and available < predicted):
+                return None
+        self.reserved += predicted
+        self.in_flight += 1
+        return predicted
+
+    def release(self, reserved, p4_size=None, max_rss=None):
+        """Releases the reservation of a finished compilation and learns from its peak memory."""
+        self.reserved -= reserved
+        self.in_flight -= 1
+        self.model.observe(p4_size, max_rss)
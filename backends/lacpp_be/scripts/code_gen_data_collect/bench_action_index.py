@@ -0,0 +1,64 @@
+import argparse
+import random
+import time
+
+from feature_label_extract import ActionIndex
+
+# Micro-benchmark of the action-table resolution of extract_node_features: ActionIndex
+# against the former scan of every action per tbl_ node, on synthetic programs shaped
+# like large P4Smith outputs (p4c names action tables tbl_<action>, and many actions
+# share a prefix, e.g. act, act_0, act_1...).
+
+
+def legacy_find(node, actions):
+    """The former lookup: first action containing the node name with tbl_ removed."""
+    for action in actions:
+        if node[4:] in action:
+            return action
+    return None
+
+
+def synthetic_program(num_actions, num_nodes, rng):
+    """Returns [action names, tbl_ node names], some nodes matching no action."""
+    actions = [f"SmithIngress.{rng.choice(['act', 'action', 'set', 'drop'])}_{i}" for i in range(num_actions)]
+    rng.shuffle(actions)
+    nodes = []
+    for _ in range(num_nodes):
+        if rng.random() < 0.1:
+            nodes.append(f"tbl_missing_{rng.randrange(1 << 20)}")
+        else:
+            nodes.append("tbl_" + rng.choice(actions).split(".")[-1])
+    return [actions, nodes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the action-table resolution of extract_node_features.")
+    parser.add_argument("--programs", type=int, default=20, help="Number of synthetic programs.")
+    parser.add_argument("--actions", type=int, default=800, help="Actions per program.")
+    parser.add_argument("--nodes", type=int, default=400, help="tbl_ nodes per program.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    programs = [synthetic_program(args.actions, args.nodes, rng) for _ in range(args.programs)]
+
+    start = time.perf_counter()
+    legacy = [[legacy_find(node, actions) for node in nodes] for actions, nodes in programs]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = []
+    for actions, nodes in programs:
+        index = ActionIndex(actions)
+        indexed.append([index.find(node[4:]) for node in nodes])
+    index_time = time.perf_counter() - start
+
+    if legacy != indexed:
+        raise AssertionError("ActionIndex disagrees with the former lookup")
+    print(f"{args.programs} programs of {args.actions} actions and {args.nodes} tbl_ nodes")
+    print(f"former scan:  {legacy_time / args.programs * 1000:8.2f} ms/program")
+    print(f"ActionIndex:  {index_time / args.programs * 1000:8.2f} ms/program  ({legacy_time / index_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
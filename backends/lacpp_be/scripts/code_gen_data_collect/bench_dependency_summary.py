@@ -0,0 +1,156 @@
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+
+from dependency_summary import DEPENDENCY_ATTRS, dependency_to_bitvector, parse_table_dependency_summary
+
+# Micro-benchmark of parse_table_dependency_summary against the networkx based parser
+# feature_label_extract.py used before, on synthetic summaries. Tofino2 has 20 MAU
+# stages of 16 logical tables, so the default summaries have 320 tables per pipeline.
+
+
+def legacy_process_table_dependency_summary(filepath):
+    """The former feature_label_extract.process_table_dependency_summary."""
+    import networkx as nx
+
+    graph = nx.DiGraph()
+    table_list = []
+    dependency_matrix = []
+    dependency_char_map = {}
+
+    with open(filepath, 'r') as f:
+        lines = f.readlines()
+
+    parsing_dependencies = False
+
+    for line in lines:
+        line = line.strip()
+
+        if line.startswith("#dependencies"):
+            parsing_dependencies = True
+            continue
+
+        if parsing_dependencies:
+            if not line or line.startswith("#") or ":" not in line:
+                continue
+            key, val = line.split(":", 1)
+            dependency_char_map[key.strip()] = val.strip()
+            continue
+
+        if line.startswith("#stage") or line.startswith("#pipeline") or line.startswith("***") or line.startswith("#") or not line:
+            continue
+
+        if "^" in line:
+            parts = line.split("^")
+            prefix = parts[0].strip()
+            table_info = parts[1].strip().split(":")[0].strip().split("-")[-1].strip()
+            table_name = re.sub(r"\(.*?\)", "", table_info).strip()
+            dep_labels = [c for c in prefix.strip().replace(' ', '').strip()]
+            dependency_matrix.append(dep_labels)
+            table_list.append(table_name)
+            graph.add_node(table_name, label=table_name)
+    for i, deps in enumerate(dependency_matrix):
+        for j, label in enumerate(deps):
+            if label.isalpha():
+                src = table_list[j]
+                dst = table_list[i]
+                deps_vec = dependency_to_bitvector(dependency_char_map[label])
+                graph.add_edge(src, dst, labels={deps_vec})
+
+    node_names = list(graph.nodes())
+    node_to_id = {name: idx for idx, name in enumerate(node_names)}
+
+    edge_index = [[], []]
+    edge_attr = []
+
+    for src, dst, data in graph.edges(data=True):
+        edge_index[0].append(node_to_id[src])
+        edge_index[1].append(node_to_id[dst])
+        edge_attr.append(bin(list(data['labels'])[0])[2:])
+
+    return {"nodes": node_names, "edge_index": edge_index, "edge_attr": edge_attr}
+
+
+def synthetic_summary(path, tables, stages, density, rng):
+    """Writes a summary of `tables` tables over `stages` stages in the PrintDependencyGraph layout."""
+    tokens = list(DEPENDENCY_ATTRS)
+    letters = [chr(ord("A") + i) for i in range(20)]
+    per_stage = max(1, tables // stages)
+    stage_of = [min(i // per_stage, stages - 1) for i in range(tables)]
+    lines = ["#pipeline pipe", "#stage 0"]
+    for i in range(tables):
+        if i > 0 and stage_of[i] != stage_of[i - 1]:
+            lines.append(f"#stage {stage_of[i]}")
+        row = []
+        for j in range(tables):
+            if j > 0 and stage_of[j] != stage_of[j - 1]:
+                row.append(" ")
+            if j == i:
+                row.append("^")
+            elif j < i and rng.random() < density:
+                row.append(rng.choice(letters))
+            else:
+                row.append("-")
+        lines.append(f" {''.join(row)} tbl_t{i}_0({stage_of[i]},{stages - 1}) : ingress")
+    lines.append("#dependencies")
+    for letter in letters:
+        lines.append(f"{letter} :  {' '.join(rng.sample(tokens, rng.randint(1, 3)))}")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def best_of(fn, files, repeat):
+    """Best wall time of `repeat` runs of fn over all files."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in files:
+            fn(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the table_dependency_summary.log parsers.")
+    parser.add_argument("--files", type=int, default=20, help="Number of synthetic summaries.")
+    parser.add_argument("--tables", type=int, default=320, help="Tables per summary.")
+    parser.add_argument("--stages", type=int, default=20, help="MAU stages per summary.")
+    parser.add_argument("--density", type=float, default=0.05, help="Probability of a dependency between two tables.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per parser, the best one is reported.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for i in range(args.files):
+            path = os.path.join(tmp, f"table_dependency_summary_{i}.log")
+            synthetic_summary(path, args.tables, args.stages, args.density, rng)
+            files.append(path)
+        size = sum(os.path.getsize(path) for path in files)
+        print(f"{args.files} summaries of {args.tables} tables, {size / args.files / 1024:.1f} KiB each")
+
+        def parse(path):
+            [nodes, edge_index, edge_masks] = parse_table_dependency_summary(path)
+            return {"nodes": nodes, "edge_index": edge_index, "edge_attr": [bin(mask)[2:] for mask in edge_masks]}
+
+        new = best_of(parse, files, args.repeat)
+        print(f"parse_table_dependency_summary: {new / args.files * 1000:8.2f} ms/file")
+        try:
+            import networkx  # noqa: F401
+        except ImportError:
+            print("networkx is not installed, skipping the legacy parser")
+            return
+        for path in files:
+            if parse(path) != legacy_process_table_dependency_summary(path):
+                raise AssertionError(f"The parsers disagree on {path}")
+        legacy = best_of(legacy_process_table_dependency_summary, files, args.repeat)
+        print(f"legacy networkx parser:         {legacy / args.files * 1000:8.2f} ms/file  ({legacy / new:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+import uuid
+
+# Artifacts kept per compiled program, relative to the program folder.
+# {stem} is the program file name without extension (p4c-barefoot writes to <stem>.tofino).
+CACHE_ARTIFACTS = [
+    "opt.p4",
+    "log.txt",
+    "{stem}.tofino/manifest.json",
+    "{stem}.tofino/pipe/context.json",
+    "{stem}.tofino/pipe/metrics.json",
+    "{stem}.tofino/pipe/logs/resources.json",
+    "{stem}.tofino/pipe/logs/power.json",
+    "{stem}.tofino/pipe/logs/phv.json",
+    "{stem}.tofino/pipe/logs/table_dependency_summary.log",
+]
+RESULT_FILE = "result.json"
+
+
+def compiler_version(p4c_barefoot):
+    """
+    Returns a string identifying the build of a tool (p4c-barefoot, p4c-build-logs): its
+    --version output, plus the size and mtime of the executable so that rebuilt tools
+    invalidate the cache.
+    """
+    path = shutil.which(p4c_barefoot) or p4c_barefoot
+    try:
+        version = subprocess.run([path, "--version"], capture_output=True, text=True,
+                                 timeout=30).stdout.strip()
+    except Exception:
+        version = ""
+    stat = os.stat(path)
+    return f"{version}|{stat.st_size}|{int(stat.st_mtime)}"
+
+
+def parse_size(size):
+    """Parses sizes like '500M' or '20G' into bytes."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    size = size.strip().upper()
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+class CompileCache:
+    """
+    Content-addressed cache of p4c-barefoot results.
+
+    An entry is keyed on the program bytes, the compiler version (plus the p4c-build-logs
+    version when metrics.json is built inline) and the exact flag list, and holds the
+    CACHE_ARTIFACTS of the compilation plus its result. Entries live in
+    <cache_dir>/<key[:2]>/<key>/ and their mtime is refreshed on every hit, which is what
+    evict() uses to find the least recently used entries.
+    """
+
+    def __init__(self, cache_dir, version):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.version = version
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, p4_file, flags):
+        h = hashlib.sha256()
+        with open(p4_file, "rb") as f:
+            h.update(f.read())
+        h.update(b"\0" + self.version.encode())
+        for flag in flags:
+            h.update(b"\0" + flag.encode())
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def restore(self, key, folder, stem):
+        """
+        Copies the cached artifacts of `key` into folder.
+        Returns the cached result dict, or None on a miss.
+        """
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, RESULT_FILE), "r") as f:
+                result = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        for artifact in CACHE_ARTIFACTS:
+            artifact = artifact.format(stem=stem)
+            src = os.path.join(entry, artifact)
+            if os.path.exists(src):
+                dst = os.path.join(folder, artifact)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copyfile(src, dst)
+        os.utime(entry)
+        return result
+
+    def store(self, key, folder, stem, result):
+        """Stores the artifacts found in folder and the result dict under `key`."""
+        entry = self._entry(key)
+        tmp = os.path.join(self.cache_dir, f"tmp-{uuid.uuid4().hex}")
+        for artifact in CACHE_ARTIFACTS:
+            artifact = artifact.format(stem=stem)
+            src = os.path.join(folder, artifact)
+            if os.path.exists(src):
+                dst = os.path.join(tmp, artifact)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copyfile(src, dst)
+        os.makedirs(tmp, exist_ok=True)
+        with open(os.path.join(tmp, RESULT_FILE), "w") as f:
+            json.dump(result, f)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # another worker stored the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def evict(self, max_bytes=None, max_age_days=None):
+        """
+        Removes entries older than max_age_days, then the least recently used entries
+        until the cache is below max_bytes. Returns the number of removed entries.
+        """
+        entries = []
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if shard.startswith("tmp-") or not os.path.isdir(shard_dir):
+                continue
+            for key in os.listdir(shard_dir):
+                entry = os.path.join(shard_dir, key)
+                size = sum(os.path.getsize(os.path.join(root, file))
+                           for root, _, files in os.walk(entry) for file in files)
+                entries.append([os.path.getmtime(entry), size, entry])
+        entries.sort()
+        removed = 0
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for mtime, size, entry in entries:
+            too_old = max_age_days is not None and now - mtime > max_age_days * 86400
+            too_big = max_bytes is not None and total > max_bytes
+            if not too_old and not too_big:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
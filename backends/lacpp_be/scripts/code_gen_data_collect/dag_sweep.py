@@ -0,0 +1,99 @@
+import math
+import random
+
+
+def parse_values(spec, cast):
+    """
+    Parses a parameter range: a comma-separated list of values and/or start:stop:step
+    ranges, stop included, e.g. '4,8,12', '4:12:2' or '0.2:0.8:0.2'.
+    Returns the sorted distinct values.
+    """
+    values = []
+    for part in str(spec).split(","):
+        if ":" in part:
+            start, stop, step = (float(x) for x in part.split(":"))
+            count = int(math.floor((stop - start) / step + 1e-9)) + 1
+            values.extend(cast(round(start + i * step, 6)) for i in range(count))
+        else:
+            values.append(cast(part))
+    return sorted(set(values))
+
+
+class DagSweep:
+    """
+    Chooses the (dag_node_num, dag_density) cell of every p4smith attempt.
+
+    Each cell first gets min_attempts attempts, least attempted cell first. After that,
+    cells are drawn by Thompson sampling of
+
+        P(success) * (1 + diversity) / cost
+
+    where P(success) ~ Beta(1 + successes, 1 + failures), diversity is the fraction of the
+    cell's successes that produced a label signature the cell had not produced before, and
+    cost is the mean wall time of an attempt (generation + compilation). Duplicates and
+    generation failures count as failures, so cells that almost always fail, repeat
+    themselves or compile slowly only get their quota.
+
+    Label diversity is only known for the attempts recorded in this process.
+    """
+
+    def __init__(self, node_nums, densities, min_attempts=0, rng=None):
+        self.cells = [(n, d) for n in node_nums for d in densities]
+        self.min_attempts = min_attempts
+        self.rng = rng if rng is not None else random.Random()
+        self.stats = {cell: {"started": 0, "attempts": 0, "successes": 0, "time": 0.0,
+                             "labels": set(), "new_labels": 0} for cell in self.cells}
+
+    def choose(self):
+        """Returns the cell of the next attempt and counts it as started."""
+        below_quota = [cell for cell in self.cells if self.stats[cell]["started"] < self.min_attempts]
+        if below_quota:
+            cell = min(below_quota, key=lambda c: self.stats[c]["started"])
+        else:
+            cell = max(self.cells, key=self._sample)
+        self.stats[cell]["started"] += 1
+        return cell
+
+    def _sample(self, cell):
+        stats = self.stats[cell]
+        failures = stats["attempts"] - stats["successes"]
+        p_success = self.rng.betavariate(1 + stats["successes"], 1 + failures)
+        diversity = stats["new_labels"] / stats["successes"] if stats["successes"] else 1.0
+        # an optimistic one second until the cell has been timed
+        cost = stats["time"] / stats["attempts"] if stats["attempts"] else 1.0
+        return p_success * (1 + diversity) / max(cost, 1e-3)
+
+    def record(self, cell, success, cost, label=None, started=False):
+        """
+        Records the outcome of an attempt of `cell` that took `cost` seconds. label is a
+        hashable label signature of a successful attempt, if known. started marks attempts
+        that were not returned by choose(), e.g. attempts read back from a manifest.
+        Cells outside the sweep are ignored.
+        """
+        stats = self.stats.get(cell)
+        if stats is None:
+            return
+        if started:
+            stats["started"] += 1
+        stats["attempts"] += 1
+        stats["time"] += cost
+        if success:
+            stats["successes"] += 1
+            if label is not None and label not in stats["labels"]:
+                stats["labels"].add(label)
+                stats["new_labels"] += 1
+
+    def add_cost(self, cell, cost):
+        """Adds time spent on an attempt whose outcome is not known yet (e.g. its generation)."""
+        if cell in self.stats:
+            self.stats[cell]["time"] += cost
+
+    def summary(self):
+        """Returns [dag_node_num, dag_density, attempts, successes, mean_cost, distinct_labels] per cell."""
+        rows = []
+        for cell in self.cells:
+            stats = self.stats[cell]
+            mean_cost = stats["time"] / stats["attempts"] if stats["attempts"] else 0.0
+            rows.append([cell[0], cell[1], stats["attempts"], stats["successes"], mean_cost,
+                         len(stats["labels"])])
+        return rows
@@ -0,0 +1,86 @@
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+# Default dataset manifest file name, created in the dataset output folder
+DATASET_MANIFEST_NAME = "dataset_manifest.db"
+
+# record status values
+RECORD_OK = "ok"            # record written to the dataset
+RECORD_FAILED = "failed"    # extraction failed, retried by the next build
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    folder       TEXT PRIMARY KEY,
+    fingerprint  TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    record       TEXT,
+    stats        TEXT,
+    updated_at   TEXT NOT NULL
+);
+"""
+
+
+class DatasetManifest:
+    """
+    SQLite manifest of a dataset built by feature_label_extract.py, one row per program
+    folder: the fingerprint of its inputs when it was last extracted, the dataset record
+    file it produced and the sufficient statistics of that record (node attribute count,
+    mean and M2, and its label), so the normalization statistics of the whole dataset can
+    be recomputed without reading the records back.
+
+    Folders are stored relative to the directory the programs were discovered in.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM records")
+        self.conn.commit()
+
+    def fingerprints(self, status=None):
+        """Returns {folder: fingerprint} of every recorded folder, or of those with the given status."""
+        if status is None:
+            rows = self.conn.execute("SELECT folder, fingerprint FROM records")
+        else:
+            rows = self.conn.execute("SELECT folder, fingerprint FROM records WHERE status = ?", (status,))
+        return {row["folder"]: row["fingerprint"] for row in rows}
+
+    def put(self, folder, fingerprint, status, record=None, stats=None):
+        """Records the extraction of folder; record is the dataset file name, stats a JSON-able dict."""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO records (folder, fingerprint, status, record, stats, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (folder, fingerprint, status, record, json.dumps(stats) if stats is not None else None,
+             datetime.now().isoformat()))
+        self.conn.commit()
+
+    def remove(self, folder):
+        """Forgets folder, returns the dataset file name of its record (None if it had none)."""
+        row = self.conn.execute("SELECT record FROM records WHERE folder = ?", (folder,)).fetchone()
+        self.conn.execute("DELETE FROM records WHERE folder = ?", (folder,))
+        self.conn.commit()
+        return row["record"] if row is not None else None
+
+    def iter_stats(self):
+        """Yields the stats dict of every written record."""
+        for row in self.conn.execute("SELECT stats FROM records WHERE status = ? AND stats IS NOT NULL",
+                                     (RECORD_OK,)):
+            yield json.loads(row["stats"])
+
+    def count(self, status=None):
+        if status is None:
+            return self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM records WHERE status = ?", (status,)).fetchone()[0]
@@ -0,0 +1,511 @@
+import argparse
+import html
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# Normalization statistics of a dataset, kept per shard.
+#
+# A shard is a folder of dataset records: a part-* folder of the dataset, or the
+# output folder of one feature_label_extract.py run. Next to its records it holds
+# SHARD_STATS, the sufficient statistics of its node attributes and labels (count, mean
+# and M2 per column, see RunningStats) and their quantile sketches. The MEANS_STDS of
+# the dataset is merged from the shard statistics, so adding a shard only reads that
+# shard; a shard whose records changed after its statistics were written is rescanned.
+
+NODE_ATTRIBUTES = {0: "size", 1: "op_num_sum", 2: "lpm_count", 3: "exact_count", 4: "ternary_count", 5: "unknown"}
+# note: latency is only that of ingress, we don't consider egree rn
+LABEL_ATTRIBUTES = {0: "mau_len", 1: "latency", 2: "sram", 3: "tcam"}
+# node attribute set to 1 for the tables p4lacpp knows nothing about
+UNKNOWN_ATTRIBUTE = 5
+
+MEANS_STDS = "means_stds.json"
+SHARD_STATS = "shard_stats.json"
+# files of a dataset folder that are not records; the perf_model scripts read them from
+# perf_model/packed_dataset.py, keep both in sync
+STATS_FILES = (MEANS_STDS, SHARD_STATS)
+# relative accuracy of the quantiles of QuantileSketch
+SKETCH_ACCURACY = 0.01
+
+
+class RunningStats:
+    """
+    Mean and standard deviation of row vectors, updated one batch of rows at a time with
+    Welford's algorithm (the batch variant of Chan et al.), so a dataset never has to fit
+    in memory. Two RunningStats of the same width can be merged.
+    """
+
+    def __init__(self, dim):
+        self.count = 0
+        self.mean = np.zeros(dim, dtype=np.float64)
+        self.m2 = np.zeros(dim, dtype=np.float64)
+
+    def update(self, rows):
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(self.mean))
+        if len(rows) == 0:
+            return
+        mean = rows.mean(axis=0)
+        self._combine(len(rows), mean, ((rows - mean) ** 2).sum(axis=0))
+
+    def merge(self, other):
+        if other.count > 0:
+            self._combine(other.count, other.mean, other.m2)
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def std(self):
+        """Population standard deviation (as np.std), 1 for constant columns."""
+        std = np.sqrt(self.m2 / self.count) if self.count > 0 else np.ones_like(self.m2)
+        std[std == 0] = 1.0
+        return std
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean.tolist(), "m2": self.m2.tolist()}
+
+    def merge_dict(self, state):
+        """Merges the state of a RunningStats saved with to_dict."""
+        if state["count"] > 0:
+            self._combine(state["count"], np.asarray(state["mean"]), np.asarray(state["m2"]))
+
+
+class QuantileSketch:
+    """
+    Quantiles of row vectors, per column, with relative error below `accuracy` (the
+    DDSketch scheme): values are counted in logarithmically sized buckets, so memory
+    grows with the range of the values, not their number, and merging two sketches of
+    the same accuracy adds their bucket counts.
+    """
+
+    # values closer to 0 are counted as 0
+    MIN_VALUE = 1e-9
+
+    def __init__(self, dim, accuracy=SKETCH_ACCURACY):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # per column: {"pos": {bucket: count}, "neg": {bucket: count}, "zero": count}
+        self.columns = [{"pos": {}, "neg": {}, "zero": 0} for _ in range(dim)]
+
+    def _add(self, store, buckets, counts):
+        for bucket, count in zip(buckets.tolist(), counts.tolist()):
+            store[bucket] = store.get(bucket, 0) + count
+
+    def update(self, rows):
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(self.columns))
+        for column, values in zip(self.columns, rows.T):
+            small = np.abs(values) < self.MIN_VALUE
+            column["zero"] += int(small.sum())
+            for sign, selected in (("pos", values[~small & (values > 0)]), ("neg", -values[~small & (values < 0)])):
+                if len(selected) > 0:
+                    buckets = np.ceil(np.log(selected) / self.log_gamma).astype(np.int64)
+                    self._add(column[sign], *np.unique(buckets, return_counts=True))
+
+    def quantile(self, q):
+        """Returns the q-quantile of every column (nan for an empty sketch)."""
+        result = []
+        for column in self.columns:
+            # ascending [sign, bucket, count]: largest negative magnitudes first, zero, positives
+            ordered = [[-1, bucket, count] for bucket, count in sorted(column["neg"].items(), reverse=True)]
+            ordered.append([0, 0, column["zero"]])
+            ordered += [[1, bucket, count] for bucket, count in sorted(column["pos"].items())]
+            total = sum(count for _, _, count in ordered)
+            if total == 0:
+                result.append(float("nan"))
+                continue
+            rank = q * (total - 1)
+            seen = 0
+            for sign, bucket, count in ordered:
+                seen += count
+                if seen > rank:
+                    break
+            # the value of a bucket with the smallest relative error to all of its values
+            result.append(sign * 2 * self.gamma ** bucket / (self.gamma + 1))
+        return np.asarray(result)
+
+    def to_dict(self):
+        return {"accuracy": self.accuracy,
+                "columns": [{"pos": {str(k): v for k, v in column["pos"].items()},
+                             "neg": {str(k): v for k, v in column["neg"].items()},
+                             "zero": column["zero"]} for column in self.columns]}
+
+    def merge(self, other):
+        self.merge_dict(other.to_dict())
+
+    def merge_dict(self, state):
+        """Merges the state of a QuantileSketch of the same accuracy saved with to_dict."""
+        if not math.isclose(state["accuracy"], self.accuracy):
+            raise ValueError(f"Cannot merge sketches of accuracy {state['accuracy']} and {self.accuracy}")
+        for column, other in zip(self.columns, state["columns"]):
+            for sign in ("pos", "neg"):
+                for bucket, count in other[sign].items():
+                    column[sign][int(bucket)] = column[sign].get(int(bucket), 0) + count
+            column["zero"] += other["zero"]
+
+    def histogram(self, lows, highs, bins):
+        """
+        Returns [edges, counts] per column: `bins` equal-width bins from lows[i] to highs[i]
+        (the exact minimum and maximum of the column), each bucket counted at its value.
+        """
+        result = []
+        for column, low, high in zip(self.columns, lows, highs):
+            values = [0.0]
+            counts = [column["zero"]]
+            for sign in ("pos", "neg"):
+                for bucket, count in column[sign].items():
+                    value = 2 * self.gamma ** bucket / (self.gamma + 1)
+                    values.append(value if sign == "pos" else -value)
+                    counts.append(count)
+            if high <= low:
+                high = low + 1
+            edges = np.linspace(low, high, bins + 1)
+            hist, _ = np.histogram(np.clip(values, low, high), edges, weights=counts)
+            result.append([edges.tolist(), hist.astype(np.int64).tolist()])
+        return result
+
+
+def record_files(folder):
+    """The dataset records below folder, sorted."""
+    return sorted(file for file in Path(folder).rglob("*.json") if file.name not in STATS_FILES)
+
+
+def shard_state(files):
+    """[record count, newest record mtime] of a shard, to tell whether its SHARD_STATS is stale."""
+    return [len(files), max((file.stat().st_mtime_ns for file in files), default=0)]
+
+
+def new_shard_stats(node_dim, label_dim):
+    return [RunningStats(node_dim), RunningStats(label_dim), QuantileSketch(node_dim), QuantileSketch(label_dim)]
+
+
+def write_shard_stats(folder, stats, files=None):
+    """Writes SHARD_STATS of folder from [node stats, label stats, node sketch, label sketch]."""
+    [records, newest] = shard_state(record_files(folder) if files is None else files)
+    [node_stats, label_stats, node_sketch, label_sketch] = stats
+    with open(os.path.join(folder, SHARD_STATS), "w") as f:
+        json.dump({"records": records, "newest": newest,
+                   "node": node_stats.to_dict(), "label": label_stats.to_dict(),
+                   "node_sketch": node_sketch.to_dict() if node_sketch is not None else None,
+                   "label_sketch": label_sketch.to_dict() if label_sketch is not None else None}, f)
+
+
+def scan_shard(folder):
+    """Computes and writes the SHARD_STATS of folder from its records, returns its content."""
+    files = record_files(folder)
+    stats = None
+    for file in files:
+        with open(file, "r") as f:
+            record = json.load(f)
+        if not record.get("node_attr"):
+            continue
+        if stats is None:
+            stats = new_shard_stats(len(record["node_attr"][0]), len(record["y"]))
+        stats[0].update(record["node_attr"])
+        stats[1].update(record["y"])
+        stats[2].update(record["node_attr"])
+        stats[3].update(record["y"])
+    if stats is None:
+        raise ValueError(f"{folder} has no dataset records")
+    write_shard_stats(folder, stats, files)
+    with open(os.path.join(folder, SHARD_STATS), "r") as f:
+        return json.load(f)
+
+
+def load_shard_stats(folder, rescan=False):
+    """
+    Returns the SHARD_STATS content of folder, rescanning the shard if it has none, if
+    its records changed since it was written or if rescan is set.
+    """
+    path = os.path.join(folder, SHARD_STATS)
+    if not rescan and os.path.exists(path):
+        with open(path, "r") as f:
+            stats = json.load(f)
+        if [stats["records"], stats["newest"]] == shard_state(record_files(folder)):
+            return stats
+        print(f"{path} is stale, rescanning the shard.")
+    return scan_shard(folder)
+
+
+def merge_shard_stats(shards):
+    """Merges SHARD_STATS contents into [node stats, label stats, node sketch, label sketch]."""
+    merged = None
+    for shard in shards:
+        if merged is None:
+            merged = new_shard_stats(len(shard["node"]["mean"]), len(shard["label"]["mean"]))
+        merged[0].merge_dict(shard["node"])
+        merged[1].merge_dict(shard["label"])
+        # shards written without sketches leave the dataset without them
+        for i, key in ((2, "node_sketch"), (3, "label_sketch")):
+            if merged[i] is not None and shard.get(key) is not None:
+                merged[i].merge_dict(shard[key])
+            else:
+                merged[i] = None
+    return merged
+
+
+def iqr(sketch):
+    """Interquartile range of every column, 1 where it is 0."""
+    spread = sketch.quantile(0.75) - sketch.quantile(0.25)
+    spread[~(spread > 0)] = 1.0
+    return spread
+
+
+def means_stds(stats, robust=False):
+    """
+    The MEANS_STDS content of [node stats, label stats, node sketch, label sketch]: loaders
+    normalize with (x - mean) / std. With robust, mean and std are the median and the
+    interquartile range from the sketches instead.
+    """
+    [node_stats, label_stats, node_sketch, label_sketch] = stats
+    result = {
+        "node_mean": node_stats.mean.tolist(),
+        "node_std": node_stats.std().tolist(),
+        "label_mean": label_stats.mean.tolist(),
+        "label_std": label_stats.std().tolist(),
+        "node_count": node_stats.count,
+        "graph_count": label_stats.count,
+        "scaling": "zscore"
+    }
+    if robust:
+        if node_sketch is None or label_sketch is None:
+            raise ValueError("Robust scaling needs the quantile sketches of every shard")
+        result.update({
+            "node_mean": node_sketch.quantile(0.5).tolist(),
+            "node_std": iqr(node_sketch).tolist(),
+            "label_mean": label_sketch.quantile(0.5).tolist(),
+            "label_std": iqr(label_sketch).tolist(),
+            "scaling": "robust"
+        })
+    return result
+
+
+def dataset_shards(directory):
+    """The part-* shards of a dataset, or the dataset folder itself if it has none."""
+    parts = sorted(p for p in Path(directory).iterdir() if p.is_dir() and p.name.startswith("part-"))
+    return parts if parts else [Path(directory)]
+
+
+def merge_dataset(directory, robust=False, rescan=False):
+    """Writes the MEANS_STDS of a dataset from the SHARD_STATS of its shards, returns its content."""
+    shards = [load_shard_stats(shard, rescan) for shard in dataset_shards(directory)]
+    result = means_stds(merge_shard_stats(shards), robust)
+    with open(os.path.join(directory, MEANS_STDS), "w") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+class ReportStats:
+    """
+    The aggregates of a dataset report over a set of records: running moments, sketches
+    and exact extrema and zero counts of the node attributes and labels, the unknown
+    tables and the graph sizes. Computed per chunk of records in the workers and merged.
+    """
+
+    def __init__(self, node_dim=len(NODE_ATTRIBUTES), label_dim=len(LABEL_ATTRIBUTES)):
+        self.graphs = 0
+        self.skipped = 0
+        self.unknown_graphs = 0
+        self.unknown_nodes = 0
+        # columns: node attributes, labels, and per graph [nodes, edges, unknown table ratio]
+        self.parts = {name: [RunningStats(dim), QuantileSketch(dim), np.full(dim, np.inf), np.full(dim, -np.inf),
+                             np.zeros(dim, dtype=np.int64)]
+                      for name, dim in (("node_attr", node_dim), ("y", label_dim), ("graph", 3))}
+
+    def update(self, name, rows):
+        [stats, sketch, lows, highs, zeros] = self.parts[name]
+        if len(rows) == 0:
+            return
+        stats.update(rows)
+        sketch.update(rows)
+        np.minimum(lows, rows.min(axis=0), out=lows)
+        np.maximum(highs, rows.max(axis=0), out=highs)
+        zeros += (rows == 0).sum(axis=0)
+
+    def merge(self, other):
+        self.graphs += other.graphs
+        self.skipped += other.skipped
+        self.unknown_graphs += other.unknown_graphs
+        self.unknown_nodes += other.unknown_nodes
+        for name, [stats, sketch, lows, highs, zeros] in self.parts.items():
+            [other_stats, other_sketch, other_lows, other_highs, other_zeros] = other.parts[name]
+            stats.merge(other_stats)
+            sketch.merge(other_sketch)
+            np.minimum(lows, other_lows, out=lows)
+            np.maximum(highs, other_highs, out=highs)
+            zeros += other_zeros
+
+
+def summarize_records(files):
+    """ReportStats of a chunk of record files, vectorized over the whole chunk."""
+    report = ReportStats()
+    node_rows = []
+    labels = []
+    graph_rows = []
+    for file in files:
+        with open(file, "r") as f:
+            record = json.load(f)
+        if not record.get("node_attr"):
+            report.skipped += 1
+            continue
+        node_attr = np.asarray(record["node_attr"], dtype=np.float64)
+        unknown = int((node_attr[:, UNKNOWN_ATTRIBUTE] == 1).sum())
+        report.graphs += 1
+        report.unknown_graphs += unknown > 0
+        report.unknown_nodes += unknown
+        node_rows.append(node_attr)
+        labels.append(record["y"])
+        graph_rows.append([len(node_attr), len(record.get("edge_attr", [])), unknown / len(node_attr)])
+    if report.graphs > 0:
+        report.update("node_attr", np.concatenate(node_rows))
+        report.update("y", np.asarray(labels, dtype=np.float64))
+        report.update("graph", np.asarray(graph_rows, dtype=np.float64))
+    return report
+
+
+# quantiles and histogram bins of the report
+REPORT_QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+REPORT_BINS = 20
+GRAPH_COLUMNS = {0: "nodes", 1: "edges", 2: "unknown_table_ratio"}
+
+
+def dataset_report(directory, num_workers=4, chunk_size=256):
+    """
+    Computes the statistics report of the records below directory in one pass over a
+    process pool. Returns it as a dict:
+    {"graphs", "nodes", "edges", "skipped", "unknown_tables": {...},
+     "node_attr" / "y" / "graph": {column: {"mean", "std", "min", "max", "zero_ratio",
+                                            "quantiles": {q: value}, "histogram": {"edges", "counts"}}}}
+    Quantiles and histograms come from QuantileSketch (relative error SKETCH_ACCURACY).
+    """
+    files = [str(file) for file in record_files(directory)]
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    report = ReportStats()
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for partial in executor.map(summarize_records, chunks):
+            report.merge(partial)
+
+    result = {"graphs": report.graphs, "skipped": report.skipped}
+    for name, columns in (("node_attr", NODE_ATTRIBUTES), ("y", LABEL_ATTRIBUTES), ("graph", GRAPH_COLUMNS)):
+        [stats, sketch, lows, highs, zeros] = report.parts[name]
+        if stats.count == 0:
+            result[name] = {}
+            continue
+        quantiles = {q: sketch.quantile(q) for q in REPORT_QUANTILES}
+        histograms = sketch.histogram(lows, highs, REPORT_BINS)
+        std = np.sqrt(stats.m2 / stats.count)
+        result[name] = {
+            column: {
+                "mean": float(stats.mean[i]),
+                "std": float(std[i]),
+                "min": float(lows[i]),
+                "max": float(highs[i]),
+                "zero_ratio": float(zeros[i] / stats.count),
+                "quantiles": {f"p{round(q * 100):02d}": float(values[i]) for q, values in quantiles.items()},
+                "histogram": {"edges": histograms[i][0], "counts": histograms[i][1]},
+            } for i, column in columns.items()}
+    graph = report.parts["graph"][0]
+    result["nodes"] = int(round(graph.mean[0] * graph.count))
+    result["edges"] = int(round(graph.mean[1] * graph.count))
+    result["unknown_tables"] = {
+        "ratio": report.unknown_nodes / result["nodes"] if result["nodes"] else 0.0,
+        "graphs_with_unknown": report.unknown_graphs,
+    }
+    return result
+
+
+def _svg_histogram(histogram, width=240, height=60):
+    counts = histogram["counts"]
+    peak = max(counts) or 1
+    bar = width / len(counts)
+    bars = "".join(f'<rect x="{i * bar:.1f}" y="{height - count / peak * height:.1f}" width="{bar - 1:.1f}" '
+                   f'height="{count / peak * height:.1f}"/>' for i, count in enumerate(counts))
+    return f'<svg width="{width}" height="{height}" fill="steelblue">{bars}</svg>'
+
+
+def write_html_report(result, path):
+    """Writes the report as one self-contained HTML page (tables and inline SVG histograms)."""
+    out = ["<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Dataset report</title>",
+           "<style>body{font-family:sans-serif}table{border-collapse:collapse}"
+           "td,th{border:1px solid #ccc;padding:2px 6px;text-align:right}</style></head><body>",
+           f"<h1>Dataset report</h1><p>{result['graphs']} graphs, {result['nodes']} nodes, {result['edges']} edges, "
+           f"{result['skipped']} records without features. Unknown tables: "
+           f"{result['unknown_tables']['ratio'] * 100:.2f}% of the nodes, in "
+           f"{result['unknown_tables']['graphs_with_unknown']} graphs.</p>"]
+    for name, title in (("node_attr", "Node attributes"), ("y", "Labels"), ("graph", "Graphs")):
+        if not result[name]:
+            continue
+        quantile_names = list(next(iter(result[name].values()))["quantiles"])
+        out.append(f"<h2>{title}</h2><table><tr><th>column</th><th>mean</th><th>std</th><th>min</th><th>max</th>"
+                   f"<th>zeros</th>{''.join(f'<th>{q}</th>' for q in quantile_names)}<th>histogram</th></tr>")
+        for column, stats in result[name].items():
+            cells = [stats["mean"], stats["std"], stats["min"], stats["max"]]
+            out.append(f"<tr><th>{html.escape(column)}</th>{''.join(f'<td>{v:.4g}</td>' for v in cells)}"
+                       f"<td>{stats['zero_ratio'] * 100:.1f}%</td>"
+                       f"{''.join(f'<td>{v:.4g}</td>' for v in stats['quantiles'].values())}"
+                       f"<td>{_svg_histogram(stats['histogram'])}</td></tr>")
+        out.append("</table>")
+    out.append("</body></html>")
+    with open(path, "w") as f:
+        f.write("\n".join(out))
+
+
+def plot_report(result, directory="."):
+    """Plots the histograms of a report, one <section>_<column>_distribution.png per column."""
+    import matplotlib.pyplot as plt
+    for name in ("node_attr", "y", "graph"):
+        for column, stats in result[name].items():
+            histogram = stats["histogram"]
+            plt.stairs(histogram["counts"], histogram["edges"], fill=True, alpha=0.7)
+            plt.title(f"Distribution of {name}_{column}")
+            plt.xlabel(f"{name}_{column}")
+            plt.ylabel("Frequency")
+            plt.grid(True)
+            plt.savefig(os.path.join(directory, f"{name}_{column}_distribution.png"))
+            plt.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Statistics of a dataset written by feature_label_extract.py.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    merge = commands.add_parser("merge", help=f"Write the {MEANS_STDS} of a dataset by merging the {SHARD_STATS} "
+                                              "of its part-* shards.")
+    merge.add_argument("dataset", type=str, help="Dataset folder (its part-* folders are the shards).")
+    merge.add_argument("--robust", action="store_true",
+                       help="Scale with the median and interquartile range instead of the mean and std.")
+    merge.add_argument("--rescan", action="store_true", help=f"Recompute the {SHARD_STATS} of every shard.")
+    report = commands.add_parser("report", help="Distributions of the node attributes, labels and graph sizes.")
+    report.add_argument("dataset", type=str, help="Dataset folder.")
+    report.add_argument("-w", "--workers", type=int, default=4, help="Number of worker processes.")
+    report.add_argument("-o", "--output", type=str, default="dataset_report.json", help="JSON report file.")
+    report.add_argument("--html", type=str, default="", help="Also write the report as an HTML page.")
+    report.add_argument("--plot", type=str, default="",
+                        help="Also plot the histograms (needs matplotlib) into this folder.")
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        result = merge_dataset(args.dataset, args.robust, args.rescan)
+        print(f"Wrote {os.path.join(args.dataset, MEANS_STDS)} ({result['graph_count']} graphs, "
+              f"{result['node_count']} nodes, {result['scaling']} scaling).")
+        return
+    result = dataset_report(args.dataset, args.workers)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=1)
+    print(f"{result['graphs']} graphs, {result['nodes']} nodes, {result['edges']} edges; "
+          f"{result['unknown_tables']['ratio'] * 100:.2f}% unknown tables. Report written to {args.output}.")
+    if args.html != "":
+        write_html_report(result, args.html)
+    if args.plot != "":
+        os.makedirs(args.plot, exist_ok=True)
+        plot_report(result, args.plot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import re
+
+# Parser of the table_dependency_summary.log written by p4c-barefoot (PrintDependencyGraph):
+#
+#   #pipeline pipe
+#   #stage 0
+#    ^---- t1_0(0,11) : ingress
+#    A^--- t2_0(0,11) : ingress
+#   #stage 1
+#    -B ^- t3_0(1,11) : ingress
+#   #dependencies
+#   A :  CONTROL_DEFAULT_NEXT_TABLE
+#   B :  ANTI_NEXT_TABLE_DATA ANTI_NEXT_TABLE_CONTROL
+#
+# Row i is a table; a letter in column j < i left of the '^' diagonal is a dependency of
+# table i on table j, encoded by the #dependencies section (spaces separate stages).
+
+
+def debug_print(msg):
+    # Uncomment the next line to enable debug printing
+    #print(f"DEBUG: {msg}")
+    pass
+
+# dependancy bits
+DEPENDENCY_ATTRS = {
+    # "NONE": 1, These two does not show up
+    # "CONCURRENT": 0
+    "CONTROL_ACTION": 1,
+    "CONTROL_COND_TRUE": 1,
+    "CONTROL_COND_FALSE": 1,
+    "CONTROL_TABLE_HIT": 1,
+    "CONTROL_TABLE_MISS": 1,
+    "CONTROL_DEFAULT_NEXT_TABLE": 1,
+    "CONTROL_EXIT": 1,
+
+    "ANTI_EXIT": (1 << 1),
+    "ANTI_TABLE_READ": (1 << 1),
+    "ANTI_ACTION_READ": (1 << 1),
+    "ANTI_NEXT_TABLE_DATA": (1 << 1),
+    "ANTI_NEXT_TABLE_CONTROL": (1 << 1),
+    "ANTI_NEXT_TABLE_METADATA": (1 << 1),
+
+    "IXBAR_READ": (1 << 2),
+    "ACTION_READ": (1 << 2),
+    "OUTPUT": (1 << 2),
+
+    # ignore these 3, they are rare
+    # "REDUCTION_OR_READ": (1 << 10),
+    # "REDUCTION_OR_OUTPUT": (1 << 11),
+    # "CONT_CONFLICT": (1 << 12),
+}
+
+# a non-empty cell of the dependency matrix
+_CELL = re.compile(r"[^-]")
+_PARENTHESES = re.compile(r"\(.*?\)")
+
+
+def dependency_to_bitvector(dep_str):
+    """Given a space-separated dependency string, return its bitmask (see DEPENDENCY_ATTRS)."""
+    bitmask = 0
+    for token in dep_str.split():
+        if token in DEPENDENCY_ATTRS:
+            bitmask |= DEPENDENCY_ATTRS[token]
+        else:
+            debug_print(f"Unencoded dependency token: {token}")
+    return bitmask
+
+
+def clean_node_name(raw_name):
+    # Remove everything in parentheses
+    if "(" not in raw_name:
+        return raw_name.strip()
+    return _PARENTHESES.sub("", raw_name).strip()
+
+
+def parse_table_dependency_summary(filepath):
+    """
+    Parses a table_dependency_summary.log in one pass. Returns [nodes, edge_index,
+    edge_masks]: the table names (a table listed twice is one node, at its first row),
+    edge_index as [sources, destinations] node indices and the dependency bitmask of
+    every edge. An edge found twice keeps its position and its last bitmask. Edges are
+    ordered by source node, then by first occurrence.
+
+    Raises KeyError if the matrix uses a letter missing from #dependencies.
+    """
+    node_ids = {}
+    nodes = []
+    row_ids = []            # node index of every table row
+    cells = []              # [row, column, letter] of every dependency
+    char_map = {}
+    parsing_dependencies = False
+
+    with open(filepath, "r") as f:
+        for line in f:
+            line = line.strip()
+            if parsing_dependencies:
+                if not line or line[0] == "#" or ":" not in line:
+                    continue
+                # A : IXBAR_READ OUTPUT ...
+                key, val = line.split(":", 1)
+                char_map[key.strip()] = val
+                continue
+            if line.startswith("#dependencies"):
+                parsing_dependencies = True
+                continue
+            if not line or line[0] == "#" or line.startswith("***") or "^" not in line:
+                continue
+
+            parts = line.split("^")
+            table_name = clean_node_name(parts[1].split(":", 1)[0].strip().split("-")[-1])
+            node_id = node_ids.get(table_name)
+            if node_id is None:
+                node_id = node_ids[table_name] = len(nodes)
+                nodes.append(table_name)
+            row = len(row_ids)
+            row_ids.append(node_id)
+            prefix = parts[0].strip().replace(" ", "")
+            for cell in _CELL.finditer(prefix):
+                label = cell.group()
+                if label.isalpha():
+                    cells.append([row, cell.start(), label])
+
+    # resolve every dependency letter once
+    masks = {label: dependency_to_bitvector(val) for label, val in char_map.items()}
+    successors = [{} for _ in nodes]
+    for row, column, label in cells:
+        successors[row_ids[column]][row_ids[row]] = masks[label]
+
+    edge_index = [[], []]
+    edge_masks = []
+    for src, dsts in enumerate(successors):
+        for dst, mask in dsts.items():
+            edge_index[0].append(src)
+            edge_index[1].append(dst)
+            edge_masks.append(mask)
+    return [nodes, edge_index, edge_masks]
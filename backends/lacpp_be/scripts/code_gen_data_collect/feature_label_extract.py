@@ -1,20 +1,34 @@
 import json
 import argparse
+import bisect
+import hashlib
 import os
 import shutil
-import re
 import subprocess
-import networkx as nx
-import numpy as np
-import matplotlib.pyplot as plt
 from tqdm import tqdm
-from concurrent.futures import ProcessPoolExecutor, as_completed
-
-NODE_ATTRIBUTES = {0: "size", 1: "op_num_sum", 2: "lpm_count", 3: "exact_count", 4: "ternary_count", 5: "unknown"}
-# note: latency is only that of ingress, we don't consider egree rn
-LABEL_ATTRIBUTES = {0: "mau_len", 1: "latency", 2: "sram", 3: "tcam"}
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from json_paths import extract_json_paths, LENGTH, VALUE
+from dependency_summary import parse_table_dependency_summary
+from smith_manifest import RunManifest, STATUS_SUCCESS
+from dataset_stats import NODE_ATTRIBUTES, LABEL_ATTRIBUTES, MEANS_STDS, QuantileSketch, RunningStats, means_stds, \
+    new_shard_stats, write_shard_stats, dataset_report, plot_report
+from dataset_manifest import DatasetManifest, DATASET_MANIFEST_NAME, RECORD_OK, RECORD_FAILED
 
 P4LACPP = "p4lacpp"  # Path to the p4lacpp executable (in $PATH)
+# also write the p4lacpp features of every program to NODE_FEATURES in its folder
+KEEP_NODE_FEATURES = False
+NODE_FEATURES = "node_features.json"
+# Bump whenever extract_record changes what it produces, so that incremental builds
+# re-extract every folder
+EXTRACTOR_VERSION = 1
+# inputs of extract_record, relative to the program folder
+RECORD_INPUTS = [
+    "opt.p4",
+    "smith.tofino/pipe/metrics.json",
+    "smith.tofino/pipe/logs/resources.json",
+    "smith.tofino/pipe/logs/table_dependency_summary.log",
+]
 
 def debug_print(msg):
     # Uncomment the next line to enable debug printing
@@ -24,118 +38,17 @@ def info_print(msg):
     #print(f"INFO: {msg}")
     pass
 ### Table Graph Processing BEGIN
-# dependancy bits
-DEPENDENCY_ATTRS = {
-    # "NONE": 1, These two does not show up
-    # "CONCURRENT": 0
-    "CONTROL_ACTION": 1,
-    "CONTROL_COND_TRUE": 1,
-    "CONTROL_COND_FALSE": 1,
-    "CONTROL_TABLE_HIT": 1,
-    "CONTROL_TABLE_MISS": 1,
-    "CONTROL_DEFAULT_NEXT_TABLE": 1,
-    "CONTROL_EXIT": 1,
-
-    "ANTI_EXIT": (1 << 1),
-    "ANTI_TABLE_READ": (1 << 1),
-    "ANTI_ACTION_READ": (1 << 1),
-    "ANTI_NEXT_TABLE_DATA": (1 << 1),
-    "ANTI_NEXT_TABLE_CONTROL": (1 << 1),
-    "ANTI_NEXT_TABLE_METADATA": (1 << 1),
-
-    "IXBAR_READ": (1 << 2),
-    "ACTION_READ": (1 << 2),
-    "OUTPUT": (1 << 2),
-
-    # ignore these 3, they are rare
-    # "REDUCTION_OR_READ": (1 << 10),
-    # "REDUCTION_OR_OUTPUT": (1 << 11),
-    # "CONT_CONFLICT": (1 << 12),
-
-
-
-}
-
-def dependency_to_bitvector(dep_str):
-    """Given a space-separated dependency string, return a 3-bit binary list."""
-    bitmask = 0
-    for token in dep_str.split():
-        if token in DEPENDENCY_ATTRS:
-            bitmask |= DEPENDENCY_ATTRS[token]
-        else:
-            debug_print(f"Unencoded dependency token: {token}")
-    return bitmask
-
-def clean_node_name(raw_name):
-    # Remove everything in parentheses
-    return re.sub(r"\(.*?\)", "", raw_name).strip()
 def save_to_json(obj, output_path):
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(obj, f, indent=2)
 
 def process_table_dependency_summary(filepath):
-    graph = nx.DiGraph()
-    table_list = []
-    dependency_matrix = []
-    dependency_char_map = {}
-
-    with open(filepath, 'r') as f:
-        lines = f.readlines()
-
-    parsing_dependencies = False
-
-    for line in lines:
-        line = line.strip()
-
-        if line.startswith("#dependencies"):
-            parsing_dependencies = True
-            continue
-
-        if parsing_dependencies:
-            if not line or line.startswith("#") or ":" not in line:
-                continue
-            # A : IXBAR_READ OUTPUT ...
-            key, val = line.split(":", 1)
-            dependency_char_map[key.strip()] = val.strip()
-            continue
-
-        if line.startswith("#stage") or line.startswith("#pipeline") or line.startswith("***") or line.startswith("#") or not line:
-            continue
-
-        if "^" in line:
-            parts = line.split("^")
-            prefix = parts[0].strip()
-            table_info = parts[1].strip().split(":")[0].strip().split("-")[-1].strip()
-            table_name = clean_node_name(table_info)
-            dep_labels = [c for c in prefix.strip().replace(' ', '').strip()]
-            dependency_matrix.append(dep_labels)
-            table_list.append(table_name)
-            graph.add_node(table_name, label=table_name)
-    # Build the graph
-    for i, deps in enumerate(dependency_matrix):
-        for j, label in enumerate(deps):
-            if label.isalpha():
-                src = table_list[j]
-                dst = table_list[i]
-                deps_vec = dependency_to_bitvector(dependency_char_map[label])
-                graph.add_edge(src, dst, labels={deps_vec})
-
-    # Convert to GNN format
-    node_names = list(graph.nodes())
-    node_to_id = {name: idx for idx, name in enumerate(node_names)}
-    
-    edge_index = [[], []]
-    edge_attr = []
-
-    for src, dst, data in graph.edges(data=True):
-        edge_index[0].append(node_to_id[src])
-        edge_index[1].append(node_to_id[dst])
-        edge_attr.append(bin(list(data['labels'])[0])[2:]) 
-
+    """Table graph of a table_dependency_summary.log, in the dataset record format."""
+    [node_names, edge_index, edge_masks] = parse_table_dependency_summary(filepath)
     gnn_data = {
         "nodes": node_names,
         "edge_index": edge_index,
-        "edge_attr": edge_attr
+        "edge_attr": [bin(mask)[2:] for mask in edge_masks]
     }
 
     return gnn_data
@@ -144,23 +57,30 @@ def process_table_dependency_summary(filepath):
 
 ### JSON Processing
 
+# the labels read from the compiler JSON files, see json_paths
+RESOURCE_LABELS = {"mau_stages": ["resources.mau.mau_stages", LENGTH]}
+METRICS_LABELS = {
+    "latency": ["mau.latency", VALUE],
+    "sram": ["mau.srams", VALUE],
+    "tcam": ["mau.tcams", VALUE],
+}
+# stream the compiler JSON files (needs ijson) instead of parsing them whole
+STREAM_JSON = True
+
 # currently we only want mau usage from the resources.json file
 def process_resource_json(json_file):
     """
     Reads a JSON file and fetches the size of the list at 'resources' -> 'mau' -> 'mau_stages'.
     """
     try:
-        with open(json_file, 'r') as file:
-            data = json.load(file)
-            
-            mau_stages = data.get("resources", {}).get("mau", {}).get("mau_stages", [])
-            
-            if isinstance(mau_stages, list):
-                return len(mau_stages)
-            else:
-                print(f"Error in {json_file}: 'mau_stages' is not a list.")
-                return -1
-    except (FileNotFoundError, json.JSONDecodeError) as e:
+        labels = extract_json_paths(json_file, RESOURCE_LABELS, STREAM_JSON)
+        mau_stages = labels.get("mau_stages", 0)
+        if mau_stages is not None:
+            return mau_stages
+        else:
+            print(f"Error in {json_file}: 'mau_stages' is not a list.")
+            return -1
+    except (FileNotFoundError, ValueError) as e:
         print(f"Error reading {json_file}: {e}")
         return -1
     except Exception as e:
@@ -169,113 +89,19 @@ def process_resource_json(json_file):
 
 def process_metrics_json(json_file):
     try:
-        with open(json_file, 'r') as file:
-            data = json.load(file)
-            
-            latency = data.get("mau", {}).get("latency", None)
-            sram = data.get("mau", {}).get("srams", None)
-            tcam = data.get("mau", {}).get("tcams", None)
-            if isinstance(latency, list):
-                return [latency, sram, tcam]
-            else:
-                print(f"Error in {json_file}: 'latency' is not a list.")
-                return -1
-    except (FileNotFoundError, json.JSONDecodeError) as e:
+        labels = extract_json_paths(json_file, METRICS_LABELS, STREAM_JSON)
+        latency = labels.get("latency", None)
+        sram = labels.get("sram", None)
+        tcam = labels.get("tcam", None)
+        if isinstance(latency, list):
+            return [latency, sram, tcam]
+        else:
+            print(f"Error in {json_file}: 'latency' is not a list.")
+            return -1
+    except (FileNotFoundError, ValueError) as e:
         print(f"Error reading {json_file}: {e}")
         return -1
 
-def load_all_node_attrs_and_labels(directory):
-    all_node_attrs = []
-    all_labels = []
-
-    file_paths = []
-
-    for root, _, files in os.walk(directory):
-        for filename in files:
-            if filename.endswith(".json"):
-                path = os.path.join(root, filename)
-                file_paths.append(path)
-                with open(path, "r") as f:
-                    data = json.load(f)
-                    if "node_attr" in data:
-                        all_node_attrs.extend(data["node_attr"])
-                    if "y" in data and isinstance(data["y"], list):
-                        all_labels.extend([data["y"]])
-    # print dimensions
-    info_print(f"Number of node attributes: {len(all_node_attrs)}")
-    info_print(f"Number of labels: {len(all_labels)}")
-    return file_paths, np.array(all_node_attrs, dtype=np.float32), np.array(all_labels, dtype=np.float32)
-
-def z_score(data):
-    mean = np.mean(data, axis=0)
-    std = np.std(data, axis=0)
-
-    if np.isscalar(std):
-        std = std if std != 0 else 1.0
-    else:
-        std[std == 0] = 1.0
-
-    return (data - mean) / std, mean, std
-
-def normalize_and_update_files(file_paths, node_mean, node_std, label_mean, label_std):
-
-    for i, path in enumerate(tqdm(file_paths, desc="Normalizing")):
-        with open(path, "r") as f:
-            data = json.load(f)
-
-        if "node_attr" in data:
-            x = np.array(data["node_attr"], dtype=np.float32)
-            data["node_attr_normalized"] = ((x - node_mean) / node_std).tolist()
-
-        if "y" in data and isinstance(data["y"], list):
-            y = np.array(data["y"], dtype=np.float32)
-            data["y_normalized"] = ((y - label_mean) / label_std).tolist()
-
-        with open(path, "w") as f:
-            json.dump(data, f, indent=2)
-
-def plot_distribution(data, prefix):
-    num_features = data.shape[1]
-    for i in range(num_features):
-        plt.hist(data[:, i], bins=20, alpha=0.7)
-        if prefix == "node_attr":
-            name = f"{prefix}_{NODE_ATTRIBUTES[i]}"
-        else:
-            name = f"{prefix}_{LABEL_ATTRIBUTES[i]}"
-        plt.title(f"Distribution of {name}")
-        plt.xlabel(f"{name}")
-        plt.ylabel("Frequency")
-        plt.grid(True)
-        if prefix == "node_attr":
-            plt.savefig(f"{name}_distribution.png")
-        else:
-            plt.savefig(f"{name}_distribution.png")
-        plt.close()
-
-def normalize_node_attr_and_label(directory):
-    file_paths, all_node_attrs, all_labels = load_all_node_attrs_and_labels(directory)
-
-    # Normalize
-    norm_node_attr, node_mean, node_std = z_score(all_node_attrs)
-    norm_labels, label_mean, label_std = z_score(all_labels)
-    # store the means and stds
-    with open("means_stds.json", "w") as f:
-        json.dump({
-            "node_mean": node_mean.tolist(),
-            "node_std": node_std.tolist(),
-            "label_mean": label_mean.tolist(),
-            "label_std": label_std.tolist()
-        }, f, indent=2)
-    # Plot
-    plot_distribution(all_node_attrs, "node_attr")
-    plot_distribution(all_labels, "y")
-
-    # # # Update files
-    normalize_and_update_files(file_paths, node_mean, node_std, label_mean, label_std)
-
-    info_print("All files updated with normalized features.")
-
-
 ### JSON Processing END
 
 ### Node feature extraction
@@ -314,55 +140,185 @@ def extract_table_vector(table, actions_dict):
     debug_print(f"Table: {table}, Feature vector: {feature_vector}")
     return feature_vector
 
+class BatchExtractor:
+    """
+    A long-lived 'p4lacpp --batch -' process: program paths are written to its stdin and
+    their features are read back from a pipe (--feature-fd), one JSON line per program,
+    so the frontend starts once per worker instead of once per program and nothing it
+    prints to stdout can be mistaken for a result.
+    """
+
+    def __init__(self, executable=P4LACPP):
+        self.executable = executable
+        self.proc = None
+        self.results = None
+
+    def _start(self):
+        read_fd, write_fd = os.pipe()
+        try:
+            # stdout and stderr are not read, they must not be pipes that could fill up
+            # and block p4lacpp
+            self.proc = subprocess.Popen([self.executable, "--batch", "-", "--feature-fd", str(write_fd)],
+                                         pass_fds=(write_fd,), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        except Exception:
+            os.close(read_fd)
+            raise
+        finally:
+            # only p4lacpp keeps the write end, so reading hits EOF when it exits
+            os.close(write_fd)
+        self.results = os.fdopen(read_fd, "r")
+
+    def features(self, p4_file):
+        """Returns the features of p4_file as p4lacpp -f writes them, None on failure."""
+        if self.proc is None or self.proc.poll() is not None:
+            self.close()
+            self._start()
+        try:
+            self.proc.stdin.write(os.path.abspath(p4_file) + "\n")
+            self.proc.stdin.flush()
+            line = self.results.readline()
+        except OSError:
+            line = ""
+        if line == "":
+            # p4lacpp died on this program, the next one restarts it
+            print(f"Error running p4lacpp on {p4_file}: extractor exited")
+            self.close()
+            return None
+        result = json.loads(line)
+        if "error" in result:
+            print(f"Error running p4lacpp on {p4_file}: {result['error']}")
+            return None
+        return result["features"]
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+            self.proc.wait()
+            self.proc = None
+        if self.results is not None:
+            self.results.close()
+            self.results = None
+
+# the BatchExtractor of a worker process, see init_worker
+batch_extractor = None
+
+def init_worker(p4lacpp, stream_json, keep_node_features, batch):
+    """
+    ProcessPoolExecutor initializer: applies the settings of the main process, which a
+    worker does not inherit unless it is forked, and with batch gives the worker its own
+    BatchExtractor.
+    """
+    global P4LACPP, STREAM_JSON, KEEP_NODE_FEATURES, batch_extractor
+    P4LACPP = p4lacpp
+    STREAM_JSON = stream_json
+    KEEP_NODE_FEATURES = keep_node_features
+    batch_extractor = BatchExtractor(p4lacpp) if batch else None
+
+def run_p4lacpp(p4_file):
+    """
+    Runs p4lacpp once on p4_file, returns its features (None on failure). They are read
+    from a pipe (p4lacpp --feature-fd), no file is written.
+    """
+    read_fd, write_fd = os.pipe()
+    try:
+        proc = subprocess.Popen([P4LACPP, p4_file, "--feature-fd", str(write_fd)],
+                                pass_fds=(write_fd,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except Exception as e:
+        os.close(read_fd)
+        print(f"Error running p4lacpp on {p4_file}: {e}")
+        return None
+    finally:
+        # only p4lacpp keeps the write end, so reading stops when it exits
+        os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as pipe:
+        output = pipe.read()
+    returncode = proc.wait()
+    if returncode != 0 or not output:
+        print(f"Error running p4lacpp on {p4_file}: exit status {returncode}")
+        return None
+    return json.loads(output)
+
+class ActionIndex:
+    """
+    Resolves the synthesized action tables (tbl_<name>) of a program to the first of its
+    actions, in declaration order, whose name contains <name>. Built once per program,
+    with the action names joined into one newline-separated buffer: a lookup is still a
+    linear scan, but a single str.find over that buffer instead of one `in` test per
+    action, and a bisect over the name offsets turns the match position into the action.
+    Results are cached per pattern.
+    """
+
+    SEPARATOR = "\n"
+
+    def __init__(self, action_names):
+        self.names = list(action_names)
+        self.starts = []
+        offset = 0
+        for name in self.names:
+            self.starts.append(offset)
+            offset += len(name) + len(self.SEPARATOR)
+        self.buffer = self.SEPARATOR.join(self.names)
+        self.resolved = {}
+
+    def find(self, pattern):
+        """Returns the first action whose name contains pattern, None if there is none."""
+        if pattern in self.resolved:
+            return self.resolved[pattern]
+        if self.SEPARATOR in pattern:
+            # could match across two names, P4 names never contain it anyway
+            action = next((name for name in self.names if pattern in name), None)
+        else:
+            pos = self.buffer.find(pattern)
+            action = self.names[bisect.bisect_right(self.starts, pos) - 1] if pos >= 0 and self.names else None
+        self.resolved[pattern] = action
+        return action
+
 def extract_node_features(p4_file,gnn_data):
     node_names = gnn_data["nodes"]
-    output_file = os.path.join(os.path.dirname(p4_file), "node_features.json")
-    with open(output_file, 'w') as file:
-        try:
-            subprocess.run(
-                [P4LACPP, p4_file,"-f",file.name],
-                stderr=subprocess.PIPE,
-                check=True
-            )
-        except Exception as e:
-            print(f"Error running p4lacpp on {p4_file}: {e}")
-            return
-    with open(output_file, 'r') as file:
-        data = json.load(file)
-        # TODO: egress
-        ingress = data.get("ingress", {})
-        tables = ingress.get("tables", {})
-        actions = ingress.get("actions", {})
-        node_attr = []
-
-        for node in node_names:
-            if node in tables:
-                table = tables[node]
+    data = batch_extractor.features(p4_file) if batch_extractor is not None else run_p4lacpp(p4_file)
+    if data is None:
+        return
+    if KEEP_NODE_FEATURES:
+        save_to_json(data, os.path.join(os.path.dirname(p4_file), NODE_FEATURES))
+    # TODO: egress
+    ingress = data.get("ingress", {})
+    tables = ingress.get("tables", {})
+    actions = ingress.get("actions", {})
+    action_index = ActionIndex(actions)
+    node_attr = []
+
+    for node in node_names:
+        if node in tables:
+            table = tables[node]
+            feature_vector = extract_table_vector(table, actions)
+            node_attr.append(feature_vector)
+        elif "tbl_" in node:
+            # Hao: I later limited this case, no action in the apply (i think so..)
+            debug_print(f"Node {node} is an action table.")
+            feature_vector = [0, 0, 0, 0, 0, 1]
+            # the first action containing the string with tbl_ removed
+            action = action_index.find(node[4:])
+            if action is not None:
+                table = {"size": 0, "actions": [action], "matches": []}
                 feature_vector = extract_table_vector(table, actions)
-                node_attr.append(feature_vector)
-            elif "tbl_" in node:
-                # Hao: I later limited this case, no action in the apply (i think so..)
-                debug_print(f"Node {node} is an action table.")
-                feature_vector = [0, 0, 0, 0, 0, 1]
-                for action in actions:
-                    # check if the string with tbl_ removed is in the action name
-                    if node[4:] in action:
-                        table = {"size": 0, "actions": [action], "matches": []}
-                        feature_vector = extract_table_vector(table, actions)
-                        debug_print(f"Node {node} is an action table with action {action}.")
-                        debug_print(f"Feature vector: {feature_vector}")
-                        break
-                node_attr.append(feature_vector)
-            else:
-                print(f"Node {node} is not a table or action table.")
-                # set unknown table to 1
-                node_attr.append([0, 0, 0, 0, 0, 1])
-        gnn_data["node_attr"] = node_attr
+                debug_print(f"Node {node} is an action table with action {action}.")
+                debug_print(f"Feature vector: {feature_vector}")
+            node_attr.append(feature_vector)
+        else:
+            print(f"Node {node} is not a table or action table.")
+            # set unknown table to 1
+            node_attr.append([0, 0, 0, 0, 0, 1])
+    gnn_data["node_attr"] = node_attr
     return gnn_data
     
-def process_single_p4_folder(root):
+def extract_record(root):
     """
-    Processes a single P4 folder.
+    Extracts the dataset record of a single P4 folder: its table graph, node features and
+    labels. Returns [root, record], record being None on failure.
     """
     try:
         resource_file = os.path.join(root, "smith.tofino/pipe", "logs/resources.json")
@@ -403,70 +359,205 @@ def process_single_p4_folder(root):
 
         gnn_data = extract_node_features(os.path.join(root, "opt.p4"), gnn_data)
         gnn_data["y"] = [mau_len, lat, sram, tcam]
-
-        output_file = os.path.join(root, "data.json")
-        save_to_json(gnn_data, output_file)
-
-        return (root, "success")
+        return [root, gnn_data]
 
     except Exception as e:
-        return (root, f"error: {e}")
+        print(f"Failed processing {root}: {e}")
+        return [root, None]
 
-def process_p4_folders(root_dir, num_workers=4):
+def extractor_version(executable):
     """
-    Recursively finds P4 program folders and processes their JSON files using multiprocessing.
+    Identifies the extractor: EXTRACTOR_VERSION plus the size and mtime of the p4lacpp
+    executable, so that rebuilding p4lacpp invalidates the incremental dataset.
     """
-    p4_dirs = []
+    path = shutil.which(executable) or executable
+    try:
+        stat = os.stat(path)
+        return f"{EXTRACTOR_VERSION}|{stat.st_size}|{stat.st_mtime_ns}"
+    except OSError:
+        return f"{EXTRACTOR_VERSION}|{path}"
 
-    for root, _, files in os.walk(root_dir):
-        if any(file.endswith("smith.p4") for file in files):
-            p4_dirs.append(root)
-    process_bar = tqdm(total=len(p4_dirs), desc="Processing P4 folders", unit="folder")
-    with ProcessPoolExecutor(max_workers=num_workers) as executor:
-        futures = {executor.submit(process_single_p4_folder, folder): folder for folder in p4_dirs}
-        for future in as_completed(futures):
-            process_bar.update(1)
-            folder = futures[future]
-            try:
-                result = future.result()
-                info_print(f"Finished {result[0]}: {result[1]}")
-            except Exception as e:
-                print(f"Failed processing {folder}: {e}")
+def folder_fingerprint(folder, version):
+    """
+    Fingerprint of the inputs of extract_record(folder): size and mtime of the
+    RECORD_INPUTS and the extractor version. Only stats files, hashing the compiler
+    outputs of a large dataset would cost as much as extracting them.
+    """
+    h = hashlib.sha256(version.encode())
+    for name in RECORD_INPUTS:
+        try:
+            stat = os.stat(os.path.join(folder, name))
+            h.update(f"\0{name}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+        except OSError:
+            h.update(f"\0{name}|-".encode())
+    return h.hexdigest()
 
-def copy_p4_programs_to_dataset(root_dir):
+def find_p4_folders(root_dir, manifest=None, marker="smith.p4"):
     """
-    Recursively finds P4 programs and copies them along with 'data.json' to the 'dataset' folder.
+    Yields the P4 program folders, from the manifest's successful attempts if there is one,
+    otherwise by walking root_dir for folders containing a file ending with `marker`.
     """
-    dataset_dir = "dataset"
-    os.makedirs(dataset_dir, exist_ok=True)
-    
+    if manifest is not None:
+        for row in manifest.iter_attempts(STATUS_SUCCESS):
+            if row["folder"] is not None:
+                yield manifest.abspath(row["folder"])
+        return
     for root, _, files in os.walk(root_dir):
         # skip dataset folder
         if 'dataset' in root.split(os.sep):
             continue
-        if any(file.endswith("opt.p4") for file in files):
-            folder_name = os.path.basename(root)
-            os.makedirs(dataset_dir, exist_ok=True)
-            
-            for file in files:
-                if file == "data.json": #or file == "node_features.json" or file.endswith("opt.p4"):
-                    src_path = os.path.join(root, file)
-                    # copy to a file with the same name as the source folder
-                    dst_path = os.path.join(dataset_dir,folder_name+".json")
-                    shutil.copy2(src_path, dst_path)
-                    debug_print(f"Copied {src_path} to {dst_path}")
+        if any(file.endswith(marker) for file in files):
+            yield root
+
+def record_name(folder):
+    """Dataset file name of the record of folder."""
+    return os.path.basename(os.path.normpath(folder)) + ".json"
+
+def build_dataset(root_dir, output_dir, num_workers=4, manifest=None, batch=True, full_rebuild=False):
+    """
+    Builds the dataset in one streaming pass: the records of the P4 program folders are
+    extracted in parallel (at most 2 * num_workers folders in flight) and written once to
+    <output_dir>/<folder name>.json. With batch, see BatchExtractor. A folder whose
+    extraction fails, or whose worker crashes, is recorded as failed and loses its
+    previous record; a crashed pool is replaced and the build goes on.
+
+    The build is incremental: <output_dir>/DATASET_MANIFEST_NAME keeps the fingerprint
+    (see folder_fingerprint) of every extracted folder, and folders whose fingerprint did
+    not change since their last successful extraction are skipped; failed folders are
+    retried. Records of folders that disappeared are removed. full_rebuild extracts
+    every folder again. The shard statistics of the output
+    (see dataset_stats) and its normalization statistics, saved to <output_dir>/MEANS_STDS,
+    are merged from the per-record statistics kept in the manifest, so memory does not
+    grow with the dataset.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    dataset_manifest = DatasetManifest(os.path.join(output_dir, DATASET_MANIFEST_NAME))
+    # every recorded folder, so that the records of vanished ones are removed even on a
+    # full rebuild, which only stops skipping the extracted ones
+    known = dataset_manifest.fingerprints()
+    extracted = {} if full_rebuild else dataset_manifest.fingerprints(RECORD_OK)
+    version = extractor_version(P4LACPP)
+    seen = set()
+    skipped = 0
+
+    def changed_folders():
+        nonlocal skipped
+        for folder in find_p4_folders(root_dir, manifest):
+            key = os.path.relpath(os.path.abspath(folder), root_dir)
+            seen.add(key)
+            fingerprint = folder_fingerprint(folder, version)
+            if extracted.get(key) == fingerprint:
+                skipped += 1
+                continue
+            yield [folder, key, fingerprint]
+
+    folders = changed_folders()
+    process_bar = tqdm(desc="Processing P4 folders", unit="folder")
+    pool_args = {"initializer": init_worker, "initargs": (P4LACPP, STREAM_JSON, KEEP_NODE_FEATURES, batch)}
+    written = 0
+    executor = ProcessPoolExecutor(max_workers=num_workers, **pool_args)
+    try:
+        # future -> [folder, key, fingerprint, executor]
+        futures = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(futures) < 2 * num_workers:
+                entry = next(folders, None)
+                if entry is None:
+                    exhausted = True
+                else:
+                    futures[executor.submit(extract_record, entry[0])] = entry + [executor]
+            if not futures:
+                break
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                process_bar.update(1)
+                [folder, key, fingerprint, pool] = futures.pop(future)
+                try:
+                    [_, record] = future.result()
+                except Exception as e:
+                    # e.g. a worker killed by the OOM killer, which breaks the whole pool:
+                    # every folder in flight fails with it and a new pool takes over
+                    print(f"Failed processing {folder}: {e}")
+                    record = None
+                    if isinstance(e, BrokenProcessPool) and pool is executor:
+                        executor.shutdown(wait=True)
+                        executor = ProcessPoolExecutor(max_workers=num_workers, **pool_args)
+                if record is None or "node_attr" not in record:
+                    # the record of the previous extraction is stale
+                    stale = os.path.join(output_dir, record_name(folder))
+                    if os.path.exists(stale):
+                        os.remove(stale)
+                    dataset_manifest.put(key, fingerprint, RECORD_FAILED)
+                    continue
+                node_stats = RunningStats(len(NODE_ATTRIBUTES))
+                node_stats.update(record["node_attr"])
+                node_sketch = QuantileSketch(len(NODE_ATTRIBUTES))
+                node_sketch.update(record["node_attr"])
+                name = record_name(folder)
+                with open(os.path.join(output_dir, name), "w") as f:
+                    json.dump(record, f)
+                dataset_manifest.put(key, fingerprint, RECORD_OK, name,
+                                     {"node": node_stats.to_dict(), "node_sketch": node_sketch.to_dict(),
+                                      "y": record["y"]})
+                written += 1
+    finally:
+        executor.shutdown(wait=True)
+    process_bar.close()
+
+    removed = 0
+    for key in set(known) - seen:
+        name = dataset_manifest.remove(key)
+        if name is not None and os.path.exists(os.path.join(output_dir, name)):
+            os.remove(os.path.join(output_dir, name))
+        removed += 1
+
+    [node_stats, label_stats, node_sketch, label_sketch] = new_shard_stats(len(NODE_ATTRIBUTES), len(LABEL_ATTRIBUTES))
+    for stats in dataset_manifest.iter_stats():
+        node_stats.merge_dict(stats["node"])
+        label_stats.update(stats["y"])
+        label_sketch.update(stats["y"])
+        # records extracted before the sketches were kept leave the dataset without them
+        if node_sketch is not None and "node_sketch" in stats:
+            node_sketch.merge_dict(stats["node_sketch"])
+        else:
+            node_sketch = None
+    shard_stats = [node_stats, label_stats, node_sketch, label_sketch]
+    write_shard_stats(output_dir, shard_stats)
+    save_to_json(means_stds(shard_stats), os.path.join(output_dir, MEANS_STDS))
+    print(f"Extracted {written} records, skipped {skipped} unchanged folders, removed {removed} records; "
+          f"{dataset_manifest.count(RECORD_OK)} records in {output_dir}.")
+    dataset_manifest.close()
 
 
 def main():
+    global P4LACPP, STREAM_JSON, KEEP_NODE_FEATURES
     parser = argparse.ArgumentParser(description="Find P4 programs recursively and parse their JSON files for perf. Move them to dataset folder.")
     parser.add_argument("-d", "--directory", type=str, required=True, help="Root directory to search for P4 programs.")
     parser.add_argument("-o", "--output", type=str, default="dataset", help="Output directory for the dataset.")
     parser.add_argument("-w", "--workers", type=int, default=4, help="Number of worker processes.")
+    parser.add_argument("--manifest", type=str, default="",
+                        help="Path to the run_smith.py manifest (default: the one in --directory, if any).")
+    parser.add_argument("--p4lacpp", type=str, default=P4LACPP, help=f"p4lacpp executable (default: {P4LACPP}).")
+    parser.add_argument("--no-batch", action="store_true",
+                        help="Run p4lacpp once per program instead of one --batch p4lacpp per worker.")
+    parser.add_argument("--keep-node-features", action="store_true",
+                        help=f"Also write the p4lacpp features of every program to {NODE_FEATURES} in its folder.")
+    parser.add_argument("--plot", action="store_true",
+                        help="Plot the distributions of the node attributes and labels (see dataset_stats.py report).")
+    parser.add_argument("--no-stream-json", action="store_true",
+                        help="Parse the compiler JSON files whole instead of streaming the labels out of them.")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help=f"Extract every folder again instead of only new and changed ones (see {DATASET_MANIFEST_NAME}).")
     args = parser.parse_args()
     
-    process_p4_folders(args.directory, args.workers)
-    copy_p4_programs_to_dataset(args.directory)
-    normalize_node_attr_and_label(args.output)
+    P4LACPP = args.p4lacpp
+    STREAM_JSON = not args.no_stream_json
+    KEEP_NODE_FEATURES = args.keep_node_features
+    manifest = RunManifest.find(args.directory, args.manifest)
+    build_dataset(args.directory, args.output, args.workers, manifest, not args.no_batch, args.full_rebuild)
+    if args.plot:
+        plot_report(dataset_report(args.output, args.workers))
 # exp python3 ./code_gen_data_collect/parse_performance.py -d . 
 if __name__ == "__main__":
     main()
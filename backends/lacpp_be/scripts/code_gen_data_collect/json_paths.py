@@ -0,0 +1,122 @@
+import json
+
+# Selective extraction of a few values from large JSON files (the compiler's
+# resources.json and metrics.json run to many megabytes for big programs).
+#
+# A request maps a name to [path, mode]: path is the dotted key path of the value
+# ("mau.latency"), mode is "value" for the value itself or "length" for the length of
+# a list, which is counted from the parser events instead of building the list. With
+# ijson installed the file is streamed: only the requested values are built and reading
+# stops as soon as they are all complete. Otherwise it is parsed whole with orjson, or json.
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+VALUE = "value"
+LENGTH = "length"
+
+
+def _select(data, request):
+    """extract_json_paths on an already parsed document."""
+    found = {}
+    for name, [path, mode] in request.items():
+        value = data
+        for key in path.split("."):
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            if mode == LENGTH:
+                found[name] = len(value) if isinstance(value, list) else None
+            else:
+                found[name] = value
+    return found
+
+
+# the ijson events that begin a value: a whole scalar, or the start of a map or list
+_VALUE_EVENTS = {"null", "boolean", "integer", "double", "number", "string", "start_map", "start_array"}
+
+
+def _stream_length(json_file, path):
+    """
+    Length of the list at path, or [None] if it is not a list, in a single pass over the
+    parser events: the items are counted by the events that start them, nothing is
+    built, and reading stops at the end of the list. None if path is missing.
+    """
+    item = f"{path}.item"
+    count = 0
+    with open(json_file, "rb") as f:
+        for prefix, event, _ in ijson.parse(f, use_float=True):
+            if prefix == item:
+                if event in _VALUE_EVENTS:
+                    count += 1
+            elif prefix == path:
+                if event == "end_array":
+                    return [count]
+                if event != "start_array":
+                    return [None]
+    return None
+
+
+def _stream_values(json_file, request):
+    """
+    The VALUE requests, in a single pass: the children of the deepest map holding all
+    the paths are built one by one and reading stops once every path is resolved.
+    """
+    paths = {name: path.split(".") for name, [path, _] in request.items()}
+    parent = []
+    for keys in zip(*[keys[:-1] for keys in paths.values()]):
+        if len(set(keys)) != 1:
+            break
+        parent.append(keys[0])
+    depth = len(parent)
+    found = {}
+    pending = set(request)
+    with open(json_file, "rb") as f:
+        for key, value in ijson.kvitems(f, ".".join(parent), use_float=True):
+            for name in [name for name in pending if paths[name][depth] == key]:
+                found.update(_select(value, {name: [".".join(paths[name][depth + 1:]), VALUE]})
+                             if len(paths[name]) > depth + 1 else {name: value})
+                pending.discard(name)
+            if not pending:
+                break
+    return found
+
+
+def _stream(json_file, request):
+    """extract_json_paths with ijson: the filtering by path is done by its C backend."""
+    found = {}
+    values = {}
+    for name, [path, mode] in request.items():
+        if mode == LENGTH:
+            length = _stream_length(json_file, path)
+            if length is not None:
+                found[name] = length[0]
+        else:
+            values[name] = [path, mode]
+    if values:
+        found.update(_stream_values(json_file, values))
+    return found
+
+
+def extract_json_paths(json_file, request, streaming=True):
+    """
+    Returns {name: value} for the [path, mode] request of each name (see above); paths
+    missing from the file are missing from the result, a LENGTH of something that is not
+    a list is None. Raises OSError, and ValueError on malformed JSON.
+    """
+    if streaming and ijson is not None:
+        try:
+            return _stream(json_file, request)
+        except ijson.JSONError as e:
+            raise ValueError(f"{json_file}: {e}") from e
+    with open(json_file, "rb") as f:
+        data = orjson.loads(f.read()) if orjson is not None else json.load(f)
+    return _select(data, request)
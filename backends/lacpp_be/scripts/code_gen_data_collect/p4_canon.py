@@ -0,0 +1,125 @@
+import hashlib
+import re
+
+# Canonical form of a P4 program, used to drop structurally identical programs
+# before they are compiled. The canonical form
+#   * drops comments and whitespace,
+#   * sorts the top-level declarations by their shape (the declaration with all
+#     program-defined identifiers blanked out),
+#   * renames program-defined identifiers to id0, id1, ... in order of first use.
+# Only identifiers declared by the program itself are renamed; keywords and names
+# coming from the architecture (tna.p4 types, fields, methods, match kinds, ...) are
+# kept, so that e.g. an exact and a ternary match never hash the same.
+
+P4_KEYWORDS = {
+    "abstract", "action", "actions", "apply", "bit", "bool", "const", "control", "default",
+    "else", "entries", "enum", "error", "exit", "extern", "false", "header", "header_union",
+    "if", "in", "inout", "int", "key", "match_kind", "out", "package", "parser", "return",
+    "select", "state", "string", "struct", "switch", "table", "transition", "true", "tuple",
+    "type", "typedef", "value_set", "varbit", "void", "list", "priority", "size",
+    "default_action", "this", "_", "for", "break", "continue",
+}
+# keywords directly followed by the name they declare
+DECLARING_KEYWORDS = {
+    "action", "control", "enum", "extern", "header", "header_union", "package", "parser",
+    "state", "struct", "table",
+}
+
+TOKEN_RE = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<preproc>^[ \t]*\#[^\n]*)
+  | (?P<space>\s+)
+  | (?P<string>"(?:\\.|[^"\\])*")
+  | (?P<number>\d+[wsWS](?:0[xXbBoOdD])?[0-9a-fA-F_]+|0[xXbBoOdD][0-9a-fA-F_]+|\d[\d_]*)
+  | (?P<ident>[A-Za-z_]\w*)
+  | (?P<op>&&&|<<|>>|\+\+|\|\+\||\|-\||==|!=|<=|>=|&&|\|\||\.\.|\S)
+""", re.S | re.M | re.X)
+
+
+def tokenize(source):
+    """Returns the list of (kind, text) tokens of a P4 source, without comments and whitespace."""
+    tokens = []
+    for match in TOKEN_RE.finditer(source):
+        kind = match.lastgroup
+        if kind in ("comment", "space"):
+            continue
+        text = match.group()
+        if kind == "preproc":
+            text = " ".join(text.split())
+        tokens.append((kind, text))
+    return tokens
+
+
+def declared_identifiers(tokens):
+    """
+    Returns the identifiers the program declares: names following a declaring keyword
+    (`table t`), a type name (`h_t hdr`, `inout meta_t m`) or a type argument list (`bit<8> f`).
+    """
+    declared = set()
+    prev_kind, prev_text = None, None
+    for kind, text in tokens:
+        if kind == "ident" and text not in P4_KEYWORDS:
+            if prev_text in DECLARING_KEYWORDS or prev_text == ">" or \
+               (prev_kind == "ident" and prev_text not in P4_KEYWORDS):
+                declared.add(text)
+        prev_kind, prev_text = kind, text
+    return declared
+
+
+def split_declarations(tokens):
+    """Splits a token list into top-level declarations."""
+    decls = []
+    current = []
+    depth = 0
+    for i, (kind, text) in enumerate(tokens):
+        if kind == "preproc" and depth == 0:
+            if current:
+                decls.append(current)
+                current = []
+            decls.append([(kind, text)])
+            continue
+        current.append((kind, text))
+        if text in ("{", "(", "["):
+            depth += 1
+        elif text in ("}", ")", "]"):
+            depth -= 1
+            # a declaration ends with its closing brace, unless a ';' follows (initializers)
+            if text == "}" and depth == 0 and not (i + 1 < len(tokens) and tokens[i + 1][1] == ";"):
+                decls.append(current)
+                current = []
+        elif text == ";" and depth == 0:
+            decls.append(current)
+            current = []
+    if current:
+        decls.append(current)
+    return decls
+
+
+def canonicalize(source):
+    """Returns the canonical form of a P4 source as a string."""
+    tokens = tokenize(source)
+    declared = declared_identifiers(tokens)
+    decls = split_declarations(tokens)
+
+    def is_local(kind, text):
+        return kind == "ident" and text in declared
+
+    def shape(decl):
+        return " ".join("$" if is_local(kind, text) else text for kind, text in decl)
+
+    # stable sort, so declarations with the same shape keep their relative order
+    decls.sort(key=shape)
+    names = {}
+    out = []
+    for decl in decls:
+        for kind, text in decl:
+            if is_local(kind, text):
+                text = names.setdefault(text, f"id{len(names)}")
+            out.append(text)
+    return " ".join(out)
+
+
+def canonical_hash(p4_file):
+    """Returns the sha256 hex digest of the canonical form of a P4 file."""
+    with open(p4_file, "r", errors="replace") as f:
+        return hashlib.sha256(canonicalize(f.read()).encode()).hexdigest()
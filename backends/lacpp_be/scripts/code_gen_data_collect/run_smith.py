@@ -3,11 +3,25 @@ import subprocess
 import argparse
 import shutil
 from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
 import multiprocessing
-import concurrent.futures
 from tqdm import tqdm
 import random
+import re
+import signal
+import threading
+import time
+import hashlib
+import json
+from functools import partial
+from smith_manifest import RunManifest, MANIFEST_NAME, STATUS_GENERATED, STATUS_GEN_FAILED, \
+    STATUS_DUPLICATE, STATUS_SUCCESS, STATUS_FAILED, STATUS_REMOVED
+from p4_canon import canonical_hash
+from compile_cache import CompileCache, CACHE_ARTIFACTS, compiler_version, parse_size
+from dag_sweep import DagSweep, parse_values
+from admission import FootprintModel, MemoryAdmission, apply_limits, pin_worker, parse_cpu_list
+from telemetry import Telemetry, run_with_usage, usage_cpu
 
 def debug_print(*args, **kwargs):
     if False:
@@ -21,164 +35,719 @@ def info_print(*args, **kwargs):
     if False:
         print(*args, **kwargs)
 
-stop_ongoing_process = multiprocessing.Event()
+SMITH_DAG_NODE_NUM = "8"
+SMITH_DAG_DENSITY = "0.6"
+BF_COMPILE_TIMEOUT = 30
+# failed compilations whose log is worth keeping, see --keep-failed-logs
+INTERESTING_ERROR_CLASSES = ("compiler-bug", "timeout")
+FAILED_LOGS_DIR = "failed_logs"
+# written to the pipe folder once p4c-build-logs succeeded there, see run_p4c_build_logs
+BUILD_LOGS_MARKER = ".build_logs_done"
+# with --scratch-dir, the only files of a successful attempt copied to the output directory
+KEPT_ARTIFACTS = ["smith.p4"] + CACHE_ARTIFACTS
 
-def run_single_smith(smith_executable, p4c_barefoot):
+# a line of p4c output that dooms the compilation, e.g.
+#   smith.p4(12): [--Werror=type-error] error: ...
+#   Compiler Bug: ...
+FATAL_ERROR_RE = re.compile(r"(?:\[--Werror=(?P<werror>[\w-]+)\] )?error: |(?P<bug>Compiler Bug)")
+# the compiler ran into its RLIMIT_AS, see --compile-mem-limit
+OUT_OF_MEMORY_RE = re.compile(r"bad_alloc|[Oo]ut of [Mm]emory")
+
+def smith_command(smith_executable, seed, dag_node_num=SMITH_DAG_NODE_NUM, dag_density=SMITH_DAG_DENSITY):
+    return [smith_executable, "--target", "tofino", "--arch", "tna", "./smith.p4", "--seed", str(seed),
+            "--generate-dag", "--dag-node-num", str(dag_node_num), "--dag-density", str(dag_density)]
+
+def barefoot_command(p4c_barefoot, profile="full"):
     """
-    Runs a single instance of 'smith' until it succeeds.
+    The 'full' profile produces every debug output of p4c-barefoot. The 'labels' profile
+    only keeps what the dataset uses: logs/resources.json, logs/phv.json (for metrics.json),
+    table_dependency_summary.log and opt.p4 (the input of the feature extraction).
     """
-    attempts = 0
-    while True:
+    if profile == "labels":
+        return [p4c_barefoot, "./smith.p4", "--labels-only", "--target", "tofino", "--arch", "tna", "--verbose",
+                "--optimized-source", "opt.p4", "-Ttable_dependency_summary:3"]
+    return [p4c_barefoot, "./smith.p4", "-g", "--target", "tofino", "--arch", "tna", "--verbose", "--enable-event-logger",
+            "--optimized-source","opt.p4", "-Ttable_dependency_graph:3,table_dependency_summary:3,table_placement:5"]
 
-        if stop_ongoing_process.is_set():
-            return [None,attempts]
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+def metrics_command(p4c_build_logs):
+    """p4c-build-logs command producing only metrics.json, run in the pipe folder."""
+    return [p4c_build_logs, "./context.json", "--metrics-only", "--phv", "./logs/phv.json",
+            "--resources", "./logs/resources.json", "--power", "./logs/power.json",
+            "--manifest", "../manifest.json", "-o", "."]
 
+def build_metrics(folder, stem, p4c_build_logs):
+    """
+    Writes <stem>.tofino/pipe/metrics.json right after a 'labels' compilation, instead of
+    a later p4c-build-logs pass over the whole dataset. Returns [success, output_lines].
+    """
+    result = subprocess.run(metrics_command(p4c_build_logs), cwd=os.path.join(folder, f"{stem}.tofino", "pipe"),
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace")
+    return [result.returncode == 0, result.stdout.splitlines(keepends=True)]
+
+def generate_smith_program(seed, dag_node_num, dag_density, smith_executable, dedup=True, scratch_dir=""):
+    """
+    Stage 1 of the pipeline: runs 'smith' once with the given seed and DAG parameters in a
+    fresh folder, created in scratch_dir if given, in the current directory otherwise.
+    Returns [folder_name, gen_time, canon_hash, stages]; folder_name is None if generation
+    failed (the folder is removed). canon_hash is the canonical hash of smith.p4 (see
+    p4_canon) when dedup is enabled, None otherwise. stages holds the telemetry of the
+    'generate' and 'hash' stages, see telemetry.py.
+    """
+    while True:
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         folder_name = f"smith_run_{timestamp}_thread-{multiprocessing.current_process().pid}{random.randint(0, 1000000)}"
+        if scratch_dir != "":
+            folder_name = os.path.join(scratch_dir, folder_name)
         try:
             os.makedirs(folder_name)
+            break
         except FileExistsError:
             debug_print(f"Folder {folder_name} already exists. Retrying...")
-            continue
-        attempts += 1
-        debug_print(f"Running p4smith in {folder_name}...")
-        log_file_path = os.path.join(folder_name, "log.txt")
-        timedout = False
-        try:
-            with open(log_file_path, "w") as log_file:
-                smith_exec = [smith_executable, "--target", "tofino", "--arch", "tna", "./smith.p4", "--generate-dag", "--dag-node-num", "8", "--dag-density", "0.6"]
-                bf_exec = [p4c_barefoot, "./smith.p4", "-g", "--target", "tofino", "--arch", "tna", "--verbose", "--enable-event-logger", 
-                           "--optimized-source","opt.p4", "-Ttable_dependency_graph:3,table_dependency_summary:3,table_placement:5"
-                ]
-
-                subprocess.run(smith_exec,
-                               stdout=log_file, stderr=log_file, check=True, cwd=folder_name)
-                try:
-                    subprocess.run(bf_exec, stdout=log_file, stderr=subprocess.STDOUT,
-                                check=False, cwd=folder_name, timeout=30)
-                except subprocess.TimeoutExpired:
-                    timedout = True
-                
-                log_file.write(f"\n\n\nsmith command: {' '.join(smith_exec)}\n")
-                log_file.write(f"p4c_barefoot command: {' '.join(bf_exec)}")
-
-            found_zero_errors = False
-            with open(log_file_path, "r") as log_file:
-                found_zero_errors = any(line.startswith("0 errors") for line in log_file)
-
-            if found_zero_errors and not timedout:
-                debug_print(f"Success! Output stored in {folder_name}.")
-                return [folder_name, attempts]  # Successful run
-            else:
-                debug_print(f"Errors found in output. Deleting {folder_name} and retrying...")
-        
-        except Exception as e:
-            error_print(f"Execution failed: {e}. Deleting {folder_name} and retrying...")
-        shutil.rmtree(folder_name)  # Clean up before retrying
 
-def run_smith_parallel(num_repetitions, smith_executable, p4c_barefoot, num_workers):
+    debug_print(f"Running p4smith in {folder_name}...")
+    log_file_path = os.path.join(folder_name, "log.txt")
+    smith_exec = smith_command(smith_executable, seed, dag_node_num, dag_density)
+    start = time.monotonic()
+    stages = {}
+    try:
+        with open(log_file_path, "w") as log_file:
+            [returncode, cpu, max_rss] = run_with_usage(smith_exec, folder_name, log_file, log_file)
+            stages["generate"] = {"seconds": time.monotonic() - start, "cpu": cpu, "max_rss": max_rss}
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, smith_exec)
+            log_file.write(f"\n\n\nsmith command: {' '.join(smith_exec)}\n")
+        canon_hash = None
+        if dedup:
+            hash_start = time.monotonic()
+            canon_hash = canonical_hash(os.path.join(folder_name, "smith.p4"))
+            stages["hash"] = {"seconds": time.monotonic() - hash_start}
+        return [folder_name, time.monotonic() - start, canon_hash, stages]
+    except Exception as e:
+        error_print(f"Generation failed: {e}. Deleting {folder_name}...")
+    shutil.rmtree(folder_name, ignore_errors=True)
+    stages.setdefault("generate", {"seconds": time.monotonic() - start})
+    return [None, time.monotonic() - start, None, stages]
+
+def kill_process_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+def run_monitored(cmd, cwd, timeout, early_abort=True, limits=None):
+    """
+    Runs a compiler command and reads its merged stdout/stderr line by line while it runs.
+    With early_abort, the process is killed as soon as a fatal error line appears.
+    limits is [memory_bytes, cpu_seconds] (either may be None), applied to the compiler
+    with apply_limits.
+    Returns [success, error_class, output_lines, max_rss, usage]; error_class is None on
+    success, max_rss is the peak resident memory of the compiler in bytes and usage holds
+    its CPU time ("cpu") and the time spent matching its output ("scan"), in seconds.
+    """
+    preexec_fn = partial(apply_limits, *limits) if limits else None
+    # own process group, so that killing it also stops anything the compiler spawned
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=cwd,
+                            text=True, errors="replace", start_new_session=True,
+                            preexec_fn=preexec_fn)
+    timer = threading.Timer(timeout, kill_process_group, [proc])
+    timer.start()
+    lines = []
+    error_class = None
+    found_zero_errors = False
+    scan_time = 0.0
+    try:
+        for line in proc.stdout:
+            scan_start = time.perf_counter()
+            lines.append(line)
+            if line.startswith("0 errors"):
+                found_zero_errors = True
+            if error_class is None:
+                if OUT_OF_MEMORY_RE.search(line):
+                    error_class = "out-of-memory"
+                else:
+                    match = FATAL_ERROR_RE.search(line)
+                    if match:
+                        error_class = "compiler-bug" if match.group("bug") else (match.group("werror") or "error")
+                        if early_abort:
+                            kill_process_group(proc)
+            scan_time += time.perf_counter() - scan_start
+        # wait4 instead of proc.wait() for the peak memory of the compiler
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    finally:
+        timed_out = not timer.is_alive() and error_class is None and proc.returncode != 0
+        timer.cancel()
+        proc.stdout.close()
+    if proc.returncode == -signal.SIGXCPU:
+        error_class = "cpu-limit"
+    elif timed_out:
+        error_class = "timeout"
+    elif error_class is None and not found_zero_errors:
+        error_class = "no-summary"
+    return [error_class is None, error_class, lines, usage.ru_maxrss * 1024,
+            {"cpu": usage_cpu(usage), "scan": scan_time}]
+
+def save_failed_log(folder_name, error_class, lines, keep_failed_logs):
+    """
+    Persists the log of a failed compilation to FAILED_LOGS_DIR if it is worth keeping.
+    """
+    if keep_failed_logs == "none" or \
+       (keep_failed_logs == "interesting" and error_class not in INTERESTING_ERROR_CLASSES):
+        return
+    os.makedirs(FAILED_LOGS_DIR, exist_ok=True)
+    dst = os.path.join(FAILED_LOGS_DIR, f"{os.path.basename(os.path.normpath(folder_name))}.{error_class}.log")
+    with open(dst, "w") as out:
+        smith_log = os.path.join(folder_name, "log.txt")
+        if os.path.exists(smith_log):
+            with open(smith_log, "r") as log_file:
+                shutil.copyfileobj(log_file, out)
+        out.writelines(lines)
+
+def shard_folder(output_dir, name):
+    """Returns <output_dir>/smith_runs_<xx>/<name>, xx being the first byte of the hash of name."""
+    shard = hashlib.sha1(name.encode()).hexdigest()[:2]
+    return os.path.join(output_dir, f"smith_runs_{shard}", name)
+
+def materialize_artifacts(folder_name, output_dir):
     """
-    Runs 'smith' multiple times in parallel, dynamically retrying failed runs until success count is met.
+    Copies the KEPT_ARTIFACTS of a successful attempt from its scratch folder to its
+    shard_folder in output_dir and removes the scratch folder. Returns the new folder.
     """
+    dest = shard_folder(output_dir, os.path.basename(os.path.normpath(folder_name)))
+    for artifact in KEPT_ARTIFACTS:
+        artifact = artifact.format(stem="smith")
+        src = os.path.join(folder_name, artifact)
+        if os.path.exists(src):
+            dst = os.path.join(dest, artifact)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copyfile(src, dst)
+    shutil.rmtree(folder_name, ignore_errors=True)
+    return dest
 
-    def debug_print(*args, **kwargs):
-        if False:
-            print(*args, **kwargs)
-    manager = multiprocessing.Manager()
-    success_list = manager.list()
-    total_runs_cnt = multiprocessing.Value('i', 0)
+def compile_smith_program(folder_name, p4c_barefoot, keep_failed_logs="interesting",
+                          profile="full", p4c_build_logs="", output_dir="", limits=None):
+    """
+    Stage 2 of the pipeline: compiles a generated program with p4c-barefoot.
+    The compiler output is monitored while it runs and the compilation is aborted on
+    the first fatal error. With the 'labels' profile and p4c_build_logs, metrics.json
+    is built right away. With output_dir, the program was generated in a scratch folder
+    and its kept artifacts are moved to output_dir on success (see materialize_artifacts).
+    limits are the compiler resource limits, see run_monitored.
+    Returns [folder_name, success, compile_time, error_class, max_rss, stages], folder_name
+    being the final folder; the folder is removed if the compilation failed. stages holds
+    the telemetry of the 'compile', 'scan' and 'metrics' stages, see telemetry.py.
+    """
+    log_file_path = os.path.join(folder_name, "log.txt")
+    bf_exec = barefoot_command(p4c_barefoot, profile)
+    start = time.monotonic()
+    max_rss = None
+    stages = {}
+    try:
+        [success, error_class, lines, max_rss, usage] = run_monitored(bf_exec, folder_name, BF_COMPILE_TIMEOUT,
+                                                                      limits=limits)
+        stages["compile"] = {"seconds": time.monotonic() - start, "cpu": usage["cpu"], "max_rss": max_rss}
+        stages["scan"] = {"seconds": usage["scan"]}
+        lines.append(f"p4c_barefoot command: {' '.join(bf_exec)}\n")
+        if success and profile == "labels" and p4c_build_logs != "":
+            metrics_start = time.monotonic()
+            [success, metrics_lines] = build_metrics(folder_name, "smith", p4c_build_logs)
+            stages["metrics"] = {"seconds": time.monotonic() - metrics_start}
+            lines.extend(metrics_lines)
+            error_class = None if success else "no-metrics"
+        if success:
+            with open(log_file_path, "a") as log_file:
+                log_file.writelines(lines)
+            if output_dir != "":
+                folder_name = materialize_artifacts(folder_name, output_dir)
+            debug_print(f"Success! Output stored in {folder_name}.")
+            return [folder_name, True, time.monotonic() - start, None, max_rss, stages]
+        debug_print(f"Compilation failed ({error_class}). Deleting {folder_name}...")
+        save_failed_log(folder_name, error_class, lines, keep_failed_logs)
+    except Exception as e:
+        error_print(f"Execution failed: {e}. Deleting {folder_name}...")
+        error_class = "exception"
+    shutil.rmtree(folder_name, ignore_errors=True)
+    stages.setdefault("compile", {"seconds": time.monotonic() - start})
+    return [folder_name, False, time.monotonic() - start, error_class, max_rss, stages]
+
+def attempt_paths(folder_name):
+    """Returns the manifest path columns of the attempt in folder_name."""
+    return {"folder": folder_name,
+            "p4_file": os.path.join(folder_name, "smith.p4"),
+            "pipe_dir": os.path.join(folder_name, "smith.tofino", "pipe")}
+
+def label_signature(folder_name):
+    """
+    Returns the labels of a compiled program as a string: its number of MAU stages, plus
+    latency, SRAMs and TCAMs when metrics.json exists. None if resources.json is unreadable.
+    """
+    pipe_dir = os.path.join(folder_name, "smith.tofino", "pipe")
+    try:
+        with open(os.path.join(pipe_dir, "logs", "resources.json"), "r") as f:
+            labels = [len(json.load(f)["resources"]["mau"]["mau_stages"])]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    try:
+        with open(os.path.join(pipe_dir, "metrics.json"), "r") as f:
+            mau = json.load(f).get("mau", {})
+        labels += [mau.get("latency"), mau.get("srams"), mau.get("tcams")]
+    except (OSError, ValueError, AttributeError):
+        pass
+    return json.dumps(labels, sort_keys=True)
+
+def record_generated(manifest, seed, cell, folder_name, gen_time, canon_hash):
+    paths = attempt_paths(folder_name)
+    return manifest.add_attempt(paths.pop("folder"), STATUS_GENERATED, seed=seed, gen_time=gen_time,
+                                canon_hash=canon_hash, dag_node_num=cell[0], dag_density=cell[1],
+                                p4_size=os.path.getsize(paths["p4_file"]), **paths)
+
+def record_compiled(manifest, attempt_id, folder_name, success, compile_time, error_class, max_rss):
+    # a successful attempt may have been moved out of its scratch folder
+    paths = attempt_paths(folder_name) if success else {}
+    manifest.update_attempt(attempt_id, compile_time=compile_time, error=error_class, max_rss=max_rss,
+                            status=STATUS_SUCCESS if success else STATUS_FAILED, **paths)
+
+def footprint_model(manifest):
+    """Returns a FootprintModel trained on the compilations recorded in the manifest."""
+    model = FootprintModel()
+    if manifest is not None:
+        for [p4_size, max_rss] in manifest.footprints():
+            model.observe(p4_size, max_rss)
+    return model
+
+def compile_pool_executor(num_workers, cpus=None):
+    """ProcessPoolExecutor for compilations, its workers pinned round-robin to `cpus` if given."""
+    if not cpus:
+        return ProcessPoolExecutor(max_workers=num_workers)
+    cpu_queue = multiprocessing.Queue()
+    for i in range(num_workers):
+        cpu_queue.put(cpus[i % len(cpus)])
+    return ProcessPoolExecutor(max_workers=num_workers, initializer=pin_worker, initargs=(cpu_queue,))
+
+def resume_sweep(manifest, sweep):
+    """Feeds the outcomes recorded in the manifest to the sweep."""
+    for row in manifest.attempts([STATUS_SUCCESS, STATUS_FAILED, STATUS_DUPLICATE, STATUS_GEN_FAILED]):
+        sweep.record((row["dag_node_num"], row["dag_density"]), row["status"] == STATUS_SUCCESS,
+                     (row["gen_time"] or 0) + (row["compile_time"] or 0), started=True)
+
+def first_seed(manifest, base_seed=None):
+    """
+    Returns the seed of the next attempt: after the largest seed recorded in the manifest,
+    and at least base_seed. Without either, a random seed.
+    """
+    max_seed = manifest.max_seed()
+    if max_seed is not None:
+        return max_seed + 1 if base_seed is None else max(base_seed, max_seed + 1)
+    return base_seed if base_seed is not None else random.randrange(1 << 31)
+
+def run_smith_pipeline(num_repetitions, generate_task, compile_task,
+                       compile_workers, gen_workers, queue_size, manifest, base_seed=None, sweep=None,
+                       admission=None, cpus=None, telemetry=None):
+    """
+    Runs 'smith' and p4c-barefoot as a two-stage pipeline until the success count is met.
+    generate_task(seed, dag_node_num, dag_density) and compile_task(folder_name) are the
+    two stages, see generate_smith_program and compile_smith_program.
+
+    The DAG parameters of every attempt are chosen by `sweep` (see DagSweep), which learns
+    the success rate, cost and label diversity of each parameter cell from the outcomes,
+    starting from the attempts already in the manifest. Without a sweep, every attempt uses
+    SMITH_DAG_NODE_NUM and SMITH_DAG_DENSITY.
+
+    compile_workers is an upper bound: with a MemoryAdmission, a queued program is only
+    compiled once its predicted footprint fits in memory. The compile workers are pinned
+    to `cpus` if given.
+
+    Attempt i uses seed base_seed + i and every seed is recorded in the manifest, so any
+    attempt can be rebuilt with --regenerate. A resumed run continues after the largest
+    recorded seed; without base_seed and recorded seeds, a random base seed is drawn.
+
+    A small generator pool feeds generated programs into a bounded queue which a larger
+    compile pool drains, so slow compilations never block cheap generation and the
+    compile workers stay busy. Generation is throttled once `queue_size` programs are
+    queued or being generated.
+
+    Every attempt is recorded in the manifest. Successes already recorded there count
+    towards `num_repetitions`, and programs that were generated but never compiled
+    (e.g. the previous run crashed) are compiled first, so a rerun resumes the job.
+
+    Generated programs whose canonical hash was already seen (queued, compiled or failed)
+    are dropped before compilation and recorded as duplicates.
+
+    With a Telemetry, the stages of every attempt are recorded, including the time a
+    generated program waited for a compile worker ('queue').
+    """
+    if sweep is None:
+        sweep = DagSweep([int(SMITH_DAG_NODE_NUM)], [float(SMITH_DAG_DENSITY)])
+    resume_sweep(manifest, sweep)
+    success_list = manifest.folders(STATUS_SUCCESS)
+    # every seed attempted this run, duplicates included
+    total_runs_cnt = 0
+    duplicate_cnt = 0
     start_time = datetime.now()
-    with ProcessPoolExecutor(max_workers=num_workers) as executor:
-        futures = set()
-        progress_bar = tqdm(total=num_repetitions, desc="Successful runs", ncols=80)
-        
+    # queue of [attempt_id, folder_name, cell, queued_at] waiting for compilation
+    pending = deque()
+    for row in manifest.attempts(STATUS_GENERATED):
+        folder_name = manifest.abspath(row["folder"])
+        if os.path.exists(os.path.join(folder_name, "smith.p4")):
+            pending.append([row["id"], folder_name, (row["dag_node_num"], row["dag_density"]), time.monotonic()])
+        else:
+            manifest.update_attempt(row["id"], status=STATUS_REMOVED)
+    if success_list or pending:
+        print(f"Resuming from {manifest.path}: {len(success_list)} successful runs, "
+              f"{len(pending)} programs waiting for compilation.")
+    seen_hashes = manifest.canon_hashes([STATUS_GENERATED, STATUS_SUCCESS, STATUS_FAILED])
+    next_seed = first_seed(manifest, base_seed)
+    print(f"First seed: {next_seed}")
+    # generation future -> [seed, cell]
+    gen_futures = {}
+    compile_futures = {}
+    progress_bar = tqdm(total=num_repetitions, initial=min(len(success_list), num_repetitions),
+                        desc="Successful runs", ncols=80)
+    with ProcessPoolExecutor(max_workers=gen_workers) as gen_pool, \
+         compile_pool_executor(compile_workers, cpus) as compile_pool:
         while len(success_list) < num_repetitions:
-            debug_print(f"Running {num_repetitions - len(success_list)} more repetitions...")
-            debug_print(f"Success count: {len(success_list)}")
-            debug_print(f"Active workers: {len(futures)}")
+            while len(gen_futures) < gen_workers and len(gen_futures) + len(pending) < queue_size:
+                cell = sweep.choose()
+                gen_futures[gen_pool.submit(generate_task, next_seed, cell[0], cell[1])] = [next_seed, cell]
+                next_seed += 1
+            while len(compile_futures) < compile_workers and pending:
+                attempt_id, folder_name, cell, queued_at = pending[0]
+                p4_size = os.path.getsize(os.path.join(folder_name, "smith.p4"))
+                reserved = admission.admit(p4_size) if admission is not None else 0
+                if reserved is None:
+                    break
+                pending.popleft()
+                if telemetry is not None:
+                    telemetry.record("queue", time.monotonic() - queued_at, attempt=attempt_id, cell=cell)
+                future = compile_pool.submit(compile_task, folder_name)
+                compile_futures[future] = [attempt_id, folder_name, cell, p4_size, reserved]
+            debug_print(f"Success count: {len(success_list)}, generating: {len(gen_futures)}, "
+                        f"queued: {len(pending)}, compiling: {len(compile_futures)}")
 
-            while len(futures) < num_workers and len(success_list) < num_repetitions:
+            done, _ = wait(set(gen_futures) | set(compile_futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in gen_futures:
+                    [seed, cell] = gen_futures.pop(future)
+                    try:
+                        [folder_name, gen_time, canon_hash, stages] = future.result()
+                    except Exception as e:
+                        error_print(f"Generation task failed with error: {e}")
+                        [folder_name, gen_time, canon_hash, stages] = [None, None, None, {}]
+                    if folder_name and canon_hash is not None and canon_hash in seen_hashes:
+                        debug_print(f"Duplicate program in {folder_name}. Deleting it...")
+                        manifest.add_attempt(None, STATUS_DUPLICATE, seed=seed, gen_time=gen_time,
+                                             canon_hash=canon_hash, dag_node_num=cell[0], dag_density=cell[1])
+                        shutil.rmtree(folder_name, ignore_errors=True)
+                        sweep.record(cell, False, gen_time)
+                        total_runs_cnt += 1
+                        duplicate_cnt += 1
+                        outcome = STATUS_DUPLICATE
+                    elif folder_name:
+                        seen_hashes.add(canon_hash)
+                        attempt_id = record_generated(manifest, seed, cell, folder_name, gen_time, canon_hash)
+                        pending.append([attempt_id, folder_name, cell, time.monotonic()])
+                        sweep.add_cost(cell, gen_time)
+                        outcome = "ok"
+                    else:
+                        manifest.add_attempt(None, STATUS_GEN_FAILED, seed=seed, gen_time=gen_time,
+                                             dag_node_num=cell[0], dag_density=cell[1])
+                        sweep.record(cell, False, gen_time or 0)
+                        total_runs_cnt += 1
+                        outcome = STATUS_GEN_FAILED
+                    if telemetry is not None:
+                        telemetry.record_stages(stages, outcome, seed=seed, cell=cell)
+                    continue
 
-                debug_print(f"Success count: {len(success_list)}")
-                info_print(f"Active workers: {len(futures)}")
-                futures.add(executor.submit(run_single_smith, smith_executable, p4c_barefoot))
-            for future in as_completed(futures):
-                futures.remove(future)
+                attempt_id, folder_name, cell, p4_size, reserved = compile_futures.pop(future)
+                total_runs_cnt += 1
                 try:
-                    [result, count] = future.result()
-                    with total_runs_cnt.get_lock():
-                        if result:
-                            success_list.append(result)
-                            progress_bar.update(1)
-                            progress_bar.refresh()
-                        total_runs_cnt.value += count
-                    if len(success_list) >= num_repetitions:
-                        stop_ongoing_process.set()
-                        break
-                    if len(success_list) < num_repetitions:
-                        debug_print(f"Success count: {len(success_list)}")
-                        debug_print(f"Active workers: {len(futures)}")
-                        futures.add(executor.submit(run_single_smith, 
-                                                    smith_executable, p4c_barefoot))
-                        break # break here so the as_completed(futures) iterator will be updated
-
+                    [folder_name, success, compile_time, error_class, max_rss, stages] = future.result()
                 except Exception as e:
-                    debug_print(f"Task failed with error: {e}")
-                    # Retry failed task
-                    futures.add(executor.submit(run_single_smith, smith_executable, p4c_barefoot))
-        progress_bar.close()
+                    error_print(f"Compile task failed with error: {e}. Deleting {folder_name}...")
+                    manifest.update_attempt(attempt_id, status=STATUS_FAILED, error=str(e))
+                    shutil.rmtree(folder_name, ignore_errors=True)
+                    sweep.record(cell, False, 0)
+                    if admission is not None:
+                        admission.release(reserved)
+                    continue
+                if admission is not None:
+                    admission.release(reserved, p4_size, max_rss)
+                if telemetry is not None:
+                    telemetry.record_stages(stages, error_class or "ok", attempt=attempt_id, cell=cell)
+                record_compiled(manifest, attempt_id, folder_name, success, compile_time, error_class, max_rss)
+                sweep.record(cell, success, compile_time, label_signature(folder_name) if success else None)
+                if success and len(success_list) < num_repetitions:
+                    success_list.append(folder_name)
+                    progress_bar.update(1)
+                    progress_bar.refresh()
+
+        # stop feeding the pools; drop whatever was generated but never compiled
+        for future in set(gen_futures) | set(compile_futures):
+            future.cancel()
+        gen_pool.shutdown(wait=True, cancel_futures=True)
+        compile_pool.shutdown(wait=True, cancel_futures=True)
+        for future in gen_futures:
+            if not future.cancelled() and future.exception() is None and future.result()[0]:
+                shutil.rmtree(future.result()[0], ignore_errors=True)
+        for future, [attempt_id, folder_name, cell, _, _] in compile_futures.items():
+            if future.cancelled() or future.exception() is not None:
+                pending.append([attempt_id, folder_name, cell, None])
+                continue
+            [folder_name, success, compile_time, error_class, max_rss, _] = future.result()
+            record_compiled(manifest, attempt_id, folder_name, success, compile_time, error_class, max_rss)
+        for attempt_id, folder_name, _, _ in pending:
+            manifest.update_attempt(attempt_id, status=STATUS_REMOVED)
+            shutil.rmtree(folder_name, ignore_errors=True)
+    progress_bar.close()
 
-    
     info_print(f"All {num_repetitions} runs completed successfully.")
-    info_print(f"Total runs attempted: {total_runs_cnt.value}")
+    info_print(f"Total runs attempted: {total_runs_cnt}, of which {duplicate_cnt} duplicates dropped")
     info_print(f"Total time taken: {datetime.now() - start_time}")
-    ratio = len(success_list) / total_runs_cnt.value if total_runs_cnt.value > 0 else 0
+    ratio = len(success_list) / total_runs_cnt if total_runs_cnt > 0 else 0
     info_print(f"Success ratio: {ratio:.2%}")
     info_print(f"Success count: {len(success_list)}")
+    for [dag_node_num, dag_density, generated, duplicates] in manifest.duplicate_rates():
+        print(f"DAG nodes {dag_node_num}, density {dag_density}: "
+              f"{duplicates}/{generated} generated programs were duplicates ({duplicates / generated:.2%})")
+    for [dag_node_num, dag_density, attempts, successes, mean_cost, labels] in sweep.summary():
+        ratio = successes / attempts if attempts else 0
+        print(f"DAG nodes {dag_node_num}, density {dag_density}: {successes}/{attempts} successful "
+              f"({ratio:.2%}), {mean_cost:.1f}s per attempt, {labels} distinct labels this run")
+    if telemetry is not None:
+        telemetry.print_summary()
+
+def regenerate_program(seed, smith_executable, manifest=None, p4c_barefoot="", profile="full",
+                       p4c_build_logs=""):
+    """
+    Rebuilds the program of `seed` in smith_seed_<seed>/, with the DAG parameters of its
+    manifest row (the defaults if the seed is not recorded), and compiles it if
+    p4c_barefoot is given. Nothing is deleted, whatever the outcome.
+    """
+    row = manifest.attempt_by_seed(seed) if manifest is not None else None
+    dag_node_num = SMITH_DAG_NODE_NUM if row is None else row["dag_node_num"]
+    dag_density = SMITH_DAG_DENSITY if row is None else row["dag_density"]
+    folder_name = f"smith_seed_{seed}"
+    if os.path.exists(folder_name):
+        print(f"Error: {folder_name} already exists.")
+        return
+    os.makedirs(folder_name)
+    log_file_path = os.path.join(folder_name, "log.txt")
+    smith_exec = smith_command(smith_executable, seed, dag_node_num, dag_density)
+    with open(log_file_path, "w") as log_file:
+        result = subprocess.run(smith_exec, stdout=log_file, stderr=log_file, cwd=folder_name)
+        log_file.write(f"\n\n\nsmith command: {' '.join(smith_exec)}\n")
+    if result.returncode != 0:
+        print(f"p4smith failed for seed {seed}, see {log_file_path}")
+        return
+    print(f"Regenerated seed {seed} in {folder_name}")
+    if row is None:
+        print(f"Seed {seed} is not recorded in the manifest, used the default DAG parameters.")
+    else:
+        print(f"Recorded outcome: {row['status']}" + (f" ({row['error']})" if row["error"] else ""))
+        if row["canon_hash"] is not None:
+            same = canonical_hash(os.path.join(folder_name, "smith.p4")) == row["canon_hash"]
+            print("Program matches the recorded canonical hash." if same else
+                  "Warning: program differs from the recorded canonical hash.")
+    if p4c_barefoot == "":
+        return
+    bf_exec = barefoot_command(p4c_barefoot, profile)
+    [success, error_class, lines, _, _] = run_monitored(bf_exec, folder_name, BF_COMPILE_TIMEOUT)
+    lines.append(f"p4c_barefoot command: {' '.join(bf_exec)}\n")
+    if success and profile == "labels" and p4c_build_logs != "":
+        [success, metrics_lines] = build_metrics(folder_name, "smith", p4c_build_logs)
+        lines.extend(metrics_lines)
+        error_class = None if success else "no-metrics"
+    with open(log_file_path, "a") as log_file:
+        log_file.writelines(lines)
+    print("Compilation succeeded." if success else f"Compilation failed: {error_class}")
 
-def compile_p4_file(p4_file, p4c_barefoot):
+def compile_p4_file(p4_file, p4c_barefoot, cache=None, profile="full", p4c_build_logs="", limits=None):
     """
     Compiles a single P4 file and logs output to 'log.txt' in the same folder.
+    With a CompileCache, a cached result for the same program, compiler and flags is
+    restored instead of compiling. Returns [p4_file, success, error_class, max_rss, stages];
+    max_rss is None and stages is empty when nothing was compiled, see compile_smith_program.
     """
     debug_print(f"Building {p4_file}...")
-    log_file_path = os.path.join(os.path.dirname(p4_file), "log.txt")
+    folder = os.path.dirname(p4_file)
+    stem = os.path.splitext(os.path.basename(p4_file))[0]
+    log_file_path = os.path.join(folder, "log.txt")
+    bf_exec = barefoot_command(p4c_barefoot, profile)
+    bf_exec[1] = os.path.basename(p4_file)
+    if cache is not None:
+        build_metrics_inline = profile == "labels" and p4c_build_logs != ""
+        key = cache.key(p4_file, bf_exec[1:] + (["metrics.json"] if build_metrics_inline else []))
+        result = cache.restore(key, folder, stem)
+        if result is not None:
+            debug_print(f"Restored {p4_file} from the compile cache.")
+            return [p4_file, result["success"], result["error_class"], None, {}]
+    start = time.monotonic()
+    stages = {}
+    try:
+        [success, error_class, lines, max_rss, usage] = run_monitored(bf_exec, os.path.dirname(p4_file), 40,
+                                                                      limits=limits)
+        stages["scan"] = {"seconds": usage["scan"]}
+    except Exception as e:
+        [success, error_class, lines, max_rss, usage] = [False, "exception", [f"{e}\n"], None, {}]
+    stages["compile"] = {"seconds": time.monotonic() - start, "cpu": usage.get("cpu"), "max_rss": max_rss}
+    if success and profile == "labels" and p4c_build_logs != "":
+        metrics_start = time.monotonic()
+        [success, metrics_lines] = build_metrics(folder, stem, p4c_build_logs)
+        stages["metrics"] = {"seconds": time.monotonic() - metrics_start}
+        lines.extend(metrics_lines)
+        error_class = None if success else "no-metrics"
+    if not success:
+        print(f"Error compiling {p4_file}: {error_class}")
+        # remove the folder file if compilation fails -> too dangerous
+        # try:
+        #     shutil.rmtree(os.path.dirname(p4_file))
+        # except Exception as e:
+        #     debug_print(f"Error removing folder {os.path.dirname(p4_file)}: {e}")
     with open(log_file_path, "w") as log_file:
-        try:
-            subprocess.run([
-                p4c_barefoot, os.path.basename(p4_file), "-g", "--target", "tofino", "--arch", "tna","--verbose", "--enable-event-logger", "--optimized-source","opt.p4", "-Ttable_dependency_graph:3,table_dependency_summary:3,table_placement:5"
-                ], stdout=log_file, stderr=log_file, check=True, cwd=os.path.dirname(p4_file), timeout=40)
-        except Exception as e:
-            print(f"Error compiling {p4_file}: {e}")
-            # remove the folder file if compilation fails -> too dangerous
-            # try:
-            #     shutil.rmtree(os.path.dirname(p4_file))
-            # except Exception as e:
-            #     debug_print(f"Error removing folder {os.path.dirname(p4_file)}: {e}")
+        log_file.writelines(lines)
+    if cache is not None and error_class not in ("timeout", "exception", "out-of-memory", "cpu-limit"):
+        cache.store(key, folder, stem, {"success": success, "error_class": error_class})
+    return [p4_file, success, error_class, max_rss, stages]
 
-def build_p4_programs_recursive(p4c_barefoot, build_only_dir, num_workers):
+def discover_p4_files(build_only_dir, manifest=None):
     """
-    Recursively builds all P4 programs in the current directory and subdirectories.
+    Yields [p4_file, attempt_id] for every P4 program below build_only_dir, while walking
+    the tree, so compilation starts right away. With a manifest, the programs of the
+    successful attempts are yielded instead (attempt_id is None otherwise).
     """
-    p4_files = []
+    if manifest is not None:
+        for row in manifest.iter_attempts(STATUS_SUCCESS):
+            yield [manifest.abspath(row["p4_file"]), row["id"]]
+        return
     for root, _, files in os.walk(build_only_dir):
         for file in files:
             if file.endswith(".p4"):
-                p4_files.append(os.path.join(root, file))
-    print(f"Found {len(p4_files)} P4 programs. Compiling with {num_workers} workers...")
-    process_bar = tqdm(total=len(p4_files), desc="Compiling P4 files", ncols=80)
-    with ProcessPoolExecutor(max_workers=num_workers) as executor:
-        futures = {executor.submit(compile_p4_file, p4_file, p4c_barefoot): p4_file for p4_file in p4_files}
-        for future in as_completed(futures):
-            process_bar.update(1)
-            process_bar.refresh()
+                yield [os.path.join(root, file), None]
+
+def bounded_submit(executor, task, args_iter, max_in_flight):
+    """
+    Submits task(*args) for the args of args_iter with at most max_in_flight futures
+    pending, pulling the next args only when a task finished. Yields [args, future] as
+    the futures complete, so neither the inputs nor the futures are held at once.
+    """
+    futures = {}
+    args_iter = iter(args_iter)
+    exhausted = False
+    while True:
+        while not exhausted and len(futures) < max_in_flight:
+            args = next(args_iter, None)
+            if args is None:
+                exhausted = True
+                break
+            futures[executor.submit(task, *args)] = args
+        if not futures:
+            return
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield [futures.pop(future), future]
 
+def open_results_file(results_file):
+    """Opens the JSON-lines results file of a batch run for appending, None if not wanted."""
+    if results_file == "":
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(results_file)), exist_ok=True)
+    return open(results_file, "a")
 
+def write_result(results, **result):
+    if results is not None:
+        results.write(json.dumps(result) + "\n")
+        results.flush()
+
+def build_p4_programs_recursive(p4c_barefoot, build_only_dir, num_workers, manifest=None, cache=None,
+                                profile="full", p4c_build_logs="", admission=None, limits=None, cpus=None,
+                                telemetry=None, results_file=""):
+    """
+    Recursively builds all P4 programs in the current directory and subdirectories.
+    With a manifest, only the programs of successful attempts are rebuilt and the
+    outcome of every rebuild is written back to the manifest.
+    Programs are compiled as they are discovered (see discover_p4_files), at most
+    num_workers at once, fewer when a MemoryAdmission does not admit the next one;
+    limits, cpus and telemetry are as in run_smith_pipeline. The outcome of every
+    program is appended to results_file (JSON lines) as soon as it is known.
+    """
+    print(f"Compiling the P4 programs of {build_only_dir} with {num_workers} workers...")
+    process_bar = tqdm(desc="Compiling P4 files", ncols=80)
+    results = open_results_file(results_file)
+    discovered = discover_p4_files(build_only_dir, manifest)
+    # next program to submit, [p4_file, attempt_id, p4_size]
+    upcoming = None
+    # future -> [p4_file, attempt_id, p4_size, reserved memory]
+    futures = {}
+    with compile_pool_executor(num_workers, cpus) as executor:
+        while True:
+            while len(futures) < num_workers:
+                if upcoming is None:
+                    found = next(discovered, None)
+                    if found is None:
+                        break
+                    try:
+                        upcoming = found + [os.path.getsize(found[0])]
+                    except OSError as e:
+                        print(f"Error compiling {found[0]}: {e}")
+                        continue
+                reserved = admission.admit(upcoming[2]) if admission is not None else 0
+                if reserved is None:
+                    break
+                [p4_file, attempt_id, p4_size] = upcoming
+                upcoming = None
+                future = executor.submit(compile_p4_file, p4_file, p4c_barefoot, cache, profile,
+                                         p4c_build_logs, limits)
+                futures[future] = [p4_file, attempt_id, p4_size, reserved]
+            if not futures:
+                break
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                [p4_file, attempt_id, p4_size, reserved] = futures.pop(future)
+                process_bar.update(1)
+                process_bar.refresh()
+                max_rss = None
+                if future.exception() is None:
+                    [_, success, error_class, max_rss, stages] = future.result()
+                    if telemetry is not None:
+                        telemetry.record_stages(stages, error_class or "ok", p4_file=p4_file)
+                    if attempt_id is not None:
+                        # a cache hit compiles nothing, keep the recorded peak memory
+                        footprint = {"max_rss": max_rss} if max_rss is not None else {}
+                        manifest.update_attempt(attempt_id, error=error_class, p4_size=p4_size,
+                                                status=STATUS_SUCCESS if success else STATUS_FAILED,
+                                                build_logs=None, **footprint)
+                    write_result(results, p4_file=p4_file, success=success, error=error_class, max_rss=max_rss)
+                else:
+                    write_result(results, p4_file=p4_file, success=False, error=f"exception: {future.exception()}")
+                if admission is not None:
+                    admission.release(reserved, p4_size, max_rss)
+    process_bar.close()
+    if results is not None:
+        results.close()
+    if telemetry is not None:
+        telemetry.print_summary()
+
+
+
+def has_build_logs(pipe_dir):
+    """True if p4c-build-logs succeeded in pipe_dir after the last compilation wrote context.json."""
+    try:
+        return os.path.getmtime(os.path.join(pipe_dir, BUILD_LOGS_MARKER)) >= \
+               os.path.getmtime(os.path.join(pipe_dir, "context.json"))
+    except OSError:
+        return False
 
 def run_single_p4c_build_logs(cmd, p4_file, relative_folder):
+    """
+    Links phv.json and runs p4c-build-logs in the pipe folder of p4_file. Idempotent: the
+    link is only created when missing, and BUILD_LOGS_MARKER is written on success.
+    """
     try:
-        log_path = os.path.join(os.path.dirname(p4_file), relative_folder, "log.txt")
         cwd = os.path.join(os.path.dirname(p4_file), relative_folder)
+        log_path = os.path.join(cwd, "log.txt")
         os.makedirs(cwd, exist_ok=True)
+        if not os.path.lexists(os.path.join(cwd, "phv.json")):
+            os.symlink(os.path.join("logs", "phv.json"), os.path.join(cwd, "phv.json"))
         with open(log_path, "w") as log_file:
             subprocess.run(
                 cmd,
@@ -187,13 +756,44 @@ def run_single_p4c_build_logs(cmd, p4_file, relative_folder):
                 check=True,
                 cwd=cwd
             )
+        with open(os.path.join(cwd, BUILD_LOGS_MARKER), "w") as marker:
+            marker.write(" ".join(cmd) + "\n")
         return (p4_file, "success")
     except Exception as e:
         return (p4_file, f"unexpected error: {str(e)}")
-        
-def run_p4c_build_logs(p4c_build_logs, num_workers, build_only_dir):
+
+def discover_build_log_folders(build_only_dir, manifest=None, force=False):
+    """
+    Yields [p4_file, relative_folder, attempt_id] for every compiled program below
+    build_only_dir while walking the tree: p4_file is its opt.p4 and relative_folder its
+    pipe folder, relative to the folder of p4_file. With a manifest, the successful
+    attempts are used instead of walking the tree (attempt_id is None otherwise).
+    Programs that already have their logs are skipped unless force is set.
+    """
+    if manifest is not None:
+        for row in manifest.iter_attempts(STATUS_SUCCESS):
+            if row["build_logs"] is not None and not force:
+                continue
+            folder = manifest.abspath(row["folder"])
+            yield [os.path.join(folder, "opt.p4"), os.path.relpath(manifest.abspath(row["pipe_dir"]), folder),
+                   row["id"]]
+        return
+    for root, dirs, files in os.walk(build_only_dir):
+        pipe_dir = next((dir + "/pipe" for dir in dirs if dir.endswith(".tofino")), None)
+        if pipe_dir is None or (not force and has_build_logs(os.path.join(root, pipe_dir))):
+            continue
+        for file in files:
+            if file.endswith("opt.p4"):
+                yield [os.path.join(root, file), pipe_dir, None]
+
+def run_p4c_build_logs(p4c_build_logs, num_workers, build_only_dir, manifest=None, results_file="", force=False):
     """
     Recursively searches for P4 programs and runs p4c-build-logs in each folder.
+    With a manifest, the successful attempts are used instead of walking the tree.
+    Programs are processed as they are discovered, at most 2 * num_workers queued at
+    once; the outcomes are appended to results_file (JSON lines) if given, printed
+    otherwise. Programs whose logs were already built (recorded in the manifest, or
+    BUILD_LOGS_MARKER without one) are skipped unless force is set.
     """
 
     #check if the p4c_build_logs exists
@@ -201,49 +801,60 @@ def run_p4c_build_logs(p4c_build_logs, num_workers, build_only_dir):
         print(f"Error: p4c_build_logs executable not found: {p4c_build_logs}")
         return
 
-    p4_files = []
-    relative_folders = {}
-    for root, dirs, files in os.walk(build_only_dir):
-        file = ""
-        for file in files:
-            if file.endswith("opt.p4"):
-                file = os.path.join(root, file)
-                p4_files.append(file)
-                for dir in dirs:
-                    if dir.endswith(".tofino"):
-                        relative_folders[file] = dir + "/pipe"
-                        break
-
-    print(f"Found {len(p4_files)} P4 programs. Running p4c-build-logs with {num_workers} workers...")
-    link_phv_cmd = ["ln", "-s", os.path.join("./logs", "phv.json"), os.path.join("./phv.json")]
-    for p4_file in p4_files:
-        subprocess.run(link_phv_cmd, cwd=os.path.join(os.path.dirname(p4_file), relative_folders[p4_file]
-        ))
-    commands = [
-        [
-            p4c_build_logs,
-            os.path.join("./context.json"),
-            "--manifest", os.path.join("../manifest.json"),
-            "--power", os.path.join("./logs/power.json"),
-            "--resources", os.path.join("./logs/resources.json"),
-            "--disable-phv-json"
-        ]
-        for p4_file in p4_files
+    print(f"Running p4c-build-logs with {num_workers} workers on the P4 programs of {build_only_dir}...")
+    cmd = [
+        p4c_build_logs,
+        os.path.join("./context.json"),
+        "--manifest", os.path.join("../manifest.json"),
+        "--power", os.path.join("./logs/power.json"),
+        "--resources", os.path.join("./logs/resources.json"),
+        "--disable-phv-json"
     ]
+    # opt.p4 -> attempt id, for the programs in flight
+    attempt_ids = {}
 
-    with ProcessPoolExecutor(max_workers=num_workers) as executor:
-        futures = {
-            executor.submit(run_single_p4c_build_logs, cmd, p4_file, relative_folders[p4_file]): p4_file
-            for cmd, p4_file in zip(commands, p4_files)
-        }
+    def tasks():
+        for p4_file, relative_folder, attempt_id in discover_build_log_folders(build_only_dir, manifest, force):
+            attempt_ids[p4_file] = attempt_id
+            yield [cmd, p4_file, relative_folder]
 
-        for future in as_completed(futures):
-            p4_file = futures[future]
+    results = open_results_file(results_file)
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for [[_, p4_file, _], future] in bounded_submit(executor, run_single_p4c_build_logs, tasks(),
+                                                         2 * num_workers):
             try:
                 result = future.result()
-                print(f"{result[0]}: {result[1]}")
             except Exception as e:
-                print(f"{p4_file}: failed with exception: {e}")
+                result = (p4_file, f"failed with exception: {e}")
+            attempt_id = attempt_ids.pop(p4_file)
+            if attempt_id is not None and result[1] == "success":
+                manifest.update_attempt(attempt_id, build_logs=datetime.now().isoformat())
+            if results is not None:
+                write_result(results, p4_file=result[0], status=result[1])
+            else:
+                print(f"{result[0]}: {result[1]}")
+    if results is not None:
+        results.close()
+
+def rm_failed_attempts(manifest):
+    """
+    Removes the folders of all attempts recorded as failed in the manifest.
+    """
+    rows = [row for row in manifest.attempts(STATUS_FAILED)
+            if row["folder"] is not None and os.path.exists(manifest.abspath(row["folder"]))]
+    if not rows:
+        print("No files with errors found.")
+        return
+    print(f"Found {len(rows)} programs with errors:")
+    for row in rows:
+        folder = manifest.abspath(row["folder"])
+        try:
+            shutil.rmtree(folder)
+            print(f"Removed folder {folder}")
+        except Exception as e:
+            print(f"Error removing folder {folder}: {e}")
+            continue
+        manifest.update_attempt(row["id"], status=STATUS_REMOVED)
 
 def rm_files_with_errors(dir):
     """
@@ -280,30 +891,158 @@ def main():
     parser.add_argument("-n", "--num-repetitions", type=int, help="Number of successful repetitions required.")
     parser.add_argument("-e", "--smith-executable", type=str, default="", help="Full path to the 'smith' executable.")
     parser.add_argument("-c", "--p4c-barefoot", type=str, default="", help="Full path to the 'p4c-barefoot' executable.")
-    parser.add_argument("-w", "--workers", type=int, default=4, help="Number of parallel workers (default: 4).")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Number of parallel (compile) workers (default: 4).")
+    parser.add_argument("--gen-workers", type=int, default=0, help="Number of p4smith generator workers (default: workers/4, at least 1).")
+    parser.add_argument("--queue-size", type=int, default=0, help="Max generated programs waiting for compilation (default: 2*workers).")
     parser.add_argument("-b", "--build-only", action="store_true", help="Build all p4 programs in current directory recursively.")
     parser.add_argument("-b-dir", "--build-only-dir", type=str, default="", help="build_p4_programs_recursive")
     parser.add_argument("--p4c-build-logs", type=str, default="", help="Full path to the 'p4c-build-logs' executable.")
+    parser.add_argument("--profile", choices=["full", "labels"], default="full",
+                        help="Compile profile. 'labels' only produces the label artifacts (resources.json, "
+                             "table_dependency_summary.log and, with --p4c-build-logs, metrics.json) "
+                             "and skips the separate p4c-build-logs pass.")
     parser.add_argument("--remove-error-programs-dir", type=str, default="", help="Iterate all files found prog with error in log.txt")
+    parser.add_argument("--dag-node-num", type=str, default=SMITH_DAG_NODE_NUM,
+                        help="p4smith DAG node counts to sweep: a list and/or start:stop:step ranges, "
+                             f"e.g. 4:12:2 (default: {SMITH_DAG_NODE_NUM}).")
+    parser.add_argument("--dag-density", type=str, default=SMITH_DAG_DENSITY,
+                        help="p4smith DAG densities to sweep, e.g. 0.2:0.8:0.2 "
+                             f"(default: {SMITH_DAG_DENSITY}).")
+    parser.add_argument("--min-cell-attempts", type=int, default=20,
+                        help="Attempts every (node count, density) cell gets before attempts are "
+                             "steered towards the most productive cells (default: 20).")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Base seed: attempt i runs p4smith with seed+i (default: continue after the "
+                             "largest seed in the manifest, or a random one).")
+    parser.add_argument("--regenerate", type=int, default=None, metavar="SEED",
+                        help="Rebuild the program of a recorded seed in smith_seed_<SEED>/ "
+                             "(and compile it if -c is given).")
+    parser.add_argument("--scratch-dir", type=str, default="",
+                        help="Generate and compile in this directory (e.g. /dev/shm) and only copy the kept "
+                             "artifacts of successful programs to sharded smith_runs_<xx>/ folders in the "
+                             "current directory.")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Compile every generated program, even canonically identical ones.")
+    parser.add_argument("--keep-failed-logs", choices=["none", "interesting", "all"], default="interesting",
+                        help=f"Which logs of failed compilations to keep in {FAILED_LOGS_DIR}/ "
+                             f"(interesting: {', '.join(INTERESTING_ERROR_CLASSES)}).")
+    parser.add_argument("--cache-dir", type=str, default="",
+                        help="Compile cache directory for --build-only (default: no cache).")
+    parser.add_argument("--cache-max-size", type=str, default="",
+                        help="Evict least recently used cache entries above this size, e.g. 50G.")
+    parser.add_argument("--cache-max-age", type=float, default=None,
+                        help="Evict cache entries not used for this many days.")
+    parser.add_argument("--mem-aware", action="store_true",
+                        help="Only start a compilation when its predicted peak memory (learned from the "
+                             "manifest and the run so far) fits; -w becomes an upper bound.")
+    parser.add_argument("--mem-budget", type=str, default="",
+                        help="Memory compilations may reserve with --mem-aware, e.g. 200G "
+                             "(default: 90%% of the available memory at start).")
+    parser.add_argument("--compile-mem-limit", type=str, default="",
+                        help="Address space limit (RLIMIT_AS) of every compiler process, e.g. 16G.")
+    parser.add_argument("--compile-cpu-limit", type=int, default=0,
+                        help="CPU time limit (RLIMIT_CPU) of every compiler process, in seconds.")
+    parser.add_argument("--cpu-affinity", type=str, default="",
+                        help="Pin compile workers round-robin to these CPUs, e.g. 0-31.")
+    parser.add_argument("--results-file", type=str, default="",
+                        help="With --build-only or --p4c-build-logs, append the outcome of every program to "
+                             "this JSON-lines file as soon as it is known.")
+    parser.add_argument("--force-build-logs", action="store_true",
+                        help="Rerun p4c-build-logs on programs whose logs were already built.")
+    parser.add_argument("--telemetry", type=str, default="",
+                        help="Append per-stage timings, exit reasons and peak memory of every attempt to this "
+                             "JSON-lines file and print p50/p95/p99 per stage at the end (see telemetry.py).")
+    parser.add_argument("--telemetry-prom", type=str, default="",
+                        help="Keep a Prometheus textfile with the per-stage summary up to date.")
+    parser.add_argument("--manifest", type=str, default="",
+                        help=f"Path to the run manifest (default: {MANIFEST_NAME} in the current directory "
+                             "when generating, in the target directory otherwise).")
 
     args = parser.parse_args()
+    if args.profile == "labels" and args.p4c_build_logs == "":
+        print("Warning: --profile labels without --p4c-build-logs, metrics.json will not be produced.")
+    limits = None
+    if args.compile_mem_limit != "" or args.compile_cpu_limit > 0:
+        limits = [parse_size(args.compile_mem_limit) if args.compile_mem_limit != "" else None,
+                  args.compile_cpu_limit or None]
+    cpus = None
+    if args.cpu_affinity != "":
+        allowed = os.sched_getaffinity(0)
+        cpus = [cpu for cpu in parse_cpu_list(args.cpu_affinity) if cpu in allowed]
+        if not cpus:
+            print(f"Error: none of the CPUs {args.cpu_affinity} is available to this process.")
+            return
+    mem_budget = parse_size(args.mem_budget) if args.mem_budget != "" else None
+    telemetry = None
+    if args.telemetry != "" or args.telemetry_prom != "":
+        telemetry = Telemetry(args.telemetry, args.telemetry_prom)
+
+    if args.regenerate is not None and args.smith_executable != "":
+        manifest = RunManifest.find(".", args.manifest)
+        regenerate_program(args.regenerate, args.smith_executable, manifest, args.p4c_barefoot,
+                           args.profile, args.p4c_build_logs)
+        return
     if  args.smith_executable != "" \
         and (os.path.exists(args.smith_executable) or shutil.which(args.smith_executable) is not None) \
         and args.p4c_barefoot != "" and (os.path.exists(args.p4c_barefoot) \
                                          or shutil.which(args.p4c_barefoot) is not None):
-        run_smith_parallel(args.num_repetitions, args.smith_executable, args.p4c_barefoot, args.workers)
+        gen_workers = args.gen_workers if args.gen_workers > 0 else max(1, args.workers // 4)
+        queue_size = args.queue_size if args.queue_size > 0 else 2 * args.workers
+        manifest = RunManifest(args.manifest if args.manifest != "" else MANIFEST_NAME)
+        scratch_dir = ""
+        if args.scratch_dir != "":
+            scratch_dir = os.path.abspath(args.scratch_dir)
+            os.makedirs(scratch_dir, exist_ok=True)
+        generate_task = partial(generate_smith_program, smith_executable=args.smith_executable,
+                                dedup=not args.no_dedup, scratch_dir=scratch_dir)
+        compile_task = partial(compile_smith_program, p4c_barefoot=args.p4c_barefoot,
+                               keep_failed_logs=args.keep_failed_logs, profile=args.profile,
+                               p4c_build_logs=args.p4c_build_logs,
+                               output_dir=os.getcwd() if scratch_dir != "" else "", limits=limits)
+        sweep = DagSweep(parse_values(args.dag_node_num, int), parse_values(args.dag_density, float),
+                         args.min_cell_attempts)
+        admission = MemoryAdmission(footprint_model(manifest), mem_budget) if args.mem_aware else None
+        run_smith_pipeline(args.num_repetitions, generate_task, compile_task,
+                           args.workers, gen_workers, queue_size, manifest, args.seed, sweep,
+                           admission, cpus, telemetry)
+        manifest.close()
+        if telemetry is not None:
+            telemetry.close()
         return
 
     if args.build_only and args.build_only_dir != "" and os.path.exists(args.build_only_dir) and args.p4c_barefoot != "":
-        build_p4_programs_recursive(args.p4c_barefoot, args.build_only_dir, args.workers)
+        manifest = RunManifest.find(args.build_only_dir, args.manifest)
+        cache = None
+        if args.cache_dir != "":
+            version = compiler_version(args.p4c_barefoot)
+            if args.profile == "labels" and args.p4c_build_logs != "":
+                # metrics.json is built inline and cached with the compiler output
+                version += "|" + compiler_version(args.p4c_build_logs)
+            cache = CompileCache(args.cache_dir, version)
+        admission = MemoryAdmission(footprint_model(manifest), mem_budget) if args.mem_aware else None
+        build_p4_programs_recursive(args.p4c_barefoot, args.build_only_dir, args.workers, manifest, cache,
+                                    args.profile, args.p4c_build_logs, admission, limits, cpus, telemetry,
+                                    args.results_file)
+        if telemetry is not None:
+            telemetry.close()
+        if cache is not None and (args.cache_max_size != "" or args.cache_max_age is not None):
+            max_bytes = parse_size(args.cache_max_size) if args.cache_max_size != "" else None
+            removed = cache.evict(max_bytes, args.cache_max_age)
+            print(f"Evicted {removed} compile cache entries.")
         return
     
     if args.p4c_build_logs != "" and os.path.exists(args.p4c_build_logs) and args.build_only_dir != "":
-        run_p4c_build_logs(args.p4c_build_logs, args.workers, args.build_only_dir)
+        manifest = RunManifest.find(args.build_only_dir, args.manifest)
+        run_p4c_build_logs(args.p4c_build_logs, args.workers, args.build_only_dir, manifest, args.results_file,
+                           args.force_build_logs)
         return
     
     if args.remove_error_programs_dir != "" and os.path.exists(args.remove_error_programs_dir):
-        rm_files_with_errors(args.remove_error_programs_dir)
+        manifest = RunManifest.find(args.remove_error_programs_dir, args.manifest)
+        if manifest is not None:
+            rm_failed_attempts(manifest)
+        else:
+            rm_files_with_errors(args.remove_error_programs_dir)
         return
         
     print("Nothing run, check the arguments")
@@ -0,0 +1,393 @@
+import argparse
+import base64
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import socketserver
+import tarfile
+import threading
+import time
+from collections import deque
+from tqdm import tqdm
+from smith_manifest import RunManifest, MANIFEST_NAME, STATUS_GEN_FAILED, STATUS_DUPLICATE, \
+    STATUS_SUCCESS, STATUS_FAILED
+from dag_sweep import DagSweep, parse_values
+from compile_cache import parse_size
+from telemetry import Telemetry
+from run_smith import KEPT_ARTIFACTS, SMITH_DAG_NODE_NUM, SMITH_DAG_DENSITY, generate_smith_program, \
+    compile_smith_program, shard_folder, attempt_paths, label_signature, resume_sweep, first_seed
+
+# Multi-host P4Smith data collection.
+#
+# The coordinator owns the manifest and hands out jobs (seed, DAG parameters, compile
+# profile) to worker processes on any number of hosts over TCP. Every request is one
+# JSON line answered by one JSON line on a fresh connection:
+#   lease      -> a job, or done once enough programs compiled
+#   heartbeat  -> renews the lease of the running job
+#   claim      -> whether a generated program is a duplicate (canonical hash already
+#                 claimed by another seed)
+#   result     -> the attempt record, plus a tar.gz of KEPT_ARTIFACTS on success
+# A lease that is not renewed within the lease timeout (worker died, host rebooted, ...)
+# is requeued with the same seed and its claim is dropped, so the retry compiles the
+# program again. The first result of a seed wins.
+#
+# Locally: start a coordinator and several workers on one box, e.g.
+#   python smith_farm.py coordinator -n 100 --port 7700 &
+#   python smith_farm.py worker --coordinator localhost:7700 -e p4smith -c p4c-barefoot -w 8
+
+
+def request(address, message, retry_time=300):
+    """
+    Sends one message to the coordinator and returns its reply. Connection failures are
+    retried for retry_time seconds, so workers survive a coordinator restart.
+    """
+    deadline = time.monotonic() + retry_time
+    while True:
+        try:
+            with socket.create_connection(address, timeout=60) as sock:
+                stream = sock.makefile("rwb")
+                stream.write(json.dumps(message).encode() + b"\n")
+                stream.flush()
+                return json.loads(stream.readline())
+        except (OSError, ValueError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+
+
+def pack_artifacts(folder_name):
+    """Returns the KEPT_ARTIFACTS of folder_name as a base64 encoded tar.gz."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for artifact in KEPT_ARTIFACTS:
+            artifact = artifact.format(stem="smith")
+            path = os.path.join(folder_name, artifact)
+            if os.path.exists(path):
+                tar.add(path, arcname=artifact)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def unpack_artifacts(artifacts, folder_name):
+    """Extracts artifacts packed by pack_artifacts into folder_name."""
+    os.makedirs(folder_name, exist_ok=True)
+    with tarfile.open(fileobj=io.BytesIO(base64.b64decode(artifacts)), mode="r:gz") as tar:
+        for member in tar.getmembers():
+            # only plain files below the folder
+            if not member.isfile() or member.name.startswith("/") or ".." in member.name.split("/"):
+                continue
+            tar.extract(member, folder_name)
+    return folder_name
+
+
+class Coordinator:
+    """
+    Hands out jobs and records their results in the manifest. Only used from the server
+    thread, see run_coordinator.
+    """
+
+    def __init__(self, manifest, num_repetitions, sweep, profile, lease_timeout, output_dir, base_seed=None,
+                 telemetry=None):
+        self.manifest = manifest
+        self.num_repetitions = num_repetitions
+        self.sweep = sweep
+        self.profile = profile
+        self.lease_timeout = lease_timeout
+        self.output_dir = output_dir
+        self.telemetry = telemetry
+        resume_sweep(manifest, sweep)
+        self.successes = manifest.count(STATUS_SUCCESS)
+        self.next_seed = first_seed(manifest, base_seed)
+        # canonical hash -> seed that claimed it (None for programs compiled by earlier runs)
+        self.seen_hashes = dict.fromkeys(manifest.canon_hashes([STATUS_SUCCESS]))
+        # seed -> canonical hash it claimed, while its job runs
+        self.claims = {}
+        # jobs whose lease expired, handed out again before new ones
+        self.requeued = deque()
+        # seed -> [job, worker, deadline]
+        self.leases = {}
+        self.progress_bar = tqdm(total=num_repetitions, initial=min(self.successes, num_repetitions),
+                                 desc="Successful runs", ncols=80)
+
+    def done(self):
+        return self.successes >= self.num_repetitions
+
+    def finished(self):
+        """True once enough programs compiled and no leased job is still running."""
+        return self.done() and not self.leases
+
+    def handle(self, message):
+        op = message.get("op")
+        worker = message.get("worker")
+        if op == "lease":
+            return self.lease(worker)
+        if op == "heartbeat":
+            return self.heartbeat(worker, message["seed"])
+        if op == "claim":
+            return self.claim(message["canon_hash"], message.get("seed"))
+        if op == "result":
+            return self.result(worker, message["job"], message["result"], message.get("artifacts"))
+        return {"error": f"unknown op {op}"}
+
+    def lease(self, worker):
+        if self.done():
+            return {"job": None, "done": True}
+        if self.requeued:
+            job = self.requeued.popleft()
+        else:
+            cell = self.sweep.choose()
+            job = {"seed": self.next_seed, "dag_node_num": cell[0], "dag_density": cell[1],
+                   "profile": self.profile}
+            self.next_seed += 1
+        self.leases[job["seed"]] = [job, worker, time.monotonic() + self.lease_timeout]
+        return {"job": job, "done": False, "lease_timeout": self.lease_timeout}
+
+    def heartbeat(self, worker, seed):
+        lease = self.leases.get(seed)
+        if lease is None or lease[1] != worker:
+            return {"ok": False}
+        lease[2] = time.monotonic() + self.lease_timeout
+        return {"ok": True}
+
+    def claim(self, canon_hash, seed):
+        if canon_hash is None:
+            return {"duplicate": False}
+        if canon_hash in self.seen_hashes and self.seen_hashes[canon_hash] != seed:
+            return {"duplicate": True}
+        # a requeued seed generates the same program again, which is not a duplicate
+        self.seen_hashes[canon_hash] = seed
+        self.claims[seed] = canon_hash
+        return {"duplicate": False}
+
+    def release_claim(self, seed):
+        """Drops the hash claimed by seed, so that its program can be compiled again."""
+        canon_hash = self.claims.pop(seed, None)
+        if canon_hash is not None and self.seen_hashes.get(canon_hash) == seed:
+            del self.seen_hashes[canon_hash]
+
+    def expire_leases(self):
+        now = time.monotonic()
+        for seed, [job, worker, deadline] in list(self.leases.items()):
+            if deadline < now:
+                print(f"Lease of seed {seed} held by {worker} expired, requeueing it.")
+                del self.leases[seed]
+                self.release_claim(seed)
+                if not self.done():
+                    self.requeued.append(job)
+
+    def result(self, worker, job, result, artifacts):
+        seed = job["seed"]
+        self.leases.pop(seed, None)
+        self.requeued = deque(j for j in self.requeued if j["seed"] != seed)
+        if self.manifest.attempt_by_seed(seed) is not None:
+            # late result of a requeued job that already completed elsewhere
+            return {"ok": True}
+        cell = (job["dag_node_num"], job["dag_density"])
+        status = result["status"]
+        fields = {key: result.get(key) for key in
+                  ("gen_time", "compile_time", "error", "canon_hash", "max_rss", "p4_size")}
+        folder_name = None
+        label = None
+        if status == STATUS_SUCCESS:
+            folder_name = unpack_artifacts(artifacts, shard_folder(self.output_dir, result["folder"]))
+            fields.update(attempt_paths(folder_name))
+            fields.pop("folder")
+            label = label_signature(folder_name)
+            # its hash stays seen for good
+            self.claims.pop(seed, None)
+        else:
+            self.release_claim(seed)
+        self.manifest.add_attempt(folder_name, status, seed=seed, dag_node_num=cell[0], dag_density=cell[1],
+                                  worker=worker, **fields)
+        if self.telemetry is not None:
+            outcome = "ok" if status == STATUS_SUCCESS else (result.get("error") or status)
+            self.telemetry.record_stages(result.get("stages"), outcome, seed=seed, cell=list(cell), worker=worker)
+        self.sweep.record(cell, status == STATUS_SUCCESS,
+                          (fields["gen_time"] or 0) + (fields["compile_time"] or 0), label)
+        if status == STATUS_SUCCESS:
+            self.successes += 1
+            self.progress_bar.update(1)
+        return {"ok": True}
+
+
+class FarmRequestHandler(socketserver.StreamRequestHandler):
+    timeout = 60
+
+    def handle(self):
+        try:
+            reply = self.server.coordinator.handle(json.loads(self.rfile.readline()))
+        except Exception as e:
+            reply = {"error": str(e)}
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class FarmServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+
+def run_coordinator(coordinator, host, port):
+    """Serves requests one at a time until coordinator.finished()."""
+    with FarmServer((host, port), FarmRequestHandler) as server:
+        server.coordinator = coordinator
+        server.timeout = 1
+        print(f"Coordinator listening on {host}:{port}, first seed {coordinator.next_seed}")
+        while not coordinator.finished():
+            server.handle_request()
+            coordinator.expire_leases()
+    coordinator.progress_bar.close()
+    if coordinator.telemetry is not None:
+        coordinator.telemetry.print_summary()
+    for [dag_node_num, dag_density, attempts, successes, mean_cost, labels] in coordinator.sweep.summary():
+        ratio = successes / attempts if attempts else 0
+        print(f"DAG nodes {dag_node_num}, density {dag_density}: {successes}/{attempts} successful "
+              f"({ratio:.2%}), {mean_cost:.1f}s per attempt, {labels} distinct labels this run")
+
+
+def keep_lease(address, worker_id, seed, interval, stop):
+    while not stop.wait(interval):
+        try:
+            request(address, {"op": "heartbeat", "worker": worker_id, "seed": seed}, retry_time=interval)
+        except (OSError, ValueError):
+            pass
+
+
+def run_job(address, worker_id, job, smith_executable, p4c_barefoot, p4c_build_logs, scratch_dir,
+            keep_failed_logs, limits):
+    """Generates and compiles the program of a job. Returns [result, artifacts]."""
+    [folder_name, gen_time, canon_hash, stages] = generate_smith_program(
+        job["seed"], job["dag_node_num"], job["dag_density"], smith_executable=smith_executable,
+        dedup=True, scratch_dir=scratch_dir)
+    result = {"status": STATUS_GEN_FAILED, "gen_time": gen_time, "canon_hash": canon_hash, "stages": stages}
+    if folder_name is None:
+        return [result, None]
+    result["p4_size"] = os.path.getsize(os.path.join(folder_name, "smith.p4"))
+    reply = request(address, {"op": "claim", "worker": worker_id, "seed": job["seed"], "canon_hash": canon_hash})
+    if reply.get("duplicate"):
+        shutil.rmtree(folder_name, ignore_errors=True)
+        result["status"] = STATUS_DUPLICATE
+        return [result, None]
+    [folder_name, success, compile_time, error_class, max_rss, compile_stages] = compile_smith_program(
+        folder_name, p4c_barefoot, keep_failed_logs, job["profile"], p4c_build_logs, limits=limits)
+    stages.update(compile_stages)
+    result.update(status=STATUS_SUCCESS if success else STATUS_FAILED, compile_time=compile_time,
+                  error=error_class, max_rss=max_rss, folder=os.path.basename(folder_name))
+    if not success:
+        return [result, None]
+    artifacts = pack_artifacts(folder_name)
+    shutil.rmtree(folder_name, ignore_errors=True)
+    return [result, artifacts]
+
+
+def worker_loop(address, smith_executable, p4c_barefoot, p4c_build_logs, scratch_dir, keep_failed_logs,
+                limits):
+    """Leases and runs jobs until the coordinator is done."""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    while True:
+        reply = request(address, {"op": "lease", "worker": worker_id})
+        if reply.get("done") or reply.get("job") is None:
+            return
+        job = reply["job"]
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=keep_lease, daemon=True,
+                                     args=(address, worker_id, job["seed"], reply["lease_timeout"] / 4, stop))
+        heartbeat.start()
+        try:
+            [result, artifacts] = run_job(address, worker_id, job, smith_executable, p4c_barefoot,
+                                          p4c_build_logs, scratch_dir, keep_failed_logs, limits)
+        except Exception as e:
+            [result, artifacts] = [{"status": STATUS_FAILED, "error": f"exception: {e}"}, None]
+        finally:
+            stop.set()
+        request(address, {"op": "result", "worker": worker_id, "job": job, "result": result,
+                          "artifacts": artifacts})
+
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return (host, int(port))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distribute P4Smith generation and compilation over several hosts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    coordinator = subparsers.add_parser("coordinator", help="Hand out jobs and collect the results.")
+    coordinator.add_argument("-n", "--num-repetitions", type=int, required=True,
+                             help="Number of successful programs required.")
+    coordinator.add_argument("--host", type=str, default="0.0.0.0", help="Address to listen on.")
+    coordinator.add_argument("--port", type=int, default=7700, help="Port to listen on (default: 7700).")
+    coordinator.add_argument("--profile", choices=["full", "labels"], default="labels",
+                             help="Compile profile of the jobs, see run_smith.py (default: labels).")
+    coordinator.add_argument("--dag-node-num", type=str, default=SMITH_DAG_NODE_NUM,
+                             help="p4smith DAG node counts to sweep, see run_smith.py.")
+    coordinator.add_argument("--dag-density", type=str, default=SMITH_DAG_DENSITY,
+                             help="p4smith DAG densities to sweep, see run_smith.py.")
+    coordinator.add_argument("--min-cell-attempts", type=int, default=20,
+                             help="Attempts every DAG parameter cell gets first (default: 20).")
+    coordinator.add_argument("--seed", type=int, default=None, help="Base seed, see run_smith.py.")
+    coordinator.add_argument("--lease-timeout", type=float, default=600,
+                             help="Seconds without heartbeat after which a job is requeued (default: 600).")
+    coordinator.add_argument("--telemetry", type=str, default="",
+                             help="Append the stage telemetry reported by the workers to this JSON-lines file.")
+    coordinator.add_argument("--telemetry-prom", type=str, default="",
+                             help="Keep a Prometheus textfile with the per-stage summary up to date.")
+    coordinator.add_argument("--manifest", type=str, default=MANIFEST_NAME,
+                             help=f"Run manifest (default: {MANIFEST_NAME}).")
+    coordinator.add_argument("--output-dir", type=str, default=".",
+                             help="Where the artifacts of successful programs are stored (default: .).")
+
+    worker = subparsers.add_parser("worker", help="Run jobs leased from a coordinator.")
+    worker.add_argument("--coordinator", type=str, required=True, help="Coordinator address, host:port.")
+    worker.add_argument("-e", "--smith-executable", type=str, required=True,
+                        help="Full path to the 'smith' executable.")
+    worker.add_argument("-c", "--p4c-barefoot", type=str, required=True,
+                        help="Full path to the 'p4c-barefoot' executable.")
+    worker.add_argument("--p4c-build-logs", type=str, default="",
+                        help="Full path to 'p4c-build-logs', builds metrics.json for the labels profile.")
+    worker.add_argument("-w", "--workers", type=int, default=4, help="Jobs run in parallel (default: 4).")
+    worker.add_argument("--scratch-dir", type=str, default="/dev/shm",
+                        help="Where programs are generated and compiled (default: /dev/shm).")
+    worker.add_argument("--keep-failed-logs", choices=["none", "interesting", "all"], default="interesting",
+                        help="Which logs of failed compilations to keep locally, see run_smith.py.")
+    worker.add_argument("--compile-mem-limit", type=str, default="",
+                        help="Address space limit of every compiler process, e.g. 16G.")
+    worker.add_argument("--compile-cpu-limit", type=int, default=0,
+                        help="CPU time limit of every compiler process, in seconds.")
+
+    args = parser.parse_args()
+    if args.command == "coordinator":
+        manifest = RunManifest(args.manifest)
+        sweep = DagSweep(parse_values(args.dag_node_num, int), parse_values(args.dag_density, float),
+                         args.min_cell_attempts)
+        telemetry = None
+        if args.telemetry != "" or args.telemetry_prom != "":
+            telemetry = Telemetry(args.telemetry, args.telemetry_prom)
+        run_coordinator(Coordinator(manifest, args.num_repetitions, sweep, args.profile, args.lease_timeout,
+                                    os.path.abspath(args.output_dir), args.seed, telemetry),
+                        args.host, args.port)
+        manifest.close()
+        if telemetry is not None:
+            telemetry.close()
+        return
+
+    limits = None
+    if args.compile_mem_limit != "" or args.compile_cpu_limit > 0:
+        limits = [parse_size(args.compile_mem_limit) if args.compile_mem_limit != "" else None,
+                  args.compile_cpu_limit or None]
+    scratch_dir = os.path.abspath(args.scratch_dir)
+    os.makedirs(scratch_dir, exist_ok=True)
+    processes = [multiprocessing.Process(target=worker_loop,
+                                         args=(parse_address(args.coordinator), args.smith_executable,
+                                               args.p4c_barefoot, args.p4c_build_logs, scratch_dir,
+                                               args.keep_failed_logs, limits))
+                 for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import os
+import sqlite3
+from datetime import datetime
+
+# Default manifest file name, created next to the smith_run_* folders
+MANIFEST_NAME = "smith_manifest.db"
+
+# attempt status values
+STATUS_GENERATED = "generated"      # smith.p4 written, waiting for compilation
+STATUS_GEN_FAILED = "gen-failed"    # p4smith failed, nothing kept on disk
+STATUS_DUPLICATE = "duplicate"      # canonically identical to an earlier program, not compiled
+STATUS_SUCCESS = "success"          # compiled with 0 errors
+STATUS_FAILED = "failed"            # compilation failed or timed out
+STATUS_REMOVED = "removed"          # folder was deleted after a failed (re)build
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    folder        TEXT,
+    seed          INTEGER,
+    dag_node_num  INTEGER,
+    dag_density   REAL,
+    status        TEXT NOT NULL,
+    error         TEXT,
+    gen_time      REAL,
+    compile_time  REAL,
+    p4_file       TEXT,
+    pipe_dir      TEXT,
+    created_at    TEXT NOT NULL,
+    updated_at    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_status ON attempts (status);
+CREATE INDEX IF NOT EXISTS attempts_folder ON attempts (folder);
+CREATE INDEX IF NOT EXISTS attempts_seed ON attempts (seed);
+"""
+
+# columns added after the first version of the schema, as (name, type);
+# they are added to existing manifests when opened
+_ADDED_COLUMNS = [
+    ("canon_hash", "TEXT"),
+    ("p4_size", "INTEGER"),     # bytes of the generated program
+    ("max_rss", "INTEGER"),     # peak resident memory of the compiler, in bytes
+    ("worker", "TEXT"),         # smith_farm worker that ran the attempt
+    ("build_logs", "TEXT"),     # when p4c-build-logs last succeeded on the compiled program
+]
+
+_COLUMNS = ("folder", "seed", "dag_node_num", "dag_density", "status", "error",
+            "gen_time", "compile_time", "p4_file", "pipe_dir") + tuple(name for name, _ in _ADDED_COLUMNS)
+
+
+class RunManifest:
+    """
+    SQLite manifest of P4Smith attempts, one row per attempt.
+
+    Folder and artifact paths are stored relative to the directory holding the
+    database so that a dataset can be moved around as a whole. Only the main
+    process of a script is expected to write to it; workers return their
+    results and the caller records them.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.root = os.path.dirname(self.path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(attempts)")}
+        for name, sql_type in _ADDED_COLUMNS:
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE attempts ADD COLUMN {name} {sql_type}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS attempts_canon_hash ON attempts (canon_hash)")
+        self.conn.commit()
+
+    @classmethod
+    def find(cls, directory, path=""):
+        """
+        Opens the manifest at `path` if given, otherwise the default manifest in `directory`.
+        Returns None when there is none, so callers can fall back to walking the tree.
+        """
+        if path == "":
+            path = os.path.join(directory, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        return cls(path)
+
+    def close(self):
+        self.conn.close()
+
+    def _relative(self, path):
+        if path is None:
+            return None
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def abspath(self, path):
+        """Resolves a path stored in the manifest."""
+        return os.path.join(self.root, path)
+
+    def add_attempt(self, folder, status, **fields):
+        """Inserts a new attempt and returns its id."""
+        now = datetime.now().isoformat()
+        row = {"folder": self._relative(folder), "status": status}
+        for key in ("p4_file", "pipe_dir"):
+            if key in fields:
+                fields[key] = self._relative(fields[key])
+        row.update(fields)
+        unknown = set(row) - set(_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown manifest columns: {sorted(unknown)}")
+        keys = list(row)
+        cursor = self.conn.execute(
+            f"INSERT INTO attempts ({', '.join(keys)}, created_at, updated_at) "
+            f"VALUES ({', '.join('?' for _ in keys)}, ?, ?)",
+            [row[k] for k in keys] + [now, now])
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def update_attempt(self, attempt_id, **fields):
+        for key in ("folder", "p4_file", "pipe_dir"):
+            if key in fields:
+                fields[key] = self._relative(fields[key])
+        unknown = set(fields) - set(_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown manifest columns: {sorted(unknown)}")
+        fields["updated_at"] = datetime.now().isoformat()
+        self.conn.execute(
+            f"UPDATE attempts SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+            list(fields.values()) + [attempt_id])
+        self.conn.commit()
+
+    def attempts(self, status=None):
+        """Returns the attempt rows, optionally filtered by status (a string or a list)."""
+        if status is None:
+            return self.conn.execute("SELECT * FROM attempts ORDER BY id").fetchall()
+        if isinstance(status, str):
+            status = [status]
+        return self.conn.execute(
+            f"SELECT * FROM attempts WHERE status IN ({', '.join('?' for _ in status)}) ORDER BY id",
+            list(status)).fetchall()
+
+    def iter_attempts(self, status, batch_size=1000):
+        """
+        Yields the attempt rows with the given status (a string or a list) in batches, so
+        that huge manifests are not loaded at once and rows may be updated meanwhile.
+        """
+        if isinstance(status, str):
+            status = [status]
+        last_id = 0
+        while True:
+            rows = self.conn.execute(
+                f"SELECT * FROM attempts WHERE id > ? AND status IN ({', '.join('?' for _ in status)}) "
+                "ORDER BY id LIMIT ?", [last_id] + list(status) + [batch_size]).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1]["id"]
+
+    def count(self, status=None):
+        if status is None:
+            return self.conn.execute("SELECT COUNT(*) FROM attempts").fetchone()[0]
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM attempts WHERE status = ?", (status,)).fetchone()[0]
+
+    def max_seed(self):
+        """Returns the largest recorded seed, or None if no attempt has one."""
+        return self.conn.execute("SELECT MAX(seed) FROM attempts").fetchone()[0]
+
+    def attempt_by_seed(self, seed):
+        """Returns the latest attempt row generated with `seed`, or None."""
+        return self.conn.execute(
+            "SELECT * FROM attempts WHERE seed = ? ORDER BY id DESC LIMIT 1", (seed,)).fetchone()
+
+    def footprints(self):
+        """Returns [p4_size, max_rss] of every compilation whose peak memory was recorded."""
+        return self.conn.execute(
+            "SELECT p4_size, max_rss FROM attempts "
+            "WHERE p4_size IS NOT NULL AND max_rss IS NOT NULL").fetchall()
+
+    def canon_hashes(self, status):
+        """Returns the set of canonical program hashes of the attempts with the given statuses."""
+        return {row["canon_hash"] for row in self.attempts(status) if row["canon_hash"] is not None}
+
+    def duplicate_rates(self):
+        """
+        Returns [dag_node_num, dag_density, generated, duplicates] per DAG parameter setting,
+        counting only attempts whose program was hashed.
+        """
+        return self.conn.execute(
+            "SELECT dag_node_num, dag_density, COUNT(*), "
+            f"SUM(status = '{STATUS_DUPLICATE}') FROM attempts WHERE canon_hash IS NOT NULL "
+            "GROUP BY dag_node_num, dag_density ORDER BY dag_node_num, dag_density").fetchall()
+
+    def folders(self, status=STATUS_SUCCESS):
+        """Returns the absolute folders of the attempts with the given status."""
+        return [self.abspath(row["folder"]) for row in self.attempts(status)
+                if row["folder"] is not None]
@@ -0,0 +1,173 @@
+import argparse
+import json
+import math
+import os
+import subprocess
+import time
+
+# Stage telemetry of the dataset pipeline.
+#
+# Every stage of an attempt is one JSON line:
+#   {"ts": 1729244879.1, "stage": "compile", "seconds": 12.3, "exit": "ok",
+#    "cpu": 11.9, "max_rss": 1234567890, "seed": 42, "cell": [8, 0.6]}
+# Stages: generate (p4smith), hash (canonical hash for dedup), queue (wait between
+# generation and the start of the compilation), compile (p4c-barefoot), scan (reading
+# and matching the compiler output while it runs, part of compile) and metrics
+# (p4c-build-logs --metrics-only). cpu is user + system time of the child process and
+# max_rss its peak resident memory in bytes, both from its rusage; either may be missing.
+
+
+def run_with_usage(cmd, cwd, stdout, stderr):
+    """
+    subprocess.run for a single child whose resource usage is wanted: reaps it with
+    os.wait4. Returns [returncode, cpu_seconds, max_rss_bytes].
+    """
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=stdout, stderr=stderr)
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return [proc.returncode, usage_cpu(usage), usage.ru_maxrss * 1024]
+
+
+def usage_cpu(usage):
+    """User + system seconds of a resource.struct_rusage."""
+    return usage.ru_utime + usage.ru_stime
+
+
+def quantile(values, q):
+    """Nearest-rank quantile of a sorted list, None if it is empty."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+class Telemetry:
+    """
+    Appends stage records to a JSON-lines file and keeps the per-stage samples for the
+    summary. With prom_path, the summary is also written as a Prometheus textfile (for
+    the node_exporter textfile collector), rewritten at most every prom_interval seconds
+    and on close.
+    """
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, path="", prom_path="", prom_interval=30):
+        self.file = open(path, "a") if path != "" else None
+        self.prom_path = prom_path
+        self.prom_interval = prom_interval
+        self.prom_written = 0.0
+        # stage -> {"seconds": [...], "cpu": total, "exits": {exit: count}}
+        self.stages = {}
+
+    def record(self, stage, seconds, exit="ok", cpu=None, max_rss=None, **context):
+        if seconds is None:
+            return
+        stats = self.stages.setdefault(stage, {"seconds": [], "cpu": 0.0, "exits": {}})
+        stats["seconds"].append(seconds)
+        stats["cpu"] += cpu or 0.0
+        stats["exits"][exit] = stats["exits"].get(exit, 0) + 1
+        if self.file is not None:
+            entry = {"ts": round(time.time(), 3), "stage": stage, "seconds": round(seconds, 6), "exit": exit}
+            if cpu is not None:
+                entry["cpu"] = round(cpu, 6)
+            if max_rss is not None:
+                entry["max_rss"] = max_rss
+            entry.update(context)
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+        if self.prom_path != "" and time.monotonic() - self.prom_written > self.prom_interval:
+            self.write_prometheus()
+
+    def record_stages(self, stages, exit="ok", **context):
+        """
+        Records the stages returned by a pipeline task, a dict stage -> {"seconds", "cpu",
+        "max_rss"}. The scan stage is part of compile and never fails on its own.
+        """
+        for stage, usage in (stages or {}).items():
+            self.record(stage, usage.get("seconds"), "ok" if stage == "scan" else exit,
+                        usage.get("cpu"), usage.get("max_rss"), **context)
+
+    def summary(self):
+        """Returns [stage, count, p50, p95, p99, total_seconds, cpu_seconds, exits] per stage."""
+        rows = []
+        for stage, stats in self.stages.items():
+            seconds = sorted(stats["seconds"])
+            rows.append([stage, len(seconds)] + [quantile(seconds, q) for q in self.QUANTILES] +
+                        [sum(seconds), stats["cpu"], dict(stats["exits"])])
+        return rows
+
+    def print_summary(self):
+        print(f"{'stage':<10}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'total h':>10}{'cpu h':>10}  exits")
+        for [stage, count, p50, p95, p99, total, cpu, exits] in self.summary():
+            exits = ", ".join(f"{exit}: {n}" for exit, n in sorted(exits.items(), key=lambda e: -e[1]))
+            print(f"{stage:<10}{count:>8}{p50:>10.3f}{p95:>10.3f}{p99:>10.3f}{total / 3600:>10.3f}"
+                  f"{cpu / 3600:>10.3f}  {exits}")
+
+    def write_prometheus(self):
+        lines = ["# HELP smith_stage_seconds Wall time of a pipeline stage.",
+                 "# TYPE smith_stage_seconds summary"]
+        for [stage, count, *quantiles, total, _, _] in self.summary():
+            for q, value in zip(self.QUANTILES, quantiles):
+                lines.append(f'smith_stage_seconds{{stage="{stage}",quantile="{q}"}} {value}')
+            lines.append(f'smith_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'smith_stage_seconds_count{{stage="{stage}"}} {count}')
+        lines += ["# HELP smith_stage_cpu_seconds_total CPU time of the child processes of a stage.",
+                  "# TYPE smith_stage_cpu_seconds_total counter"]
+        for [stage, *_, cpu, _] in self.summary():
+            lines.append(f'smith_stage_cpu_seconds_total{{stage="{stage}"}} {cpu}')
+        lines += ["# HELP smith_stage_exits_total Outcomes of a pipeline stage.",
+                  "# TYPE smith_stage_exits_total counter"]
+        for [stage, *_, exits] in self.summary():
+            for exit, n in exits.items():
+                lines.append(f'smith_stage_exits_total{{stage="{stage}",exit="{exit}"}} {n}')
+        # the textfile collector may read at any time
+        tmp = f"{self.prom_path}.tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, self.prom_path)
+        self.prom_written = time.monotonic()
+
+    def close(self):
+        if self.prom_path != "":
+            self.write_prometheus()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def load(path, telemetry=None):
+    """
+    Reads a telemetry JSON-lines file into telemetry (a new Telemetry without output files
+    if None) and returns it.
+    """
+    if telemetry is None:
+        telemetry = Telemetry()
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line of a killed run may be truncated
+                continue
+            telemetry.record(entry["stage"], entry["seconds"], entry.get("exit", "ok"), entry.get("cpu"))
+    return telemetry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the stage telemetry of run_smith.py runs.")
+    parser.add_argument("files", nargs="+", help="Telemetry JSON-lines files (see --telemetry).")
+    parser.add_argument("--prom", type=str, default="", help="Also write the summary as a Prometheus textfile.")
+    args = parser.parse_args()
+    telemetry = Telemetry(prom_path=args.prom)
+    for path in args.files:
+        load(path, telemetry)
+    telemetry.print_summary()
+    telemetry.close()
+
+
+if __name__ == "__main__":
+    main()
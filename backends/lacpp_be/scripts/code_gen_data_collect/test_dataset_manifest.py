@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+from dataset_manifest import DatasetManifest, RECORD_FAILED, RECORD_OK
+from feature_label_extract import RECORD_INPUTS, folder_fingerprint
+
+
+class FolderFingerprintTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = self.tmp.name
+        for name in RECORD_INPUTS:
+            path = os.path.join(self.folder, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write("{}")
+        self.fingerprint = folder_fingerprint(self.folder, "1|v")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_unchanged_folder(self):
+        self.assertEqual(folder_fingerprint(self.folder, "1|v"), self.fingerprint)
+
+    def test_changed_input(self):
+        path = os.path.join(self.folder, RECORD_INPUTS[0])
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertNotEqual(folder_fingerprint(self.folder, "1|v"), self.fingerprint)
+
+    def test_missing_input(self):
+        os.remove(os.path.join(self.folder, RECORD_INPUTS[-1]))
+        self.assertNotEqual(folder_fingerprint(self.folder, "1|v"), self.fingerprint)
+
+    def test_extractor_version(self):
+        self.assertNotEqual(folder_fingerprint(self.folder, "2|v"), self.fingerprint)
+
+
+class DatasetManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "dataset_manifest.db")
+        self.manifest = DatasetManifest(self.path)
+
+    def tearDown(self):
+        self.manifest.close()
+        self.tmp.cleanup()
+
+    def test_put_and_reopen(self):
+        self.manifest.put("a", "f1", RECORD_OK, "a.json", {"y": [1, 2, 3, 4]})
+        self.manifest.put("b", "f2", RECORD_FAILED)
+        self.manifest.close()
+        self.manifest = DatasetManifest(self.path)
+        self.assertEqual(self.manifest.fingerprints(), {"a": "f1", "b": "f2"})
+        self.assertEqual(self.manifest.fingerprints(RECORD_OK), {"a": "f1"})
+        self.assertEqual(list(self.manifest.iter_stats()), [{"y": [1, 2, 3, 4]}])
+        self.assertEqual(self.manifest.count(RECORD_OK), 1)
+        self.assertEqual(self.manifest.count(), 2)
+
+    def test_put_replaces(self):
+        self.manifest.put("a", "f1", RECORD_OK, "a.json", {"y": [1]})
+        self.manifest.put("a", "f2", RECORD_FAILED)
+        self.assertEqual(self.manifest.fingerprints(), {"a": "f2"})
+        self.assertEqual(list(self.manifest.iter_stats()), [])
+
+    def test_remove(self):
+        self.manifest.put("a", "f1", RECORD_OK, "a.json", {"y": [1]})
+        self.assertEqual(self.manifest.remove("a"), "a.json")
+        self.assertIsNone(self.manifest.remove("a"))
+        self.assertEqual(self.manifest.fingerprints(), {})
+
+    def test_clear(self):
+        self.manifest.put("a", "f1", RECORD_OK, "a.json", {"y": [1]})
+        self.manifest.clear()
+        self.assertEqual(self.manifest.count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
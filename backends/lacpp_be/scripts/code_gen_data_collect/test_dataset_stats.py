@@ -0,0 +1,163 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from dataset_stats import GRAPH_COLUMNS, LABEL_ATTRIBUTES, MEANS_STDS, NODE_ATTRIBUTES, REPORT_QUANTILES, \
+    SKETCH_ACCURACY, UNKNOWN_ATTRIBUTE, QuantileSketch, RunningStats, dataset_report, write_html_report
+
+
+def random_rows(rng, count, dim=3):
+    """Rows of mixed scales and signs, none close to 0."""
+    rows = rng.lognormal(mean=2.0, sigma=1.5, size=(count, dim))
+    rows[:, 1] *= -1
+    return rows
+
+
+class RunningStatsTest(unittest.TestCase):
+
+    def test_batches_match_numpy(self):
+        rng = np.random.default_rng(0)
+        rows = random_rows(rng, 1000)
+        stats = RunningStats(3)
+        for batch in np.array_split(rows, 7):
+            stats.update(batch)
+        self.assertEqual(stats.count, 1000)
+        np.testing.assert_allclose(stats.mean, rows.mean(axis=0))
+        np.testing.assert_allclose(stats.std(), rows.std(axis=0))
+
+    def test_merge_matches_single_pass(self):
+        rng = np.random.default_rng(1)
+        rows = random_rows(rng, 500)
+        first, second, empty = RunningStats(3), RunningStats(3), RunningStats(3)
+        first.update(rows[:123])
+        second.update(rows[123:])
+        first.merge(second)
+        first.merge(empty)
+        np.testing.assert_allclose(first.mean, rows.mean(axis=0))
+        np.testing.assert_allclose(first.std(), rows.std(axis=0))
+
+    def test_merge_dict_round_trip(self):
+        rng = np.random.default_rng(2)
+        rows = random_rows(rng, 200)
+        saved = RunningStats(3)
+        saved.update(rows[:50])
+        merged = RunningStats(3)
+        merged.update(rows[50:])
+        merged.merge_dict(json.loads(json.dumps(saved.to_dict())))
+        np.testing.assert_allclose(merged.mean, rows.mean(axis=0))
+        np.testing.assert_allclose(merged.std(), rows.std(axis=0))
+
+    def test_constant_column(self):
+        stats = RunningStats(2)
+        stats.update([[1, 5], [2, 5], [3, 5]])
+        self.assertEqual(stats.std()[1], 1.0)
+
+
+class QuantileSketchTest(unittest.TestCase):
+
+    def assert_quantiles(self, sketch, rows):
+        for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+            expected = np.quantile(rows, q, axis=0, method="lower")
+            np.testing.assert_allclose(sketch.quantile(q), expected, rtol=SKETCH_ACCURACY)
+
+    def test_relative_accuracy(self):
+        rng = np.random.default_rng(3)
+        rows = random_rows(rng, 5000)
+        sketch = QuantileSketch(3)
+        sketch.update(rows)
+        self.assert_quantiles(sketch, rows)
+
+    def test_merge_matches_single_sketch(self):
+        rng = np.random.default_rng(4)
+        rows = random_rows(rng, 3000)
+        merged = QuantileSketch(3)
+        for batch in np.array_split(rows, 5):
+            part = QuantileSketch(3)
+            part.update(batch)
+            merged.merge_dict(json.loads(json.dumps(part.to_dict())))
+        single = QuantileSketch(3)
+        single.update(rows)
+        self.assertEqual(merged.to_dict(), single.to_dict())
+        self.assert_quantiles(merged, rows)
+
+    def test_zeros(self):
+        sketch = QuantileSketch(1)
+        sketch.update([[0], [0], [0], [4]])
+        self.assertEqual(sketch.quantile(0.5)[0], 0.0)
+
+    def test_merge_rejects_other_accuracy(self):
+        with self.assertRaises(ValueError):
+            QuantileSketch(1).merge(QuantileSketch(1, accuracy=0.05))
+
+
+class DatasetReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(5)
+        self.nodes = []
+        self.labels = []
+        self.graphs = []
+        for i in range(60):
+            part = os.path.join(self.tmp.name, f"part-{i % 2}")
+            os.makedirs(part, exist_ok=True)
+            node_attr = rng.integers(0, 50, size=(rng.integers(1, 8), len(NODE_ATTRIBUTES)))
+            node_attr[:, UNKNOWN_ATTRIBUTE] = rng.random(len(node_attr)) < 0.2
+            edges = int(rng.integers(0, 5))
+            y = rng.integers(1, 1000, size=len(LABEL_ATTRIBUTES))
+            with open(os.path.join(part, f"r{i}.json"), "w") as f:
+                json.dump({"node_attr": node_attr.tolist(), "edge_attr": ["1"] * edges, "y": y.tolist()}, f)
+            self.nodes.append(node_attr)
+            self.labels.append(y)
+            self.graphs.append([len(node_attr), edges, node_attr[:, UNKNOWN_ATTRIBUTE].mean()])
+        with open(os.path.join(self.tmp.name, "part-0", "empty.json"), "w") as f:
+            json.dump({"node_attr": [], "y": [0, 0, 0, 0]}, f)
+        with open(os.path.join(self.tmp.name, MEANS_STDS), "w") as f:
+            json.dump({"node_mean": [0] * len(NODE_ATTRIBUTES)}, f)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_section(self, section, columns, rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        for i, column in columns.items():
+            stats = section[column]
+            values = rows[:, i]
+            self.assertAlmostEqual(stats["mean"], values.mean())
+            self.assertAlmostEqual(stats["std"], values.std())
+            self.assertEqual(stats["min"], values.min())
+            self.assertEqual(stats["max"], values.max())
+            self.assertAlmostEqual(stats["zero_ratio"], (values == 0).mean())
+            self.assertEqual(sum(stats["histogram"]["counts"]), len(values))
+            for q in REPORT_QUANTILES:
+                np.testing.assert_allclose(stats["quantiles"][f"p{round(q * 100):02d}"],
+                                           np.quantile(values, q, method="lower"), rtol=SKETCH_ACCURACY)
+
+    def test_report(self):
+        # small chunks, so that the report is merged from many partial ones
+        result = dataset_report(self.tmp.name, num_workers=2, chunk_size=7)
+        nodes = np.concatenate(self.nodes)
+        self.assertEqual(result["graphs"], 60)
+        self.assertEqual(result["skipped"], 1)
+        self.assertEqual(result["nodes"], len(nodes))
+        self.assertEqual(result["edges"], sum(graph[1] for graph in self.graphs))
+        self.assertAlmostEqual(result["unknown_tables"]["ratio"], nodes[:, UNKNOWN_ATTRIBUTE].mean())
+        self.assertEqual(result["unknown_tables"]["graphs_with_unknown"],
+                         sum(bool(graph[:, UNKNOWN_ATTRIBUTE].any()) for graph in self.nodes))
+        self.assert_section(result["node_attr"], NODE_ATTRIBUTES, nodes)
+        self.assert_section(result["y"], LABEL_ATTRIBUTES, self.labels)
+        self.assert_section(result["graph"], GRAPH_COLUMNS, self.graphs)
+
+        path = os.path.join(self.tmp.name, "report.html")
+        write_html_report(result, path)
+        with open(path) as f:
+            page = f.read()
+        self.assertIn(f"{result['graphs']} graphs, {result['nodes']} nodes", page)
+        self.assertEqual(page.count("<svg"), len(NODE_ATTRIBUTES) + len(LABEL_ATTRIBUTES) + len(GRAPH_COLUMNS))
+
+
+if __name__ == "__main__":
+    unittest.main()
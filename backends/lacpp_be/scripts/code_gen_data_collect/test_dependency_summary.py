@@ -0,0 +1,74 @@
+import importlib.util
+import os
+import random
+import tempfile
+import unittest
+
+from bench_dependency_summary import legacy_process_table_dependency_summary, synthetic_summary
+from dependency_summary import parse_table_dependency_summary
+
+# Two stages of three columns. t1_0 is listed twice, t1_0 -> t4_0 is found twice (as A,
+# then as C), and the stage annotations hold spaces. What the former networkx parser
+# made of it: nodes in order of first appearance, edges grouped by source node in order
+# of first occurrence, the last dependency of an edge winning.
+SUMMARY = """#pipeline pipe
+#stage 0
+ ^-- --- t1_0(0, 11) : ingress
+ A^- --- t2_0(0, 11) : ingress
+ -B^ --- t3_0(0, 11) : ingress
+#stage 1
+ -C- ^-- t1_0(1, 11) : ingress
+ A-B C^- t4_0 (1, 11) : ingress
+*** tables in stage 1 ***
+ --- -B^ t5_0(1, 11) : ingress
+#dependencies
+A :  CONTROL_DEFAULT_NEXT_TABLE
+B :  ANTI_NEXT_TABLE_DATA ANTI_NEXT_TABLE_CONTROL
+C :  IXBAR_READ REDUCTION_OR_READ
+"""
+
+NODES = ["t1_0", "t2_0", "t3_0", "t4_0", "t5_0"]
+EDGE_INDEX = [[0, 0, 1, 1, 2, 3], [1, 3, 2, 0, 3, 4]]
+EDGE_MASKS = [1, 4, 2, 4, 2, 2]
+
+
+class ParseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def parse(self, content):
+        path = os.path.join(self.tmp.name, "table_dependency_summary.log")
+        with open(path, "w") as f:
+            f.write(content)
+        return parse_table_dependency_summary(path)
+
+    def test_graph(self):
+        self.assertEqual(self.parse(SUMMARY), [NODES, EDGE_INDEX, EDGE_MASKS])
+
+    def test_no_dependencies(self):
+        self.assertEqual(self.parse("#pipeline pipe\n#stage 0\n ^- t1_0(0,11) : ingress\n"
+                                    " -^ t2_0(0,11) : ingress\n#dependencies\n"),
+                         [["t1_0", "t2_0"], [[], []], []])
+
+    @unittest.skipIf(importlib.util.find_spec("networkx") is None, "needs networkx")
+    def test_matches_legacy_parser(self):
+        path = os.path.join(self.tmp.name, "table_dependency_summary.log")
+        rng = random.Random(0)
+        for _ in range(5):
+            synthetic_summary(path, 64, 8, 0.1, rng)
+            [nodes, edge_index, edge_masks] = parse_table_dependency_summary(path)
+            edge_attr = [bin(mask)[2:] for mask in edge_masks]
+            self.assertEqual({"nodes": nodes, "edge_index": edge_index, "edge_attr": edge_attr},
+                             legacy_process_table_dependency_summary(path))
+
+    def test_unknown_letter(self):
+        with self.assertRaises(KeyError):
+            self.parse(SUMMARY.replace("A :  CONTROL_DEFAULT_NEXT_TABLE\n", ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
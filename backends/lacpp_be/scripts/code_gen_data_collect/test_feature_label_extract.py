@@ -0,0 +1,226 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import feature_label_extract
+from dataset_manifest import DatasetManifest, DATASET_MANIFEST_NAME, RECORD_FAILED, RECORD_OK
+from feature_label_extract import BatchExtractor, build_dataset, run_p4lacpp
+
+# Tests of the feature extraction and the dataset build with a stand-in p4lacpp: it
+# writes FEATURES to its --feature-fd, fails on programs containing "bad" and crashes
+# on the programs of the folders that have a crash_<folder> file in its flag directory.
+
+FEATURES = {
+    "ingress": {
+        "tables": {
+            "t1_0": {"size": 16, "actions": ["set"], "matches": [["exact", [8]]]},
+            "t2_0": {"size": 4, "actions": [], "matches": [["ternary", [8, 16]]]},
+        },
+        "actions": {"set": {"op_num": 2}},
+    }
+}
+
+FAKE_P4LACPP = """#!{python}
+import json, os, sys
+features = json.loads({features!r})
+
+def result(path):
+    folder = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    if os.path.exists(os.path.join({flags!r}, "crash_" + folder)):
+        return None
+    with open(path) as f:
+        if "bad" in f.read():
+            return {{"error": "parse failed"}}
+    return {{"features": features}}
+
+fd = int(sys.argv[sys.argv.index("--feature-fd") + 1])
+if sys.argv[1] == "--batch":
+    for line in sys.stdin:
+        # more than a pipe holds, should anyone read stdout instead of the feature fd
+        print("frontend output " * 8192, flush=True)
+        path = line.strip()
+        found = result(path)
+        if found is None:
+            sys.exit(3)
+        found["file"] = path
+        os.write(fd, (json.dumps(found) + "\\n").encode())
+else:
+    print("frontend output")
+    found = result(sys.argv[1])
+    if found is None or "error" in found:
+        sys.exit(1)
+    os.write(fd, (json.dumps(found["features"]) + "\\n").encode())
+"""
+
+DEPENDENCY_SUMMARY = """#pipeline pipe
+#stage 0
+ ^---- t1_0(0,11) : ingress
+ A^--- t2_0(0,11) : ingress
+#dependencies
+A :  CONTROL_DEFAULT_NEXT_TABLE
+"""
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+
+def write_program(root, name, source="control c() { apply { } }\n"):
+    """A compiled program folder as run_smith.py leaves it."""
+    folder = os.path.join(root, name)
+    write_file(os.path.join(folder, "smith.p4"), source)
+    write_file(os.path.join(folder, "opt.p4"), source)
+    write_file(os.path.join(folder, "smith.tofino/pipe/metrics.json"),
+               json.dumps({"mau": {"latency": [{"gress": "ingress", "cycles": 20}], "srams": 3, "tcams": 1}}))
+    write_file(os.path.join(folder, "smith.tofino/pipe/logs/resources.json"),
+               json.dumps({"resources": {"mau": {"mau_stages": [{}, {}]}}}))
+    write_file(os.path.join(folder, "smith.tofino/pipe/logs/table_dependency_summary.log"), DEPENDENCY_SUMMARY)
+    return folder
+
+
+class FakeP4lacppTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.flags = os.path.join(self.tmp.name, "flags")
+        os.makedirs(self.flags)
+        self.p4lacpp = write_file(os.path.join(self.tmp.name, "p4lacpp"),
+                                  FAKE_P4LACPP.format(python=sys.executable, features=json.dumps(FEATURES),
+                                                      flags=self.flags))
+        os.chmod(self.p4lacpp, 0o755)
+        self.saved_p4lacpp = feature_label_extract.P4LACPP
+        feature_label_extract.P4LACPP = self.p4lacpp
+
+    def tearDown(self):
+        feature_label_extract.P4LACPP = self.saved_p4lacpp
+        self.tmp.cleanup()
+
+    def set_crash(self, folder, crash=True):
+        flag = os.path.join(self.flags, "crash_" + os.path.basename(folder))
+        if crash:
+            write_file(flag, "")
+        elif os.path.exists(flag):
+            os.remove(flag)
+
+
+class ExtractorTest(FakeP4lacppTest):
+
+    def setUp(self):
+        super().setUp()
+        self.programs = {name: os.path.join(write_program(self.tmp.name, name, source), "opt.p4")
+                         for name, source in (("p0", "control c() { apply { } }\n"), ("p1", "bad\n"),
+                                              ("p2", "control d() { apply { } }\n"))}
+        self.output = io.StringIO()
+        self.quiet = contextlib.redirect_stdout(self.output)
+        self.quiet.__enter__()
+
+    def tearDown(self):
+        self.quiet.__exit__(None, None, None)
+        super().tearDown()
+
+    def test_run_p4lacpp(self):
+        self.assertEqual(run_p4lacpp(self.programs["p0"]), FEATURES)
+        self.assertIsNone(run_p4lacpp(self.programs["p1"]))
+        self.set_crash("p2")
+        self.assertIsNone(run_p4lacpp(self.programs["p2"]))
+
+    def test_batch(self):
+        extractor = BatchExtractor(self.p4lacpp)
+        try:
+            # each program floods stdout, which must not be read nor block p4lacpp
+            for _ in range(3):
+                self.assertEqual(extractor.features(self.programs["p0"]), FEATURES)
+            pid = extractor.proc.pid
+            self.assertIsNone(extractor.features(self.programs["p1"]))
+            self.assertIn("parse failed", self.output.getvalue())
+            self.assertEqual(extractor.features(self.programs["p2"]), FEATURES)
+            self.assertEqual(extractor.proc.pid, pid)
+        finally:
+            extractor.close()
+        self.assertIsNone(extractor.proc)
+        self.assertIsNone(extractor.results)
+
+    def test_batch_restarts_after_crash(self):
+        extractor = BatchExtractor(self.p4lacpp)
+        try:
+            self.assertEqual(extractor.features(self.programs["p0"]), FEATURES)
+            self.set_crash("p2")
+            self.assertIsNone(extractor.features(self.programs["p2"]))
+            self.assertIn("extractor exited", self.output.getvalue())
+            self.assertIsNone(extractor.proc)
+            self.assertEqual(extractor.features(self.programs["p0"]), FEATURES)
+            # killed between two programs
+            extractor.proc.kill()
+            extractor.proc.wait()
+            self.assertEqual(extractor.features(self.programs["p0"]), FEATURES)
+        finally:
+            extractor.close()
+
+
+class BuildDatasetTest(FakeP4lacppTest):
+
+    def setUp(self):
+        super().setUp()
+        self.runs = os.path.join(self.tmp.name, "runs")
+        self.output = os.path.join(self.tmp.name, "dataset")
+
+    def build(self, full_rebuild=False, batch=False):
+        """Runs build_dataset, returns its summary line."""
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            build_dataset(self.runs, self.output, num_workers=1, batch=batch, full_rebuild=full_rebuild)
+        return out.getvalue().splitlines()[-1]
+
+    def statuses(self):
+        manifest = DatasetManifest(os.path.join(self.output, DATASET_MANIFEST_NAME))
+        rows = {row["folder"]: row["status"] for row in manifest.conn.execute("SELECT folder, status FROM records")}
+        manifest.close()
+        return rows
+
+    def test_record(self):
+        write_program(self.runs, "p0")
+        self.build()
+        with open(os.path.join(self.output, "p0.json")) as f:
+            record = json.load(f)
+        self.assertEqual(record["nodes"], ["t1_0", "t2_0"])
+        self.assertEqual(record["edge_index"], [[0], [1]])
+        self.assertEqual(record["node_attr"], [[16, 2, 0, 1, 0, 0], [4, 0, 0, 0, 2, 0]])
+        self.assertEqual(record["y"], [2, 20, 3, 1])
+
+    def test_batch_crash_fails_one_folder(self):
+        for i in range(4):
+            write_program(self.runs, f"p{i}")
+        self.set_crash("p1")
+        self.assertIn("Extracted 3 records", self.build(batch=True))
+        self.assertEqual(self.statuses(), {"p0": RECORD_OK, "p1": RECORD_FAILED, "p2": RECORD_OK, "p3": RECORD_OK})
+
+    def test_failed_folder_is_retried(self):
+        write_program(self.runs, "p0")
+        self.set_crash(write_program(self.runs, "p1"))
+        self.assertIn("Extracted 1 records", self.build())
+        self.assertEqual(self.statuses(), {"p0": RECORD_OK, "p1": RECORD_FAILED})
+        # the crash was transient, the inputs of p1 did not change
+        self.set_crash("p1", False)
+        self.assertIn("Extracted 1 records, skipped 1 unchanged folders", self.build())
+        self.assertEqual(self.statuses(), {"p0": RECORD_OK, "p1": RECORD_OK})
+        self.assertTrue(os.path.exists(os.path.join(self.output, "p1.json")))
+
+    def test_full_rebuild_removes_vanished_records(self):
+        write_program(self.runs, "p0")
+        write_program(self.runs, "p1")
+        self.build()
+        os.remove(os.path.join(self.runs, "p1", "smith.p4"))
+        self.assertIn("Extracted 1 records, skipped 0 unchanged folders, removed 1 records", self.build(True))
+        self.assertEqual(sorted(name for name in os.listdir(self.output) if name.startswith("p")), ["p0.json"])
+        self.assertEqual(self.statuses(), {"p0": RECORD_OK})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import os
+import tempfile
+import unittest
+
+import json_paths
+from json_paths import LENGTH, VALUE, extract_json_paths
+
+RESOURCES = {
+    "resources": {
+        "mau": {
+            "mau_stages": [{"stage": 0, "tables": [1, 2]}, [3, 4], 5, None, "x"],
+            "empty": [],
+            "map": {"item": [1, 2]},
+            "number": 7,
+        },
+        "parser": {"states": [1, 2, 3]},
+    }
+}
+
+REQUEST = {
+    "stages": ["resources.mau.mau_stages", LENGTH],
+    "empty": ["resources.mau.empty", LENGTH],
+    "map": ["resources.mau.map", LENGTH],
+    "number": ["resources.mau.number", LENGTH],
+    "missing": ["resources.mau.missing", LENGTH],
+    "states": ["resources.parser.states", VALUE],
+    "mau_number": ["resources.mau.number", VALUE],
+}
+
+
+@unittest.skipIf(json_paths.ijson is None, "needs ijson")
+class StreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, content):
+        path = os.path.join(self.tmp.name, "resources.json")
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_matches_whole_parse(self):
+        path = self.write(json.dumps(RESOURCES))
+        expected = {"stages": 5, "empty": 0, "map": None, "number": None,
+                    "states": [1, 2, 3], "mau_number": 7}
+        self.assertEqual(extract_json_paths(path, REQUEST, streaming=False), expected)
+        self.assertEqual(extract_json_paths(path, REQUEST), expected)
+
+    def test_length_stops_at_end_of_list(self):
+        # what follows the list is never parsed
+        path = self.write('{"resources": {"mau": {"mau_stages": [{"a": [1, 2]}, [], 3], "rest": [1, 2 GARBAGE')
+        self.assertEqual(extract_json_paths(path, {"stages": ["resources.mau.mau_stages", LENGTH]}), {"stages": 3})
+        path = self.write('{"resources": {"mau": {"mau_stages": 4, "rest": [1, 2 GARBAGE')
+        self.assertEqual(extract_json_paths(path, {"stages": ["resources.mau.mau_stages", LENGTH]}),
+                         {"stages": None})
+
+    def test_malformed(self):
+        path = self.write('{"resources": {"mau": {"mau_stages": [1, 2 GARBAGE')
+        with self.assertRaises(ValueError):
+            extract_json_paths(path, {"stages": ["resources.mau.mau_stages", LENGTH]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+from p4_canon import canonical_hash, canonicalize
+
+PROGRAM = """
+#include <tna.p4>
+header h_t { bit<8> f; }
+struct meta_t { h_t h; }
+control ingress(inout meta_t m) {
+    action set(bit<8> v) { m.h.f = v; }
+    table t { key = { m.h.f : exact; } actions = { set; } size = 16; }
+    apply { t.apply(); }
+}
+"""
+
+# PROGRAM with other names, other comments and whitespace, and its two top-level
+# type declarations swapped
+RENAMED = """
+#include <tna.p4>
+// metadata first
+struct md_t { hdr_t hdr; }
+header hdr_t {
+    bit<8> field;
+}
+control ig(inout md_t md) {
+    /* one action */
+    action assign(bit<8> value) { md.hdr.field = value; }
+    table tbl { key = { md.hdr.field : exact; } actions = { assign; } size = 16; }
+    apply { tbl.apply(); }
+}
+"""
+
+
+class CanonicalizeTest(unittest.TestCase):
+
+    def test_renaming_and_layout_are_ignored(self):
+        self.assertEqual(canonicalize(PROGRAM), canonicalize(RENAMED))
+
+    def test_architecture_names_are_kept(self):
+        self.assertNotEqual(canonicalize(PROGRAM), canonicalize(PROGRAM.replace("exact", "ternary")))
+
+    def test_constants_are_kept(self):
+        self.assertNotEqual(canonicalize(PROGRAM), canonicalize(PROGRAM.replace("size = 16", "size = 32")))
+
+    def test_structure_is_kept(self):
+        twice = PROGRAM.replace("apply { t.apply(); }", "apply { t.apply(); t.apply(); }")
+        self.assertNotEqual(canonicalize(PROGRAM), canonicalize(twice))
+
+    def test_canonical_hash(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for name, source in [["a.p4", PROGRAM], ["b.p4", RENAMED]]:
+                paths.append(os.path.join(tmp, name))
+                with open(paths[-1], "w") as f:
+                    f.write(source)
+            self.assertEqual(canonical_hash(paths[0]), canonical_hash(paths[1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
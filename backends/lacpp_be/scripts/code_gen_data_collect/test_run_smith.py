@@ -0,0 +1,262 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from functools import partial
+
+from run_smith import BUILD_LOGS_MARKER, FAILED_LOGS_DIR, compile_smith_program, generate_smith_program, \
+    regenerate_program, run_monitored, run_p4c_build_logs, run_smith_pipeline, shard_folder
+from smith_manifest import RunManifest, STATUS_DUPLICATE, STATUS_FAILED, STATUS_GEN_FAILED, STATUS_REMOVED, \
+    STATUS_SUCCESS
+from test_smith_farm import write_script
+
+# End-to-end runs of the generate -> compile pipeline with stand-in p4smith and
+# p4c-barefoot scripts. The outcome of the first seeds is fixed, the later ones all
+# produce distinct programs that compile:
+#   seed 0: compile error, then the compiler and a child of it hang (early abort)
+#   seed 1: p4smith fails
+#   seed 2, 4, 5: compile
+#   seed 3: same program as seed 2, up to names
+
+FAKE_SMITH = """#!{python}
+import sys
+seed = int(sys.argv[sys.argv.index("--seed") + 1])
+if seed == 1:
+    sys.exit(1)
+size = {{0: 4, 2: 1, 3: 1, 4: 2, 5: 3}}.get(seed, 100 + seed)
+name = "t" if seed != 3 else "other"
+with open(sys.argv[5], "w") as f:
+    f.write("control c(inout bit<8> m) {{ table %s {{ key = {{ m : exact; }} size = %d; }} apply {{ %s.apply(); }} }}\\n"
+            % (name, size, name))
+"""
+
+FAKE_BAREFOOT = """#!{python}
+import os, subprocess, sys, time
+with open("smith.p4") as f:
+    source = f.read()
+if "size = 4;" in source:
+    child = subprocess.Popen(["sleep", "60"])
+    with open({pids!r}, "a") as f:
+        f.write(f"{{os.getpid()}} {{child.pid}}\\n")
+    print("smith.p4(1): [--Werror=type-error] error: bad program", flush=True)
+    time.sleep(60)
+time.sleep(0.2)
+os.makedirs("smith.tofino/pipe/logs", exist_ok=True)
+with open("smith.tofino/pipe/logs/resources.json", "w") as f:
+    f.write('{{"resources": {{"mau": {{"mau_stages": [0, 1]}}}}}}')
+with open("opt.p4", "w") as f:
+    f.write(source)
+print("0 errors, 0 warnings")
+"""
+
+FAKE_BUILD_LOGS = """#!{python}
+import os, sys
+if os.path.exists("FAIL"):
+    sys.exit(1)
+with open("metrics.json", "w") as f:
+    f.write("{{}}")
+"""
+
+COMPILE_ERROR = "smith.p4(1): [--Werror=type-error] error: bad program"
+
+
+def alive(pid, wait=5):
+    """Whether pid is still running (not a zombie) after up to wait seconds, a SIGKILL lands asynchronously."""
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                if f.read().rsplit(")", 1)[1].split()[0] == "Z":
+                    return False
+        except OSError:
+            return False
+        if time.monotonic() > deadline:
+            return True
+        time.sleep(0.05)
+
+
+def compile_or_crash(folder_name, **kwargs):
+    """compile_smith_program, raising for the program of seed 0."""
+    with open(os.path.join(folder_name, "smith.p4")) as f:
+        if "size = 4;" in f.read():
+            raise RuntimeError("compile worker crashed")
+    return compile_smith_program(folder_name, **kwargs)
+
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        # the output folders and FAILED_LOGS_DIR are relative to the current directory
+        os.chdir(self.tmp.name)
+        self.pids = os.path.join(self.tmp.name, "pids")
+        tools = os.path.join(self.tmp.name, "tools")
+        os.makedirs(tools)
+        self.smith = write_script(os.path.join(tools, "p4smith"), FAKE_SMITH)
+        self.barefoot = os.path.join(tools, "p4c-barefoot")
+        with open(self.barefoot, "w") as f:
+            f.write(FAKE_BAREFOOT.format(python=sys.executable, pids=self.pids))
+        os.chmod(self.barefoot, 0o755)
+        self.scratch = os.path.join(self.tmp.name, "scratch")
+        os.makedirs(self.scratch)
+        self.manifest = RunManifest(os.path.join(self.tmp.name, "smith_manifest.db"))
+
+    def tearDown(self):
+        self.manifest.close()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def run_pipeline(self, num_repetitions, compile_task=compile_smith_program, base_seed=0):
+        generate_task = partial(generate_smith_program, smith_executable=self.smith, scratch_dir=self.scratch)
+        compile_task = partial(compile_task, p4c_barefoot=self.barefoot, keep_failed_logs="all",
+                               output_dir=self.tmp.name)
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_smith_pipeline(num_repetitions, generate_task, compile_task, 2, 1, 2, self.manifest, base_seed)
+
+    def test_pipeline(self):
+        start = time.monotonic()
+        self.run_pipeline(3)
+        # the hanging compiler was killed on its error line, long before the compile timeout
+        self.assertLess(time.monotonic() - start, 20)
+        with open(self.pids) as f:
+            for pid in f.read().split():
+                self.assertFalse(alive(int(pid)))
+
+        rows = {seed: self.manifest.attempt_by_seed(seed) for seed in range(6)}
+        self.assertEqual({seed: row["status"] for seed, row in rows.items()},
+                         {0: STATUS_FAILED, 1: STATUS_GEN_FAILED, 2: STATUS_SUCCESS, 3: STATUS_DUPLICATE,
+                          4: STATUS_SUCCESS, 5: STATUS_SUCCESS})
+        self.assertEqual(rows[0]["error"], "type-error")
+        self.assertFalse(os.path.exists(self.manifest.abspath(rows[0]["folder"])))
+        [failed_log] = os.listdir(FAILED_LOGS_DIR)
+        self.assertTrue(failed_log.endswith(".type-error.log"))
+        with open(os.path.join(FAILED_LOGS_DIR, failed_log)) as f:
+            self.assertIn(COMPILE_ERROR, f.read())
+        self.assertIsNone(rows[3]["folder"])
+        self.assertEqual(rows[3]["canon_hash"], rows[2]["canon_hash"])
+        for seed in (2, 4, 5):
+            folder = self.manifest.abspath(rows[seed]["folder"])
+            self.assertEqual(folder, shard_folder(self.tmp.name, os.path.basename(folder)))
+            self.assertTrue(os.path.exists(os.path.join(folder, "smith.p4")))
+            self.assertTrue(os.path.exists(os.path.join(folder, "smith.tofino/pipe/logs/resources.json")))
+        # later seeds were compiled, or dropped when the run stopped
+        for row in self.manifest.attempts():
+            if row["seed"] > 5:
+                self.assertIn(row["status"], (STATUS_SUCCESS, STATUS_REMOVED))
+        self.assertEqual(os.listdir(self.scratch), [])
+
+        # a rerun continues after the recorded seeds
+        max_seed = self.manifest.max_seed()
+        successes = self.manifest.count(STATUS_SUCCESS)
+        self.run_pipeline(successes + 1, base_seed=None)
+        self.assertGreaterEqual(self.manifest.count(STATUS_SUCCESS), successes + 1)
+        self.assertEqual(self.manifest.attempt_by_seed(max_seed + 1)["status"], STATUS_SUCCESS)
+        self.assertEqual(os.listdir(self.scratch), [])
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            regenerate_program(2, self.smith, self.manifest)
+        self.assertIn("Program matches the recorded canonical hash.", out.getvalue())
+
+    def test_crashed_compile_task(self):
+        self.run_pipeline(3, compile_or_crash)
+        row = self.manifest.attempt_by_seed(0)
+        self.assertEqual(row["status"], STATUS_FAILED)
+        self.assertEqual(row["error"], "compile worker crashed")
+        self.assertFalse(os.path.exists(self.manifest.abspath(row["folder"])))
+        self.assertEqual(os.listdir(self.scratch), [])
+
+
+class RunMonitoredTest(unittest.TestCase):
+
+    def run_python(self, code, timeout=30):
+        with tempfile.TemporaryDirectory() as tmp:
+            return run_monitored([sys.executable, "-c", code], tmp, timeout)
+
+    def test_early_abort_kills_process_group(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pid_file = os.path.join(tmp, "child")
+            code = (f"import subprocess, time\n"
+                    f"child = subprocess.Popen(['sleep', '60'])\n"
+                    f"open({pid_file!r}, 'w').write(str(child.pid))\n"
+                    f"print({COMPILE_ERROR!r}, flush=True)\n"
+                    f"time.sleep(60)\n")
+            start = time.monotonic()
+            [success, error_class, lines, _, _] = self.run_python(code)
+            self.assertLess(time.monotonic() - start, 10)
+            self.assertFalse(success)
+            self.assertEqual(error_class, "type-error")
+            self.assertEqual(lines, [COMPILE_ERROR + "\n"])
+            with open(pid_file) as f:
+                self.assertFalse(alive(int(f.read())))
+
+    def test_compiler_bug(self):
+        [success, error_class, _, _, _] = self.run_python("print('Compiler Bug: oops')")
+        self.assertEqual([success, error_class], [False, "compiler-bug"])
+
+    def test_timeout(self):
+        [success, error_class, _, _, _] = self.run_python("import time; time.sleep(60)", timeout=0.5)
+        self.assertEqual([success, error_class], [False, "timeout"])
+
+    def test_no_summary(self):
+        [success, error_class, _, _, _] = self.run_python("print('done')")
+        self.assertEqual([success, error_class], [False, "no-summary"])
+
+    def test_success(self):
+        [success, error_class, _, max_rss, usage] = self.run_python("print('0 errors, 0 warnings')")
+        self.assertEqual([success, error_class], [True, None])
+        self.assertGreater(max_rss, 0)
+        self.assertIn("cpu", usage)
+
+
+class BuildLogsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.build_logs = write_script(os.path.join(self.tmp.name, "p4c-build-logs"), FAKE_BUILD_LOGS)
+        self.root = os.path.join(self.tmp.name, "runs")
+        self.pipes = {}
+        for name in ("ok", "failing"):
+            folder = os.path.join(self.root, name)
+            self.pipes[name] = os.path.join(folder, "smith.tofino", "pipe")
+            os.makedirs(os.path.join(self.pipes[name], "logs"))
+            for path in (os.path.join(folder, "opt.p4"), os.path.join(self.pipes[name], "context.json")):
+                with open(path, "w") as f:
+                    f.write("{}")
+        open(os.path.join(self.pipes["failing"], "FAIL"), "w").close()
+        self.results = os.path.join(self.tmp.name, "results.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_build_logs(self):
+        """Runs run_p4c_build_logs, returns {program folder: status}."""
+        if os.path.exists(self.results):
+            os.remove(self.results)
+        run_p4c_build_logs(self.build_logs, 2, self.root, results_file=self.results)
+        with open(self.results) as f:
+            results = [json.loads(line) for line in f]
+        return {os.path.basename(os.path.dirname(result["p4_file"])): result["status"] for result in results}
+
+    def test_marker(self):
+        statuses = self.run_build_logs()
+        self.assertEqual(statuses["ok"], "success")
+        self.assertTrue(statuses["failing"].startswith("unexpected error"))
+        self.assertTrue(os.path.exists(os.path.join(self.pipes["ok"], BUILD_LOGS_MARKER)))
+        self.assertFalse(os.path.exists(os.path.join(self.pipes["failing"], BUILD_LOGS_MARKER)))
+        self.assertEqual(os.readlink(os.path.join(self.pipes["ok"], "phv.json")), os.path.join("logs", "phv.json"))
+        # done programs are skipped, failed ones retried
+        self.assertEqual(list(self.run_build_logs()), ["failing"])
+        # a new compilation invalidates the marker
+        context = os.path.join(self.pipes["ok"], "context.json")
+        os.utime(context, (time.time() + 10, time.time() + 10))
+        self.assertEqual(sorted(self.run_build_logs()), ["failing", "ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import os
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+from dag_sweep import DagSweep
+from smith_farm import Coordinator, pack_artifacts, run_coordinator, worker_loop
+from smith_manifest import RunManifest, STATUS_DUPLICATE, STATUS_FAILED, STATUS_SUCCESS
+
+# Local tests of the smith_farm coordinator: the protocol is driven through
+# Coordinator.handle, and one run goes over TCP with worker threads and stand-in
+# p4smith and p4c-barefoot scripts.
+
+FAKE_SMITH = """#!{python}
+import sys
+seed = int(sys.argv[sys.argv.index("--seed") + 1])
+# three distinct programs, so that later seeds produce duplicates
+with open(sys.argv[5], "w") as f:
+    f.write("control c(inout bit<8> m) {{ table t {{ key = {{ m : exact; }} size = %d; }} apply {{ t.apply(); }} }}\\n"
+            % (seed % 3))
+"""
+
+FAKE_BAREFOOT = """#!{python}
+import os
+os.makedirs("smith.tofino/pipe/logs", exist_ok=True)
+with open("smith.tofino/pipe/logs/resources.json", "w") as f:
+    f.write('{{"resources": {{"mau": {{"mau_stages": [0, 1]}}}}}}')
+print("0 errors, 0 warnings")
+"""
+
+
+def write_script(path, template):
+    with open(path, "w") as f:
+        f.write(template.format(python=sys.executable))
+    os.chmod(path, 0o755)
+    return path
+
+
+class CoordinatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manifest = RunManifest(os.path.join(self.tmp.name, "smith_manifest.db"))
+        self.coordinator = Coordinator(self.manifest, 2, DagSweep([8], [0.6]), "labels", 60, self.tmp.name,
+                                       base_seed=100)
+
+    def tearDown(self):
+        self.manifest.close()
+        self.tmp.cleanup()
+
+    def lease(self, worker):
+        return self.coordinator.handle({"op": "lease", "worker": worker})["job"]
+
+    def claim(self, worker, job, canon_hash):
+        reply = self.coordinator.handle({"op": "claim", "worker": worker, "seed": job["seed"],
+                                         "canon_hash": canon_hash})
+        return reply["duplicate"]
+
+    def send_result(self, worker, job, status, canon_hash):
+        result = {"status": status, "gen_time": 0.1, "compile_time": 1.0, "canon_hash": canon_hash}
+        artifacts = None
+        if status == STATUS_SUCCESS:
+            folder = os.path.join(self.tmp.name, "scratch", f"smith_run_{job['seed']}_{worker}")
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, "smith.p4"), "w") as f:
+                f.write("control c() { apply { } }\n")
+            result["folder"] = os.path.basename(folder)
+            artifacts = pack_artifacts(folder)
+        return self.coordinator.handle({"op": "result", "worker": worker, "job": job, "result": result,
+                                        "artifacts": artifacts})
+
+    def expire(self, job):
+        self.coordinator.leases[job["seed"]][2] = 0
+        self.coordinator.expire_leases()
+
+    def test_expired_lease_is_requeued_and_compiled(self):
+        job = self.lease("w1")
+        self.assertFalse(self.claim("w1", job, "h1"))
+        self.expire(job)
+        self.assertNotIn(job["seed"], self.coordinator.leases)
+        retry = self.lease("w2")
+        self.assertEqual(retry, job)
+        # the retry generates the same program, which must not count as a duplicate
+        self.assertFalse(self.claim("w2", retry, "h1"))
+        self.send_result("w2", retry, STATUS_SUCCESS, "h1")
+        self.assertEqual(self.coordinator.successes, 1)
+        self.assertEqual(self.manifest.attempt_by_seed(job["seed"])["status"], STATUS_SUCCESS)
+
+    def test_duplicate_claim(self):
+        first = self.lease("w1")
+        second = self.lease("w2")
+        self.assertNotEqual(first["seed"], second["seed"])
+        self.assertFalse(self.claim("w1", first, "h1"))
+        self.assertTrue(self.claim("w2", second, "h1"))
+        # claiming again from the same seed is not a duplicate
+        self.assertFalse(self.claim("w1", first, "h1"))
+        self.send_result("w2", second, STATUS_DUPLICATE, "h1")
+        self.send_result("w1", first, STATUS_SUCCESS, "h1")
+        third = self.lease("w2")
+        self.assertTrue(self.claim("w2", third, "h1"))
+
+    def test_failed_result_releases_claim(self):
+        first = self.lease("w1")
+        self.assertFalse(self.claim("w1", first, "h1"))
+        self.send_result("w1", first, STATUS_FAILED, "h1")
+        second = self.lease("w1")
+        self.assertFalse(self.claim("w1", second, "h1"))
+
+    def test_late_result(self):
+        job = self.lease("w1")
+        self.claim("w1", job, "h1")
+        self.expire(job)
+        retry = self.lease("w2")
+        self.claim("w2", retry, "h1")
+        self.send_result("w2", retry, STATUS_SUCCESS, "h1")
+        # the first worker was only slow, its result comes in after the retry's
+        self.assertEqual(self.send_result("w1", job, STATUS_SUCCESS, "h1"), {"ok": True})
+        self.assertEqual(self.coordinator.successes, 1)
+        self.assertEqual(self.manifest.count(STATUS_SUCCESS), 1)
+        self.assertEqual(self.coordinator.leases, {})
+        self.assertEqual(len(self.coordinator.requeued), 0)
+
+
+class FarmTest(unittest.TestCase):
+
+    def test_local_run(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            smith = write_script(os.path.join(tmp, "p4smith"), FAKE_SMITH)
+            barefoot = write_script(os.path.join(tmp, "p4c-barefoot"), FAKE_BAREFOOT)
+            scratch = os.path.join(tmp, "scratch")
+            os.makedirs(scratch)
+            with socket.socket() as sock:
+                sock.bind(("localhost", 0))
+                port = sock.getsockname()[1]
+            manifest_path = os.path.join(tmp, "smith_manifest.db")
+
+            def serve():
+                # the manifest is only usable from the thread that opened it
+                manifest = RunManifest(manifest_path)
+                run_coordinator(Coordinator(manifest, 3, DagSweep([8], [0.6]), "full", 60, tmp, base_seed=0),
+                                "localhost", port)
+                manifest.close()
+
+            server = threading.Thread(target=serve)
+            server.start()
+            # workers keep asking for jobs after the coordinator is done, hence daemon threads
+            for _ in range(2):
+                threading.Thread(target=worker_loop, daemon=True,
+                                 args=(("localhost", port), smith, barefoot, "", scratch, "none", None)).start()
+            server.join(timeout=120)
+            self.assertFalse(server.is_alive())
+            manifest = RunManifest(manifest_path)
+            self.assertEqual(manifest.count(STATUS_SUCCESS), 3)
+            hashes = manifest.canon_hashes([STATUS_SUCCESS])
+            self.assertEqual(len(hashes), 3)
+            for folder in manifest.folders(STATUS_SUCCESS):
+                self.assertTrue(os.path.exists(os.path.join(manifest.abspath(folder), "smith.p4")))
+            manifest.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from packed_dataset import MEANS_STDS, STATS_FILES
+
+# Duplicate and train/validation leakage detection for the JSON graph datasets written
+# by feature_label_extract.py.
+#
+# Every sample gets a Weisfeiler-Lehman hash of its dependency graph: nodes start with
+# their raw node_attr as label and, for WL_ITERATIONS rounds, are relabelled with the
+# labels of their successors and predecessors and the edge_attr of the edges to them.
+# The graph hash covers the label multisets of every round, so isomorphic graphs with
+# the same features always hash alike (WL cannot tell some non-isomorphic graphs apart,
+# which the datasets' small, irregular table graphs practically never are). Labels y
+# are not hashed: duplicates with different labels are reported as label conflicts.
+
+WL_ITERATIONS = 3
+
+
+def _digest(*parts):
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def wl_hash(node_attr, edge_index, edge_attr, iterations=WL_ITERATIONS):
+    """Weisfeiler-Lehman hash of a directed graph with node and edge labels."""
+    labels = [_digest(tuple(attr)) for attr in node_attr]
+    successors = [[] for _ in labels]
+    predecessors = [[] for _ in labels]
+    for src, dst, attr in zip(edge_index[0], edge_index[1], edge_attr):
+        successors[src].append([attr, dst])
+        predecessors[dst].append([attr, src])
+    rounds = [sorted(labels)]
+    for _ in range(iterations):
+        labels = [_digest(labels[node],
+                          sorted((attr, labels[dst]) for attr, dst in successors[node]),
+                          sorted((attr, labels[src]) for attr, src in predecessors[node]))
+                  for node in range(len(labels))]
+        rounds.append(sorted(labels))
+    return _digest(len(node_attr), len(edge_attr), rounds)
+
+
+def hash_sample(path):
+    """Returns [path, graph hash, y] of a dataset record, the hash being None if it has no features."""
+    with open(path, "r") as f:
+        record = json.load(f)
+    if not record.get("node_attr"):
+        return [path, None, None]
+    return [path, wl_hash(record["node_attr"], record["edge_index"], record["edge_attr"]), record.get("y")]
+
+
+def dataset_parts(folder):
+    """Returns [part name, files] per part-* folder of the dataset, or of the whole folder if it has none."""
+    folder = Path(folder)
+    parts = sorted(p for p in folder.iterdir() if p.is_dir() and p.name.startswith("part-"))
+    if not parts:
+        parts = [folder]
+    return [[part.name, sorted(str(file) for file in part.rglob("*.json") if file.name not in STATS_FILES)]
+            for part in parts]
+
+
+def find_duplicates(folder, num_workers=4):
+    """
+    Hashes every sample of the dataset in parallel. Returns the duplicate clusters, each a
+    dict with the hash, its members as [part, path] (sorted by part, then path), the parts
+    it spans and whether the members disagree on y; and the number of hashed samples.
+    """
+    part_of = {}
+    files = []
+    for part, part_files in dataset_parts(folder):
+        for file in part_files:
+            part_of[file] = part
+            files.append(file)
+    clusters = {}
+    labels = {}
+    hashed = 0
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for path, graph_hash, y in executor.map(hash_sample, files, chunksize=64):
+            if graph_hash is None:
+                continue
+            hashed += 1
+            clusters.setdefault(graph_hash, []).append([part_of[path], path])
+            labels.setdefault(graph_hash, set()).add(json.dumps(y))
+    duplicates = []
+    for graph_hash, members in clusters.items():
+        if len(members) < 2:
+            continue
+        members.sort()
+        duplicates.append({
+            "hash": graph_hash,
+            "members": members,
+            "parts": sorted({part for part, _ in members}),
+            "label_conflict": len(labels[graph_hash]) > 1,
+        })
+    duplicates.sort(key=lambda cluster: cluster["members"][0])
+    return [duplicates, hashed]
+
+
+def norm_stats(files, scaling="zscore"):
+    """
+    The means_stds.json content of the records in files, as dataset_stats.py merge writes
+    it: per column the population mean and standard deviation, or with robust scaling the
+    median and interquartile range, a spread of 0 being replaced by 1.
+    """
+    nodes = []
+    labels = []
+    for file in files:
+        with open(file, "r") as f:
+            record = json.load(f)
+        if record.get("node_attr"):
+            nodes.extend(record["node_attr"])
+            labels.append(record["y"])
+    if not labels:
+        return None
+
+    def center_spread(rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        if scaling == "robust":
+            center = np.quantile(rows, 0.5, axis=0)
+            spread = np.quantile(rows, 0.75, axis=0) - np.quantile(rows, 0.25, axis=0)
+        else:
+            center = rows.mean(axis=0)
+            spread = rows.std(axis=0)
+        spread[~(spread > 0)] = 1.0
+        return [center.tolist(), spread.tolist()]
+
+    [node_mean, node_std] = center_spread(nodes)
+    [label_mean, label_std] = center_spread(labels)
+    return {"node_mean": node_mean, "node_std": node_std, "label_mean": label_mean, "label_std": label_std,
+            "node_count": len(nodes), "graph_count": len(labels), "scaling": scaling}
+
+
+def write_deduplicated(folder, output_dir, duplicates):
+    """
+    Copies the dataset to output_dir without the duplicates: of every cluster only the
+    first member (lowest part, then path) is kept, so a sample leaking from a training
+    part into a later validation part stays in training. means_stds.json is recomputed
+    over the kept samples, with the scaling of the original one. Returns the number of
+    copied samples.
+    """
+    folder = Path(folder)
+    dropped = {path for cluster in duplicates for _, path in cluster["members"][1:]}
+    kept = []
+    for _, files in dataset_parts(folder):
+        for file in files:
+            if file in dropped:
+                continue
+            target = Path(output_dir) / Path(file).relative_to(folder)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(file, target)
+            kept.append(target)
+    scaling = "zscore"
+    if (folder / MEANS_STDS).exists():
+        with open(folder / MEANS_STDS, "r") as f:
+            scaling = json.load(f).get("scaling", scaling)
+    stats = norm_stats(kept, scaling)
+    if stats is not None:
+        with open(Path(output_dir) / MEANS_STDS, "w") as f:
+            json.dump(stats, f, indent=2)
+    return len(kept)
+
+
+def print_report(duplicates, hashed):
+    redundant = sum(len(cluster["members"]) - 1 for cluster in duplicates)
+    print(f"{hashed} samples, {len(duplicates)} duplicate clusters, {redundant} redundant samples "
+          f"({redundant / max(hashed, 1) * 100:.2f}%)")
+    conflicts = sum(cluster["label_conflict"] for cluster in duplicates)
+    if conflicts:
+        print(f"{conflicts} clusters have members with different labels y")
+    # pairs of parts sharing a graph, e.g. a training part and the validation part
+    leaks = {}
+    for cluster in duplicates:
+        for i, first in enumerate(cluster["parts"]):
+            for second in cluster["parts"][i + 1:]:
+                leaks[(first, second)] = leaks.get((first, second), 0) + 1
+    for (first, second), count in sorted(leaks.items()):
+        print(f"  {count} graphs in both {first} and {second}")
+    if not leaks:
+        print("No graph is shared between parts.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find duplicate graphs in a JSON dataset and graphs shared by its parts.")
+    parser.add_argument("dataset", type=str, help="JSON dataset folder (with part-* folders and means_stds.json).")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Number of worker processes.")
+    parser.add_argument("--report", type=str, default="", help="Write the duplicate clusters to this JSON file.")
+    parser.add_argument("-o", "--output", type=str, default="",
+                        help="Write a deduplicated copy of the dataset to this folder.")
+    args = parser.parse_args()
+
+    [duplicates, hashed] = find_duplicates(args.dataset, args.workers)
+    print_report(duplicates, hashed)
+    if args.report != "":
+        with open(args.report, "w") as f:
+            json.dump({"samples": hashed, "clusters": duplicates}, f, indent=2)
+    if args.output != "":
+        os.makedirs(args.output, exist_ok=True)
+        copied = write_deduplicated(args.dataset, args.output, duplicates)
+        print(f"Wrote {copied} samples to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,11 @@ import torch.nn as nn
 from torch_geometric.nn import NNConv, global_mean_pool
 import argparse
 from train import NNConvPerformanceModel
+from packed_dataset import MEANS_STDS, PackedGraphs, STATS_FILES
 
 # === Config ===
 MODEL_PATH = "./4k_b32_hid32_lr5_best_model.pth"
-DATASET_PATH = "./4k_dataset/part-1"
+DATASET_PATH = "./4k_dataset/part-1"  # a folder of JSON records or a packed part-*.npz
 USE_GPU = True
 SAVE_RESULTS = False  # Save predictions per file
 NORMALIZATION_STATS = "./4k_dataset/means_stds.json"  # optional
@@ -25,8 +26,10 @@ if os.path.exists(NORMALIZATION_STATS):
         norm_stats = json.load(f)
         label_mean = torch.tensor(norm_stats["label_mean"])
         label_std = torch.tensor(norm_stats["label_std"])
+        node_mean = torch.tensor(norm_stats["node_mean"], dtype=torch.float)
+        node_std = torch.tensor(norm_stats["node_std"], dtype=torch.float)
 else:
-    label_mean = label_std = None
+    label_mean = label_std = node_mean = node_std = None
 
 
 # === Load model ===
@@ -56,8 +59,13 @@ def load_graph(file_path):
     with open(file_path) as f:
             js = json.load(f)
 
-    x          = torch.tensor(js["node_attr_normalized"],
-                                    dtype=torch.float)            # [N, F]
+    # records only carry raw node_attr since the dataset is normalized at load time
+    if "node_attr_normalized" in js:
+        x      = torch.tensor(js["node_attr_normalized"], dtype=torch.float)  # [N, F]
+    else:
+        if node_mean is None:
+            raise FileNotFoundError(f"{NORMALIZATION_STATS} is needed to normalize node_attr of {file_path}")
+        x      = (torch.tensor(js["node_attr"], dtype=torch.float) - node_mean) / node_std
     edge_index = torch.tensor(js["edge_index"],
                             dtype=torch.long)             # [2, E]
     edge_attr  = edge_bits_to_tensor(js["edge_attr"])  # [E, B]
@@ -65,6 +73,37 @@ def load_graph(file_path):
                             dtype=torch.float).unsqueeze(0)
     return Data(x=x, edge_index=edge_index, edge_attr=edge_attr, y=y)
 
+def iter_test_graphs():
+    """
+    Yields [file_path, Data, [label_mean, label_std]] for the graphs of DATASET_PATH (a
+    folder or a packed .npz). The label stats de-normalize the model outputs and come from
+    the same source as the node stats: the header of a packed file, NORMALIZATION_STATS
+    for a folder ([None, None] if it is missing).
+    """
+    if DATASET_PATH.endswith(".npz"):
+        # normalize only the node features, labels are compared raw
+        graphs = PackedGraphs(DATASET_PATH, normalize=False)
+        stats = graphs.header["norm_stats"]
+        if stats is None:
+            raise FileNotFoundError(f"{DATASET_PATH} was packed without {MEANS_STDS}, which is needed to "
+                                    f"normalize its node_attr")
+        node_attr = (graphs.node_attr - stats["node_mean"]) / stats["node_std"]
+        label_stats = [torch.tensor(stats["label_mean"]), torch.tensor(stats["label_std"])]
+        for i in range(len(graphs)):
+            [_, edge_index, edge_attr, y] = graphs.graph(i)
+            n0, n1 = graphs.arrays["node_offsets"][i:i + 2]
+            data = Data(x=torch.tensor(node_attr[n0:n1], dtype=torch.float),
+                        edge_index=torch.from_numpy(edge_index).long(),
+                        edge_attr=torch.from_numpy(edge_attr),
+                        y=torch.from_numpy(y).unsqueeze(0))
+            yield [Path(DATASET_PATH).parent / f"{graphs.names[i]}.json", data, label_stats]
+        return
+    for root, _, files in os.walk(DATASET_PATH):
+        for file in files:
+            if file.endswith(".json") and file not in STATS_FILES:
+                file_path = Path(root) / file
+                yield [file_path, load_graph(file_path), [label_mean, label_std]]
+
 def run_test_set():
     # === Inference on all graphs in folder ===
     results = {}
@@ -75,44 +114,41 @@ def run_test_set():
         print(f"Dataset path {DATASET_PATH} does not exist.")
         return
     
-    for root, _, files in os.walk(DATASET_PATH):
-        for file in files:
-            if file.endswith(".json"):
-                file_path = Path(root) / file
-                data = load_graph(file_path)
-                data.batch = torch.zeros(data.num_nodes, dtype=torch.long)  # batch=0 since single graph
-                data = data.to(device)
-
-                with torch.no_grad():
-                    output = model(data)
-
-                if label_mean is not None:
-                    output = output * label_std.to(device) + label_mean.to(device)
-
-                pred = output.cpu().numpy().tolist()
-                true = data.y.cpu().numpy().tolist()
-                print(f"File: {file}, Prediction: {pred}, True: {true}")
-                # check if 0 exists in true values
-                # TODO: check why this could happen, not usual thouhg
-                if any(x == 0 for x in true[0]):
-                    print(f"Warning: True values contain zero in {file}. This may affect MAPE calculation.")
-                    continue
-                # Compute MAE and MAPE per output dimension
-                mae_vec = torch.abs(output - data.y).squeeze().cpu()
-                mape_vec = (torch.abs((output - data.y) / (data.y + 1e-8))).squeeze().cpu() * 100  # avoid division by zero
-
-                print(f"{file} MAE per element: {[f'{x:.4f}' for x in mae_vec.tolist()]}")
-                print(f"{file} MAPE per element: {[f'{x:.2f}%' for x in mape_vec.tolist()]}")
-
-                maes.append(mae_vec)
-                mapes.append(mape_vec)
-
-                results[file] = [pred, true]
-
-                if SAVE_RESULTS:
-                    out_path = file_path.with_suffix('.pred.json')
-                    with open(out_path, "w") as out_file:
-                        json.dump({"prediction": pred}, out_file, indent=2)
+    for file_path, data, [output_mean, output_std] in iter_test_graphs():
+        file = file_path.name
+        data.batch = torch.zeros(data.num_nodes, dtype=torch.long)  # batch=0 since single graph
+        data = data.to(device)
+
+        with torch.no_grad():
+            output = model(data)
+
+        if output_mean is not None:
+            output = output * output_std.to(device) + output_mean.to(device)
+
+        pred = output.cpu().numpy().tolist()
+        true = data.y.cpu().numpy().tolist()
+        print(f"File: {file}, Prediction: {pred}, True: {true}")
+        # check if 0 exists in true values
+        # TODO: check why this could happen, not usual thouhg
+        if any(x == 0 for x in true[0]):
+            print(f"Warning: True values contain zero in {file}. This may affect MAPE calculation.")
+            continue
+        # Compute MAE and MAPE per output dimension
+        mae_vec = torch.abs(output - data.y).squeeze().cpu()
+        mape_vec = (torch.abs((output - data.y) / (data.y + 1e-8))).squeeze().cpu() * 100  # avoid division by zero
+
+        print(f"{file} MAE per element: {[f'{x:.4f}' for x in mae_vec.tolist()]}")
+        print(f"{file} MAPE per element: {[f'{x:.2f}%' for x in mape_vec.tolist()]}")
+
+        maes.append(mae_vec)
+        mapes.append(mape_vec)
+
+        results[file] = [pred, true]
+
+        if SAVE_RESULTS:
+            out_path = file_path.with_suffix('.pred.json')
+            with open(out_path, "w") as out_file:
+                json.dump({"prediction": pred}, out_file, indent=2)
 
     # === Summary ===
     maes_tensor = torch.stack(maes)  # shape: [num_samples, 4]
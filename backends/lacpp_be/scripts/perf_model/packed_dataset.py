@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+# Packed graph dataset: all graphs of a dataset part in one .npz file
+#   node_attr     float32 [N_total, F]   raw node features, graphs back to back
+#   node_offsets  int64   [G + 1]        nodes of graph g: node_attr[node_offsets[g]:node_offsets[g+1]]
+#   edge_index    int32   [2, E_total]   node indices local to the graph
+#   edge_attr     uint8   [E_total]      dependency bitmask (the "101" bit strings of the JSON records)
+#   edge_offsets  int64   [G + 1]
+#   y             float32 [G, L]         raw labels
+#   names         str     [G]            record names (JSON file stems)
+#   header        str                    JSON: format version and the normalization stats
+# Features and labels are stored raw and normalized by the readers with the header stats.
+
+FORMAT_VERSION = 1
+EDGE_BITS = 3
+# the statistics files of a JSON dataset, which are not records; the perf_model scripts
+# take them from here, keep them in sync with code_gen_data_collect/dataset_stats.py
+MEANS_STDS = "means_stds.json"
+SHARD_STATS = "shard_stats.json"
+STATS_FILES = (MEANS_STDS, SHARD_STATS)
+
+
+def edge_bits_to_mask(bits):
+    """'101' -> 5"""
+    return int(bits, 2) if bits else 0
+
+
+def mask_to_edge_bits(masks, width=EDGE_BITS):
+    """Bitmasks [E] -> float32 bit matrix [E, width], most significant bit first."""
+    shifts = np.arange(width - 1, -1, -1, dtype=np.uint8)
+    return ((masks[:, None] >> shifts) & 1).astype(np.float32)
+
+
+def pack_records(records, node_dim=None, label_dim=None):
+    """Packs an iterable of [name, record] (JSON dataset records) into the packed arrays."""
+    names, node_parts, edge_parts, mask_parts, labels = [], [], [], [], []
+    node_offsets, edge_offsets = [0], [0]
+    for name, record in records:
+        node_attr = np.asarray(record.get("node_attr", []), dtype=np.float32)
+        if node_attr.ndim != 2 or len(node_attr) == 0:
+            # the JSON loaders cannot use these either
+            print(f"Skipping {name}: no node features")
+            continue
+        if node_dim is None:
+            node_dim = node_attr.shape[1]
+        edge_index = np.asarray(record["edge_index"], dtype=np.int32).reshape(2, -1)
+        masks = np.array([edge_bits_to_mask(bits) for bits in record["edge_attr"]], dtype=np.uint8)
+        if len(masks) != edge_index.shape[1]:
+            raise ValueError(f"{name}: {edge_index.shape[1]} edges but {len(masks)} edge attributes")
+        names.append(name)
+        node_parts.append(node_attr)
+        edge_parts.append(edge_index)
+        mask_parts.append(masks)
+        labels.append(record["y"])
+        node_offsets.append(node_offsets[-1] + len(node_attr))
+        edge_offsets.append(edge_offsets[-1] + len(masks))
+    label_dim = len(labels[0]) if labels else (label_dim or 0)
+    return {
+        "node_attr": np.concatenate(node_parts) if node_parts else np.zeros((0, node_dim or 0), np.float32),
+        "node_offsets": np.asarray(node_offsets, dtype=np.int64),
+        "edge_index": np.concatenate(edge_parts, axis=1) if edge_parts else np.zeros((2, 0), np.int32),
+        "edge_attr": np.concatenate(mask_parts) if mask_parts else np.zeros(0, np.uint8),
+        "edge_offsets": np.asarray(edge_offsets, dtype=np.int64),
+        "y": np.asarray(labels, dtype=np.float32).reshape(-1, label_dim),
+        "names": np.asarray(names, dtype=str),
+    }
+
+
+def write_packed(path, arrays, norm_stats=None, compress=False):
+    """Writes packed arrays and a header holding norm_stats (the means_stds.json dict) to path."""
+    header = {"version": FORMAT_VERSION, "graphs": len(arrays["names"]), "norm_stats": norm_stats}
+    save = np.savez_compressed if compress else np.savez
+    save(path, header=np.asarray(json.dumps(header)), **arrays)
+
+
+class PackedGraphs:
+    """
+    Reader of a packed dataset file. graph(i) returns the arrays of graph i as views;
+    features and labels are normalized with the header stats when normalize is set.
+    """
+
+    def __init__(self, path, normalize=True):
+        with np.load(path, allow_pickle=False) as packed:
+            self.arrays = {key: packed[key] for key in packed.files}
+        self.header = json.loads(str(self.arrays.pop("header")))
+        if self.header["version"] != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported packed dataset version {self.header['version']}")
+        self.names = self.arrays["names"]
+        self.node_attr = self.arrays["node_attr"]
+        self.y = self.arrays["y"]
+        stats = self.header.get("norm_stats")
+        if normalize:
+            if stats is None:
+                raise ValueError(f"{path} has no normalization stats")
+            self.node_attr = ((self.node_attr - np.asarray(stats["node_mean"], np.float32))
+                              / np.asarray(stats["node_std"], np.float32))
+            self.y = (self.y - np.asarray(stats["label_mean"], np.float32)) / np.asarray(stats["label_std"], np.float32)
+        self.edge_bits = mask_to_edge_bits(self.arrays["edge_attr"])
+
+    def __len__(self):
+        return len(self.names)
+
+    def graph(self, i):
+        """Returns [node_attr, edge_index, edge_attr, y] of graph i."""
+        n0, n1 = self.arrays["node_offsets"][i:i + 2]
+        e0, e1 = self.arrays["edge_offsets"][i:i + 2]
+        return [self.node_attr[n0:n1], self.arrays["edge_index"][:, e0:e1], self.edge_bits[e0:e1], self.y[i]]
+
+
+def iter_json_records(folder):
+    """Yields [name, record] for the JSON records below folder, skipping the STATS_FILES."""
+    for file in sorted(Path(folder).rglob("*.json")):
+        if file.name in STATS_FILES:
+            continue
+        with open(file, "r") as f:
+            yield [file.stem, json.load(f)]
+
+
+def load_norm_stats(folder):
+    path = os.path.join(folder, MEANS_STDS)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def convert_json_dataset(folder, output_dir, compress=False):
+    """
+    Packs a JSON dataset: every part-* folder of `folder` into <output_dir>/part-*.npz,
+    or the whole folder into <output_dir>/<folder name>.npz if it has no parts. The
+    header stats come from <folder>/means_stds.json. Returns the written paths.
+    """
+    norm_stats = load_norm_stats(folder)
+    if norm_stats is None:
+        print(f"Warning: no {MEANS_STDS} in {folder}, the packed files cannot be normalized.")
+    parts = sorted(p for p in Path(folder).iterdir() if p.is_dir() and p.name.startswith("part-"))
+    if not parts:
+        parts = [Path(folder)]
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for part in parts:
+        arrays = pack_records(iter_json_records(part))
+        path = os.path.join(output_dir, f"{part.resolve().name}.npz")
+        write_packed(path, arrays, norm_stats, compress)
+        print(f"Packed {len(arrays['names'])} graphs of {part} into {path}")
+        written.append(path)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a JSON graph dataset into packed .npz files.")
+    parser.add_argument("dataset", type=str, help="JSON dataset folder (with part-* folders and means_stds.json).")
+    parser.add_argument("-o", "--output", type=str, required=True, help="Output folder of the .npz files.")
+    parser.add_argument("--compress", action="store_true", help="Compress the arrays (smaller, slower to load).")
+    args = parser.parse_args()
+    convert_json_dataset(args.dataset, args.output, args.compress)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from dataset_dedup import find_duplicates, wl_hash, write_deduplicated
+from packed_dataset import MEANS_STDS
+
+# a small dependency graph: 0 -> 1 -> 2, 0 -> 2
+NODE_ATTR = [[1.0, 0.0], [2.0, 1.0], [3.0, 0.0]]
+EDGE_INDEX = [[0, 1, 0], [1, 2, 2]]
+EDGE_ATTR = [[1], [0], [2]]
+
+
+def relabel(order):
+    """The graph with node i renamed to order[i] and its edges listed in reverse."""
+    node_attr = [None] * len(NODE_ATTR)
+    for node, attr in enumerate(NODE_ATTR):
+        node_attr[order[node]] = attr
+    edge_index = [[order[src] for src in reversed(EDGE_INDEX[0])], [order[dst] for dst in reversed(EDGE_INDEX[1])]]
+    return [node_attr, edge_index, list(reversed(EDGE_ATTR))]
+
+
+class WLHashTest(unittest.TestCase):
+
+    def test_isomorphic_graphs(self):
+        self.assertEqual(wl_hash(*relabel([2, 0, 1])), wl_hash(NODE_ATTR, EDGE_INDEX, EDGE_ATTR))
+
+    def test_node_features(self):
+        node_attr = [NODE_ATTR[0], [2.0, 2.0], NODE_ATTR[2]]
+        self.assertNotEqual(wl_hash(node_attr, EDGE_INDEX, EDGE_ATTR), wl_hash(NODE_ATTR, EDGE_INDEX, EDGE_ATTR))
+
+    def test_edge_features(self):
+        self.assertNotEqual(wl_hash(NODE_ATTR, EDGE_INDEX, [[1], [0], [3]]),
+                            wl_hash(NODE_ATTR, EDGE_INDEX, EDGE_ATTR))
+
+    def test_edge_direction(self):
+        reversed_edges = [EDGE_INDEX[1], EDGE_INDEX[0]]
+        self.assertNotEqual(wl_hash(NODE_ATTR, reversed_edges, EDGE_ATTR), wl_hash(NODE_ATTR, EDGE_INDEX, EDGE_ATTR))
+
+
+class DeduplicateTest(unittest.TestCase):
+
+    def write_record(self, path, graph, y):
+        [node_attr, edge_index, edge_attr] = graph
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"node_attr": node_attr, "edge_index": edge_index, "edge_attr": edge_attr, "y": y}, f)
+        return path
+
+    def test_leak_across_parts(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dataset = os.path.join(tmp, "dataset")
+            other = [[[5.0, 5.0]], [[], []], []]
+            train = self.write_record(os.path.join(dataset, "part-0", "a.json"),
+                                      [NODE_ATTR, EDGE_INDEX, EDGE_ATTR], [1, 2])
+            self.write_record(os.path.join(dataset, "part-0", "b.json"), other, [3, 4])
+            leaked = self.write_record(os.path.join(dataset, "part-1", "c.json"), relabel([1, 2, 0]), [1, 3])
+            with open(os.path.join(dataset, MEANS_STDS), "w") as f:
+                json.dump({"scaling": "robust"}, f)
+
+            [duplicates, hashed] = find_duplicates(dataset, num_workers=1)
+            self.assertEqual(hashed, 3)
+            self.assertEqual(len(duplicates), 1)
+            self.assertEqual(duplicates[0]["members"], [["part-0", train], ["part-1", leaked]])
+            self.assertEqual(duplicates[0]["parts"], ["part-0", "part-1"])
+            self.assertTrue(duplicates[0]["label_conflict"])
+
+            output = os.path.join(tmp, "deduplicated")
+            self.assertEqual(write_deduplicated(dataset, output, duplicates), 2)
+            self.assertFalse(os.path.exists(os.path.join(output, "part-1", "c.json")))
+            with open(os.path.join(output, MEANS_STDS), "r") as f:
+                stats = json.load(f)
+            self.assertEqual(stats["scaling"], "robust")
+            self.assertEqual(stats["graph_count"], 2)
+            self.assertEqual(stats["node_count"], 4)
+            np.testing.assert_allclose(stats["label_mean"], [2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from packed_dataset import PackedGraphs, pack_records, write_packed
+
+RECORDS = [
+    ["a", {"node_attr": [[1, 2], [3, 4], [5, 6]], "edge_index": [[0, 1], [1, 2]], "edge_attr": ["1", "101"],
+           "y": [10, 20]}],
+    # no edges
+    ["b", {"node_attr": [[7, 8]], "edge_index": [[], []], "edge_attr": [], "y": [30, 40]}],
+    ["no_features", {"node_attr": [], "edge_index": [[], []], "edge_attr": [], "y": [0, 0]}],
+    ["c", {"node_attr": [[0, 1], [2, 3]], "edge_index": [[1], [0]], "edge_attr": ["10"], "y": [50, 60]}],
+]
+
+NORM_STATS = {"node_mean": [1.0, 2.0], "node_std": [2.0, 4.0], "label_mean": [5.0, 10.0], "label_std": [5.0, 2.0]}
+
+
+def json_edge_bits(edge_attr):
+    """The edge features of the JSON loaders: the bit strings left-padded with 0 to 3 bits."""
+    return [[0] * (3 - len(bits)) + [int(b) for b in bits] for bits in edge_attr]
+
+
+class PackedGraphsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "part-0.npz")
+        write_packed(self.path, pack_records(RECORDS), NORM_STATS)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        graphs = PackedGraphs(self.path, normalize=False)
+        records = [record for name, record in RECORDS if name != "no_features"]
+        self.assertEqual(list(graphs.names), ["a", "b", "c"])
+        self.assertEqual(graphs.header["norm_stats"], NORM_STATS)
+        for i, record in enumerate(records):
+            [node_attr, edge_index, edge_attr, y] = graphs.graph(i)
+            np.testing.assert_array_equal(node_attr, record["node_attr"])
+            np.testing.assert_array_equal(edge_index, np.reshape(record["edge_index"], (2, -1)))
+            np.testing.assert_array_equal(edge_attr.reshape(-1, 3), np.reshape(json_edge_bits(record["edge_attr"]),
+                                                                                (-1, 3)))
+            np.testing.assert_array_equal(y, record["y"])
+
+    def test_empty_edges(self):
+        [_, edge_index, edge_attr, _] = PackedGraphs(self.path, normalize=False).graph(1)
+        self.assertEqual(edge_index.shape, (2, 0))
+        self.assertEqual(edge_attr.shape, (0, 3))
+
+    def test_normalize(self):
+        graphs = PackedGraphs(self.path)
+        [node_attr, _, _, y] = graphs.graph(0)
+        np.testing.assert_allclose(node_attr, (np.array(RECORDS[0][1]["node_attr"]) - [1, 2]) / [2, 4])
+        np.testing.assert_allclose(y, (np.array(RECORDS[0][1]["y"]) - [5, 10]) / [5, 2])
+
+    def test_normalize_without_stats(self):
+        write_packed(self.path, pack_records(RECORDS))
+        self.assertIsNone(PackedGraphs(self.path, normalize=False).header["norm_stats"])
+        with self.assertRaises(ValueError):
+            PackedGraphs(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
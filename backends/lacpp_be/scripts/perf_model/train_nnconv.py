@@ -11,6 +11,7 @@ from pathlib import Path
 from time import time
 from tqdm import tqdm
 import matplotlib.pyplot as plt
+from packed_dataset import PackedGraphs, MEANS_STDS, STATS_FILES
 
 USE_GPU = True
 BATCH_SIZES = [32] #[1,2,4,8,16,32,64]
@@ -25,19 +26,34 @@ torch.set_num_threads(torch.get_num_threads())
 device = torch.device("cuda" if USE_GPU and torch.cuda.is_available() else "cpu")
 print(f"Using device: {device}")    
 
+def load_norm_stats(path):
+    """
+    Loads means_stds.json (written by feature_label_extract.py) as tensors, or None if
+    there is none.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        stats = json.load(f)
+    return {key: torch.tensor(stats[key], dtype=torch.float)
+            for key in ("node_mean", "node_std", "label_mean", "label_std")}
+
 class CodeGraphJSONDataset(Dataset):
     """
     • Each *.json file must contain:
-        - node_attr_normalized :  List[List[float]]
+        - node_attr            :  List[List[float]]
         - edge_index           :  List[List[int]]
         - edge_attr            :  List[str]          (bit-strings like "101")
-        - y_normalized         :  List[float]
+        - y                    :  List[float]
+    • node_attr and y are normalized while loading, with <folder_path>/means_stds.json.
+      Records of older datasets carrying node_attr_normalized / y_normalized are used as is.
     """
     def __init__(self, folder_path, dataset_number=0, is_validation=False):
         super().__init__()
         self.folder_path = Path(folder_path)
         self.dataset_number = dataset_number
         self.is_validation = is_validation
+        self.norm_stats = load_norm_stats(self.folder_path / MEANS_STDS)
         self.samples = self._load_samples()
 
     # --------------------------------------------------------------------- #
@@ -58,6 +74,14 @@ class CodeGraphJSONDataset(Dataset):
 
         return torch.tensor(bitmap, dtype=torch.float)
 
+    def _normalized(self, js, key, mean_key, std_key):
+        if f"{key}_normalized" in js:
+            return torch.tensor(js[f"{key}_normalized"], dtype=torch.float)
+        if self.norm_stats is None:
+            raise FileNotFoundError(f"{self.folder_path / MEANS_STDS} is needed to normalize {key}")
+        value = torch.tensor(js[key], dtype=torch.float)
+        return (value - self.norm_stats[mean_key]) / self.norm_stats[std_key]
+
     def _load_samples(self):
         samples = []
         folders = []
@@ -75,16 +99,18 @@ class CodeGraphJSONDataset(Dataset):
             end = self.dataset_number + 1
         for folder in folders[start:end]:
             for file in folder.rglob("*.json"):
+                if file.name in STATS_FILES:
+                    continue
                 with open(file, "r") as f:
                     js = json.load(f)
 
-                x          = torch.tensor(js["node_attr_normalized"],
-                                        dtype=torch.float)            # [N, F]
+                x          = self._normalized(js, "node_attr",
+                                              "node_mean", "node_std")  # [N, F]
                 edge_index = torch.tensor(js["edge_index"],
                                         dtype=torch.long)             # [2, E]
                 edge_attr  = self._edge_bits_to_tensor(js["edge_attr"])  # [E, B]
-                y          = torch.tensor(js["y_normalized"],
-                                        dtype=torch.float).unsqueeze(0)
+                y          = self._normalized(js, "y",
+                                              "label_mean", "label_std").unsqueeze(0)
 
                 samples.append(Data(x=x,
                                     edge_index=edge_index,
@@ -104,6 +130,45 @@ class CodeGraphJSONDataset(Dataset):
         return self.samples[idx]
 
 
+class CodeGraphPackedDataset(Dataset):
+    """
+    Same samples as CodeGraphJSONDataset, read from the part-*.npz files written by
+    packed_dataset.py (normalized with the stats in their header).
+    """
+    def __init__(self, folder_path, dataset_number=0, is_validation=False):
+        super().__init__()
+        self.folder_path = Path(folder_path)
+        self.dataset_number = dataset_number
+        self.is_validation = is_validation
+        self.samples = self._load_samples()
+
+    def _load_samples(self):
+        parts = sorted(self.folder_path.glob("part-*.npz"))
+        print(f"Found {len(parts)} packed parts: {[p.name for p in parts]}")
+        if self.is_validation:
+            start = self.dataset_number + 1
+            end = start + 1
+        else:
+            start = 0
+            end = self.dataset_number + 1
+        samples = []
+        for part in parts[start:end]:
+            graphs = PackedGraphs(part)
+            for i in range(len(graphs)):
+                [x, edge_index, edge_attr, y] = graphs.graph(i)
+                samples.append(Data(x=torch.from_numpy(x),
+                                    edge_index=torch.from_numpy(edge_index).long(),
+                                    edge_attr=torch.from_numpy(edge_attr),
+                                    y=torch.from_numpy(y).unsqueeze(0)))
+        return samples
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        return self.samples[idx]
+
+
 # ------------------------------  NN-based model ------------------------------
 class NNConvPerformanceModel(nn.Module):
     """
@@ -232,8 +297,10 @@ def train_model(model, train_loader, val_loader, batch_size=1):
 # Main
 if __name__ == "__main__":
     folder_path = "./4k_dataset"
-    dataset = CodeGraphJSONDataset(folder_path, DATASET_NUMBER)
-    val_set = CodeGraphJSONDataset(folder_path, DATASET_NUMBER, is_validation=True)
+    # packed parts (packed_dataset.py) load much faster than the JSON records
+    dataset_class = CodeGraphPackedDataset if any(Path(folder_path).glob("part-*.npz")) else CodeGraphJSONDataset
+    dataset = dataset_class(folder_path, DATASET_NUMBER)
+    val_set = dataset_class(folder_path, DATASET_NUMBER, is_validation=True)
     for batch_size in BATCH_SIZES:
         dataloader = GeoDataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=4)
         val_dataloader = GeoDataLoader(val_set, batch_size=batch_size, shuffle=False, num_workers=4)
@@ -246,6 +246,16 @@ BFN_Options::BFN_Options() {
             return true;
         },
         "Generate debug information");
+    registerOption(
+        "--labels-only", nullptr,
+        [this](const char *) {
+            debugInfo = true;
+            labelsOnly = true;
+            return true;
+        },
+        "Generate only the debug information used as performance labels "
+        "(logs/resources.json, logs/phv.json). Implies -g, but skips graphs, "
+        "events.json, frontend-ir.json and source.json");
     registerOption(
         "--create-graphs", nullptr,
         [this](const char *) {
@@ -28,6 +28,7 @@ class BFN_Options : public CompilerOptions {
  public:
     bool allowUnimplemented = false;
     bool debugInfo = false;
+    bool labelsOnly = false;
     bool no_deadcode_elimination = false;
     bool forced_placement = false;
     bool use_clot = true;
@@ -315,6 +315,14 @@ class BarefootBackend(BackendDriver):
             default=False,
             help="Reduce PHV allocation search space for faster compilation.",
         )
+        self._argGroup.add_argument(
+            "--labels-only",
+            action="store_true",
+            default=False,
+            help="Only produce the artifacts used as performance labels: resources.json, "
+            "metrics.json and table_dependency_summary.log. Skips the assembler, graphs, "
+            "the event logger, the BF-RT schema and the other summary logs.",
+        )
         if os.environ['P4C_BUILD_TYPE'] == "DEVELOPER":
             for debugger in ["gdb", "cgdb", "lldb"]:
                 self._argGroup.add_argument(
@@ -515,6 +523,15 @@ class BarefootBackend(BackendDriver):
             opts.verbose = 1
         if opts.debug_info:
             opts.create_graphs = True
+        if opts.labels_only:
+            if opts.debug_info or opts.verbose > 0:
+                self.exitWithError(
+                    "--labels-only cannot be combined with -g, --verbose or --archive"
+                )
+            # the compiler keeps resources.json and phv.json, but none of the other -g outputs
+            self.add_command_option('compiler', '--labels-only')
+            self.runVerifiers = False
+        self.labels_only = opts.labels_only
 
         # Enable the verbose mode if it is passed via the command line
         # the self._verbose variable controls the verbosity mode inside
@@ -707,6 +724,9 @@ class BarefootBackend(BackendDriver):
                 'compiler', '-Tstage_advance:3>{}/stage_adv.log'.format(self._output_directory)
             )
 
+        if opts.labels_only:
+            self.add_command_option('compiler', '--verbose -Ttable_dependency_summary:3')
+
         # re-apply user provided options to override default values
         if os.environ['P4C_BUILD_TYPE'] == "DEVELOPER":
             for option in opts.log_levels:
@@ -733,6 +753,7 @@ class BarefootBackend(BackendDriver):
             opts.bf_rt_schema is None
             and opts.language == 'p4-16'
             and not (self._arch == 'v1model' or self._arch == 'psa' or opts.no_bf_rt_schema)
+            and not opts.labels_only
         ):
             opts.bf_rt_schema = "{}/bfrt.json".format(self._output_directory)
 
@@ -764,7 +785,11 @@ class BarefootBackend(BackendDriver):
         self.add_command_option('p4c-gen-conf', '--p4-version {}'.format(opts.language))
         self.conf_file = self.program_name + ".conf"
 
-        if opts.verbose > 0:
+        if opts.labels_only:
+            # no binary and no runtime configuration, the labels come from the compiler alone
+            self.disable_commands(['assembler', 'p4c-gen-conf'])
+
+        if opts.verbose > 0 or opts.labels_only:
             log_scripts_dir = os.environ['P4C_BIN_DIR']
             top_src_dir = checkEnv()
             if top_src_dir:
@@ -1066,7 +1091,13 @@ class BarefootBackend(BackendDriver):
             self.add_command_option(
                 'summary_logging', "-o {}".format(os.path.join(pipe['pipe_dir'], 'logs'))
             )
-            self.add_command_option('summary_logging', "--disable-phv-json")
+            if self.labels_only:
+                # metrics.json only, from the phv.json written by the compiler
+                self.add_command_option('summary_logging', "--metrics-only")
+                if pipe.get('phv_json', False):
+                    self.add_command_option('summary_logging', "--phv {}".format(pipe['phv_json']))
+            else:
+                self.add_command_option('summary_logging', "--disable-phv-json")
             if pipe.get('power_json', False):
                 self.add_command_option('summary_logging', "-p {}".format(pipe['power_json']))
             manifest_filename = "{}/manifest.json".format(self._output_directory)
@@ -1303,6 +1334,16 @@ class BarefootBackend(BackendDriver):
                 rc += rc_ver
 
                 # TODO: the assembler failed: should we assemble the other pipes? Now we do.
+        elif self.labels_only and run_summary_logs:
+            # no assembler in the labels-only profile: the compiler's skeleton context.json
+            # is all metrics.json needs
+            self.parseManifest()
+            for pipe in self._pipes.values():
+                if pipe.get('context', False) and os.path.exists(pipe['context']):
+                    self.updateManifest(
+                        os.path.join(self._output_directory, 'manifest.json'), False
+                    )
+                    rc += self.runSummaryLogging(pipe)
 
         success = (rc + rc_bfa) == 0
         self.updateManifest(os.path.join(self._output_directory, 'manifest.json'), success)
@@ -50,7 +50,7 @@ Visitor::profile_t BuildPowerGraph::init_apply(const IR::Node *root) {
 }
 
 void BuildPowerGraph::end_apply(const IR::Node *root) {
-    if (options_.debugInfo) {  // graph outputs
+    if (options_.debugInfo && !options_.labelsOnly) {  // graph outputs
         for (gress_t g : Device::allGresses()) {
             SimplePowerGraph *graph = get_graph(g);
             std::string fname = graph->name_ + ".power.dot";
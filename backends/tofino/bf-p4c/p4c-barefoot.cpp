@@ -253,7 +253,8 @@ class GenerateOutputs : public PassManager {
             std::ofstream dynhash(dynHashFile);
             dynhash << _dynhash << std::endl << std::flush;
         }
-        if (_options.debugInfo) {  // Generate graphs only if invoked with -g
+        // Generate graphs only if invoked with -g
+        if (_options.debugInfo && !_options.labelsOnly) {
             std::filesystem::path graphsDir =
                 BFNContext::get().getOutputDirectory("graphs"_cs, _pipeId).string();
             // Output dependency graph json file
@@ -455,7 +456,7 @@ int main(int ac, char **av) {
     Device::init(options.target);
 
     // Initialize EventLogger
-    if (BackendOptions().debugInfo) {
+    if (BackendOptions().debugInfo && !BackendOptions().labelsOnly) {
         // At least skeleton of events.json should be emitted alongside with other JSON files
         // so P4I knows what is the setup of the system.
         // Only enable actual events per user demand
@@ -498,7 +499,8 @@ int main(int ac, char **av) {
 
         // Dump frontend IR for p4i if debug (-g) was selected
         // Or if the --toJson was used
-        if (BackendOptions().debugInfo || !options.dumpJsonFile.empty()) {
+        if ((BackendOptions().debugInfo && !BackendOptions().labelsOnly) ||
+            !options.dumpJsonFile.empty()) {
             // Dump file is either whatever --toJson specifies or a default one for p4i
             std::filesystem::path irFilePath =
                 !options.dumpJsonFile.empty()
@@ -554,7 +556,7 @@ int main(int ac, char **av) {
 
         if (!substitute.getToplevelBlock()) return handle_return(PROGRAM_ERROR, options);
 
-        if (options.debugInfo) {
+        if (options.debugInfo && !options.labelsOnly) {
             program->apply(SourceInfoLogging(BFNContext::get().getOutputDirectory().string(),
                                              "source.json", *midend.sourceInfoLogging));
         }
@@ -569,7 +571,7 @@ int main(int ac, char **av) {
 
         // Register event logger in manifest
         // Also register frontend IR dump
-        if (BackendOptions().debugInfo) {
+        if (BackendOptions().debugInfo && !BackendOptions().labelsOnly) {
             manifest.setEventLog("events.json"_cs);
             manifest.setFrontendIrLog("frontend-ir.json"_cs);
         }
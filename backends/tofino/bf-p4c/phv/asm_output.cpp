@@ -326,7 +326,7 @@ void PhvAsmOutput::emit_gress(std::ostream &out, gress_t gress) const {
         }
     }
 
-    if (BackendOptions().debugInfo) {
+    if (BackendOptions().debugInfo && !BackendOptions().labelsOnly) {
         out << "  " << "context_json:\n";
         // // Collect all fields used on a per container basis with required live
         // // range info for assembly. This info is used by P4i hence only output